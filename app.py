@@ -1,36 +1,763 @@
 import os
 import psycopg2
 import psycopg2.extras  # Essencial para retornar linhas como dicionários
+import psycopg2.extensions
+import psycopg2.errors
 import json
+import re
+import base64
 import csv
+import gzip
 import io
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, render_template, g, Response, redirect, url_for, flash
+import ijson
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+import click
+from flask import Flask, jsonify, request, render_template, g, Response, redirect, url_for, flash, send_file
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 
+import banco_sqlite
+
+# Dependências opcionais: sem elas, o JSON sai pelo módulo json e a compressão fica só em gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # --- Configuração Inicial ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', '564312')
-DATABASE_URL = os.environ.get('DATABASE_URL')  # URL do PostgreSQL no ambiente
+DATABASE_URL = os.environ.get('DATABASE_URL')  # URL do PostgreSQL, ou sqlite:///arquivo.db para o backend embutido
 
 # --- Configuração do Flask-Login ---
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# --- Pool de Conexões ---
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # segundos esperando uma conexão livre
+DB_POOL_CHECK_IDLE = float(os.environ.get('DB_POOL_CHECK_IDLE', 30))  # conexões ociosas há mais tempo são testadas no checkout
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """Pool de conexões thread-safe, com tamanho mínimo/máximo, timeout de checkout, health
+    check das conexões ociosas e estatísticas de uso. Conexões psycopg2, ou banco_sqlite para URLs sqlite:///."""
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0, check_idle=30.0, **connect_kwargs):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError('Tamanho de pool inválido')
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.connect_kwargs = connect_kwargs
+        self._idle = []  # pilha de (conexão, instante em que foi devolvida)
+        self._size = 0   # conexões abertas (ociosas + em uso)
+        self._cond = threading.Condition()
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'timeouts': 0,
+                       'created': 0, 'discarded': 0, 'health_check_failures': 0}
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conectar = banco_sqlite.conectar if banco_sqlite.e_url_sqlite(self.dsn) else psycopg2.connect
+        conn = conectar(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def getconn(self):
+        with self._cond:
+            self._stats['checkouts'] += 1
+            if not self._idle and self._size >= self.maxconn:
+                # Pool esgotado: espera uma devolução até o timeout
+                self._stats['waits'] += 1
+                start = time.monotonic()
+                available = self._cond.wait_for(lambda: self._idle or self._size < self.maxconn, self.timeout)
+                self._stats['wait_time'] += time.monotonic() - start
+                if not available:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'Nenhuma conexão livre após {self.timeout}s')
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                self._size += 1
+                conn = idle_since = None
+        # Conexão e health check ficam fora do lock para não bloquear as outras threads
+        try:
+            if conn is not None:
+                if self._healthy(conn, idle_since):
+                    return conn
+                with self._cond:
+                    self._discard(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Devolve a conexão ao pool, desfazendo qualquer transação deixada aberta."""
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+        with self._cond:
+            if close or conn.closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.maxconn)
+
+# --- Instrumentação SQL e Métricas ---
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'on')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # se definido, /metrics exige "Authorization: Bearer <token>"
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # segundos
+METRICS_TOP_LENTAS = 5  # consultas mais lentas guardadas por endpoint
+
+_requisicao_atual = threading.local()
+
+class DadosRequisicao:
+    __slots__ = ('endpoint', 'inicio', 'consultas', 'tempo_db',
+                 'tempo_json', 'bytes_json', 'tempo_compressao', 'bytes_enviados', 'codificacao')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.tempo_json = 0.0  # serialização das respostas JSON (ProvedorJSON)
+        self.bytes_json = 0
+        self.tempo_compressao = 0.0
+        self.bytes_enviados = None  # corpo após a compressão; None se não foi comprimido
+        self.codificacao = None
+
+class Metricas:
+    """Contadores e histogramas do processo, exportados no formato texto do Prometheus.
+    Como o pool, cada worker do gunicorn tem os seus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requisicoes = {}  # (endpoint, método, status) -> quantidade
+        self._latencias = {}    # (endpoint, método) -> [contagem por bucket..., soma, total]
+        self._sql = {}          # endpoint -> [consultas, segundos, lentas]
+        self._lentas = {}       # endpoint -> [(segundos, sql)] das mais lentas
+        self._json = {}         # endpoint -> [respostas, bytes serializados, bytes enviados, segundos serializando, segundos comprimindo]
+
+    def registrar_requisicao(self, endpoint, metodo, status, duracao, dados):
+        with self._lock:
+            chave = (endpoint, metodo, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            hist = self._latencias.setdefault((endpoint, metodo), [0] * (len(METRICS_BUCKETS) + 2))
+            for i, limite in enumerate(METRICS_BUCKETS):
+                if duracao <= limite:
+                    hist[i] += 1
+            hist[-2] += duracao
+            hist[-1] += 1
+            sql = self._sql.setdefault(endpoint, [0, 0.0, 0])
+            sql[0] += dados.consultas
+            sql[1] += dados.tempo_db
+            if dados.bytes_json:
+                carga = self._json.setdefault(endpoint, [0, 0, 0, 0.0, 0.0])
+                carga[0] += 1
+                carga[1] += dados.bytes_json
+                carga[2] += dados.bytes_json if dados.bytes_enviados is None else dados.bytes_enviados
+                carga[3] += dados.tempo_json
+                carga[4] += dados.tempo_compressao
+
+    def registrar_consulta_lenta(self, endpoint, duracao, consulta):
+        with self._lock:
+            self._sql.setdefault(endpoint, [0, 0.0, 0])[2] += 1
+            lentas = self._lentas.setdefault(endpoint, [])
+            lentas.append((duracao, consulta))
+            lentas.sort(key=lambda item: item[0], reverse=True)
+            del lentas[METRICS_TOP_LENTAS:]
+
+    def resumo_sql(self):
+        with self._lock:
+            return {endpoint: {'consultas': consultas, 'segundos': round(segundos, 4), 'lentas': lentas,
+                               'maisLentas': [{'ms': round(d * 1000, 1), 'sql': sql} for d, sql in self._lentas.get(endpoint, [])]}
+                    for endpoint, (consultas, segundos, lentas) in self._sql.items()}
+
+    def prometheus(self, extras=()):
+        linhas = []
+        with self._lock:
+            linhas += ['# HELP http_requests_total Requisições por rota, método e status.', '# TYPE http_requests_total counter']
+            linhas += [f'http_requests_total{{{_rotulos(endpoint=e, method=m, status=s)}}} {n}' for (e, m, s), n in sorted(self._requisicoes.items())]
+            linhas += ['# HELP http_request_errors_total Respostas 5xx por rota e método.', '# TYPE http_request_errors_total counter']
+            erros = {}
+            for (e, m, s), n in self._requisicoes.items():
+                if s >= 500:
+                    erros[(e, m)] = erros.get((e, m), 0) + n
+            linhas += [f'http_request_errors_total{{{_rotulos(endpoint=e, method=m)}}} {n}' for (e, m), n in sorted(erros.items())]
+            linhas += ['# HELP http_request_duration_seconds Latência por rota e método.', '# TYPE http_request_duration_seconds histogram']
+            for (e, m), hist in sorted(self._latencias.items()):
+                for limite, n in zip(METRICS_BUCKETS, hist):
+                    linhas.append(f'http_request_duration_seconds_bucket{{{_rotulos(endpoint=e, method=m, le=limite)}}} {n}')
+                linhas.append(f'http_request_duration_seconds_bucket{{{_rotulos(endpoint=e, method=m, le="+Inf")}}} {hist[-1]}')
+                linhas.append(f'http_request_duration_seconds_sum{{{_rotulos(endpoint=e, method=m)}}} {hist[-2]:.6f}')
+                linhas.append(f'http_request_duration_seconds_count{{{_rotulos(endpoint=e, method=m)}}} {hist[-1]}')
+            for nome, indice, tipo, ajuda in (('db_queries_total', 0, 'counter', 'Consultas SQL por rota.'),
+                                              ('db_query_duration_seconds_total', 1, 'counter', 'Tempo em consultas SQL por rota.'),
+                                              ('db_slow_queries_total', 2, 'counter', f'Consultas acima de {SLOW_QUERY_MS:g} ms por rota.')):
+                linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+                linhas += [f'{nome}{{{_rotulos(endpoint=e)}}} {valores[indice]:.6g}' for e, valores in sorted(self._sql.items())]
+            for nome, indice, tipo, ajuda in (('http_json_responses_total', 0, 'counter', 'Respostas JSON por rota.'),
+                                              ('http_json_serialized_bytes_total', 1, 'counter', 'Bytes de JSON serializados por rota.'),
+                                              ('http_json_sent_bytes_total', 2, 'counter', 'Bytes de JSON enviados (após a compressão) por rota.'),
+                                              ('http_json_serialization_seconds_total', 3, 'counter', 'Tempo serializando JSON por rota.'),
+                                              ('http_json_compression_seconds_total', 4, 'counter', 'Tempo comprimindo JSON por rota.')):
+                linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+                linhas += [f'{nome}{{{_rotulos(endpoint=e)}}} {valores[indice]:.6g}' for e, valores in sorted(self._json.items())]
+        for nome, tipo, ajuda, valor in extras:
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}', f'{nome} {valor}']
+        return '\n'.join(linhas) + '\n'
+
+def _rotulos(**rotulos):
+    return ','.join('%s="%s"' % (nome, str(valor).replace('\\', '\\\\').replace('"', '\\"')) for nome, valor in rotulos.items())
+
+metricas = Metricas()
+
+def _registrar_consulta(consulta, duracao):
+    dados = getattr(_requisicao_atual, 'dados', None)
+    if dados is not None:
+        dados.consultas += 1
+        dados.tempo_db += duracao
+    if duracao * 1000 >= SLOW_QUERY_MS:
+        endpoint = dados.endpoint if dados is not None else '-'
+        texto = _texto_consulta(consulta)
+        app.logger.warning('Consulta lenta (%.1f ms) em %s: %s', duracao * 1000, endpoint, texto)
+        metricas.registrar_consulta_lenta(endpoint, duracao, texto)
+
+_RE_LITERAL = re.compile(r"'(?:[^']|'')*'|-?\s?\b\d+(?:\.\d+)?\b|\b(?:true|false)\b")
+_RE_TUPLAS = re.compile(r"(\([?, ]*\))(?:\s*,\s*\([?, ]*\))+")
+
+def _texto_consulta(consulta):
+    """SQL em uma linha para log e métricas. Consultas já montadas pelo psycopg2 (bytes, como as
+    de execute_values) têm os literais trocados por ? para não vazar dados."""
+    if isinstance(consulta, bytes):
+        consulta = _RE_TUPLAS.sub(r'\1, ...', _RE_LITERAL.sub('?', consulta.decode('utf-8', 'replace')))
+    return ' '.join(str(consulta).split())[:500]
+
+_cursores_instrumentados = {}
+
+def _cursor_instrumentado(base):
+    """Subclasse de `base` que mede execute/executemany/copy_expert (o SQL registrado é o texto
+    com placeholders, nunca os parâmetros)."""
+    if base not in _cursores_instrumentados:
+        class CursorInstrumentado(base):
+            def execute(self, query, vars=None):
+                inicio = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    _registrar_consulta(query, time.perf_counter() - inicio)
+
+            def executemany(self, query, vars_list):
+                inicio = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    _registrar_consulta(query, time.perf_counter() - inicio)
+
+            def copy_expert(self, sql, file, size=8192):
+                inicio = time.perf_counter()
+                try:
+                    return super().copy_expert(sql, file, size)
+                finally:
+                    _registrar_consulta(sql, time.perf_counter() - inicio)
+        _cursores_instrumentados[base] = CursorInstrumentado
+    return _cursores_instrumentados[base]
+
+class ConexaoInstrumentada(psycopg2.extensions.connection):
+    """Conexão usada pelo pool quando METRICS_ENABLED: todo cursor criado nela é instrumentado."""
+
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = _cursor_instrumentado(kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+if METRICS_ENABLED:
+    # Com as métricas desligadas nada disso é registrado: nem hooks, nem cursores instrumentados
+    @app.before_request
+    def _iniciar_medicao():
+        _requisicao_atual.dados = DadosRequisicao(request.url_rule.rule if request.url_rule else 'sem_rota')
+
+    @app.after_request
+    def _registrar_medicao(response):
+        dados = getattr(_requisicao_atual, 'dados', None)
+        if dados is not None:
+            duracao = time.perf_counter() - dados.inicio
+            metricas.registrar_requisicao(dados.endpoint, request.method, response.status_code, duracao, dados)
+            response.headers.add('Server-Timing', f'db;dur={dados.tempo_db * 1000:.1f};desc="{dados.consultas} consultas"')
+            if dados.bytes_json:
+                response.headers.add('Server-Timing', f'json;dur={dados.tempo_json * 1000:.1f};desc="{dados.bytes_json} bytes"')
+            if dados.codificacao:
+                response.headers.add('Server-Timing', f'compressao;dur={dados.tempo_compressao * 1000:.1f};desc="{dados.codificacao} {dados.bytes_enviados} bytes"')
+            response.headers.add('Server-Timing', f'app;dur={duracao * 1000:.1f}')
+        return response
+
+    @app.teardown_request
+    def _encerrar_medicao(exception):
+        _requisicao_atual.dados = None
+
+# --- Serialização e compressão das respostas JSON ---
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')  # auto (orjson, se instalado) | json
+JSON_COMPRESSION = [c.strip() for c in os.environ.get('JSON_COMPRESSION', 'br,gzip').split(',') if c.strip()]  # vazio desliga
+JSON_COMPRESS_MIN_BYTES = int(os.environ.get('JSON_COMPRESS_MIN_BYTES', 1024))  # respostas menores vão sem compressão
+JSON_GZIP_NIVEL = 6
+JSON_BROTLI_QUALIDADE = 5  # a qualidade padrão (11) é lenta demais para comprimir a cada requisição
+
+_USAR_ORJSON = orjson is not None and JSON_ENCODER != 'json'
+_CODIFICACOES = [c for c in JSON_COMPRESSION if c == 'gzip' or (c == 'br' and brotli is not None)]
+
+def _json_padrao(obj):
+    """Tipos do banco que o json não conhece. NUMERIC vira número (o jsonify padrão mandava string)
+    e datas em ISO 8601, o mesmo formato que o orjson usa nativamente."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f'Objeto do tipo {type(obj).__name__} não é serializável em JSON')
+
+class ProvedorJSON(DefaultJSONProvider):
+    """jsonify do app: JSON compacto em UTF-8, pelo orjson quando instalado, com o tempo e o tamanho
+    de cada serialização somados às métricas da requisição."""
+    default = staticmethod(_json_padrao)
+    ensure_ascii = False
+    sort_keys = False
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        inicio = time.perf_counter()
+        if _USAR_ORJSON:
+            corpo = orjson.dumps(obj, default=_json_padrao, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            corpo = json.dumps(obj, default=_json_padrao, ensure_ascii=False, separators=(',', ':')).encode()
+        dados = getattr(_requisicao_atual, 'dados', None)
+        if dados is not None:
+            dados.tempo_json += time.perf_counter() - inicio
+            dados.bytes_json += len(corpo)
+        return self._app.response_class(corpo, mimetype=self.mimetype)
+
+app.json = ProvedorJSON(app)
+
+def _comprimir(corpo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=JSON_BROTLI_QUALIDADE)
+    return gzip.compress(corpo, compresslevel=JSON_GZIP_NIVEL)
+
+@app.after_request
+def _comprimir_json(response):
+    """Comprime as respostas JSON com br ou gzip, conforme o Accept-Encoding do cliente. Registrado
+    depois de _registrar_medicao para rodar antes dele (o Flask executa os after_request em ordem inversa)."""
+    if (not _CODIFICACOES or response.mimetype != 'application/json' or response.is_streamed or response.direct_passthrough
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    corpo = response.get_data()
+    codificacao = request.accept_encodings.best_match(_CODIFICACOES)
+    if len(corpo) < JSON_COMPRESS_MIN_BYTES or codificacao is None:
+        return response
+    inicio = time.perf_counter()
+    comprimido = _comprimir(corpo, codificacao)
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = codificacao
+    # O mesmo ETag não pode identificar corpos com codificações diferentes: passa a ser fraco
+    etag, fraco = response.get_etag()
+    if etag and not fraco:
+        response.set_etag(etag, weak=True)
+    dados = getattr(_requisicao_atual, 'dados', None)
+    if dados is not None:
+        dados.tempo_compressao += time.perf_counter() - inicio
+        dados.bytes_enviados = len(comprimido)
+        dados.codificacao = codificacao
+    return response
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    # Criado sob demanda para que cada worker do gunicorn tenha o seu próprio pool (após o fork)
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not METRICS_ENABLED:
+                    extras = {}
+                elif banco_sqlite.e_url_sqlite(DATABASE_URL):
+                    extras = {'ao_executar': _registrar_consulta}
+                else:
+                    extras = {'connection_factory': ConexaoInstrumentada}
+                _pool = ConnectionPool(DATABASE_URL, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX,
+                                       timeout=DB_POOL_TIMEOUT, check_idle=DB_POOL_CHECK_IDLE, **extras)
+    return _pool
+
 # --- Conexão com o Banco de Dados ---
+TRANSACOES_PARTICOES_FUTURAS = int(os.environ.get('TRANSACOES_PARTICOES_FUTURAS', 3))  # meses à frente com partição criada
+_particoes_verificadas_em = None
+
+def garantir_particoes(db):
+    """Cria as partições de transacoes do mês corrente e dos próximos meses. Roda uma vez por dia
+    em cada processo; a função no banco é idempotente e serializada por advisory lock."""
+    global _particoes_verificadas_em
+    hoje = datetime.now().date()
+    if _particoes_verificadas_em == hoje or e_sqlite(db):
+        return
+    try:
+        with db:
+            with db.cursor() as cursor:
+                cursor.execute("SELECT criar_particoes_transacoes(%s)", (TRANSACOES_PARTICOES_FUTURAS,))
+                criadas = cursor.fetchone()[0]
+    except psycopg2.errors.UndefinedFunction:
+        # Banco ainda sem a migração 007 (o próprio db-migrate passa por aqui)
+        app.logger.warning('transacoes não particionada; rode `flask --app app db-migrate`')
+        _particoes_verificadas_em = hoje
+        return
+    if criadas:
+        app.logger.info('%s partição(ões) de transacoes criada(s)', criadas)
+    _particoes_verificadas_em = hoje
+
+def e_sqlite(db_ou_cursor):
+    """Se a conexão (ou cursor) é do backend SQLite, para os trechos com SQL específico de cada dialeto."""
+    return isinstance(db_ou_cursor, (banco_sqlite.Conexao, banco_sqlite.Cursor))
+
+def execute_values(cursor, sql, argslist, template=None, page_size=100, fetch=False):
+    """psycopg2.extras.execute_values nos dois backends."""
+    if e_sqlite(cursor):
+        return cursor.execute_values(sql, argslist, template=template, page_size=page_size, fetch=fetch)
+    return psycopg2.extras.execute_values(cursor, sql, argslist, template=template, page_size=page_size, fetch=fetch)
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = psycopg2.connect(DATABASE_URL)
+        db = g._database = get_pool().getconn()
+        garantir_particoes(db)
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(error):
+    return jsonify({'error': 'Servidor ocupado, tente novamente em instantes'}), 503
+
+# --- Migrações ---
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+SCHEMA_SQLITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_sqlite.sql')
+
+TABELAS_SQLITE_LEGADO = ('usuarios', 'contas', 'transacoes')  # layout do gestao_apostas.db, anterior ao schema_migrations
+
+def _migrar_sqlite_legado(db):
+    """Converte um arquivo SQLite do layout antigo para o schema_sqlite.sql, em uma única transação.
+    As tabelas antigas são renomeadas para legado_*, o schema é criado e os dados de cada usuário
+    entram pelo mesmo caminho do /api/restore (operações, apostas e resumo são reconstruídos)."""
+    with open(SCHEMA_SQLITE, encoding='utf-8') as f:
+        schema = f.read()
+    renomear = ''.join(f'ALTER TABLE {tabela} RENAME TO legado_{tabela};\n' for tabela in TABELAS_SQLITE_LEGADO)
+    try:
+        # Sem COMMIT no script: a transação continua aberta e só é confirmada depois da cópia dos dados
+        db.executar_script(f'BEGIN IMMEDIATE;\n{renomear}{schema}')
+        with db.cursor() as cursor:
+            # Nome de conta único por usuário, como na migração 004
+            cursor.execute("""UPDATE legado_contas SET nome = nome || ' #' || id
+                              WHERE id NOT IN (SELECT MIN(id) FROM legado_contas GROUP BY user_id, nome)""")
+            cursor.execute("SELECT id, email, senha_hash, data_criacao FROM legado_usuarios ORDER BY id")
+            usuarios = cursor.fetchall()
+            for usuario in usuarios:
+                cursor.execute("INSERT INTO usuarios (id, email, senha_hash, data_criacao) VALUES (%s, %s, %s, %s)", tuple(usuario))
+                cursor.execute(f"SELECT {', '.join(CONTAS_COLUNAS)} FROM legado_contas WHERE user_id = %s ORDER BY id", (usuario['id'],))
+                linhas = [{'conta': dict(zip(CONTAS_COLUNAS, conta))} for conta in cursor.fetchall()]
+                cursor.execute(f"SELECT {', '.join(TRANSACOES_COLUNAS)} FROM legado_transacoes WHERE user_id = %s ORDER BY id", (usuario['id'],))
+                for transacao in cursor.fetchall():
+                    registro = dict(zip(TRANSACOES_COLUNAS, transacao))
+                    registro['detalhes'] = json.loads(registro['detalhes']) if registro['detalhes'] else None
+                    linhas.append({'transacao': registro})
+                if not linhas:
+                    continue
+                backup = io.BytesIO('\n'.join(json.dumps(linha, default=str) for linha in linhas).encode('utf-8'))
+                stats = restaurar_backup(cursor, usuario['id'], backup)
+                if stats['erros']:
+                    raise click.ClickException(f"Usuário {usuario['id']} ({usuario['email']}) não pôde ser migrado: {stats['erros'][0]['erro']}")
+            for tabela in reversed(TABELAS_SQLITE_LEGADO):
+                cursor.execute(f"DROP TABLE legado_{tabela}")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(usuarios)
+
+@app.cli.command('db-migrate')
+def db_migrate():
+    """Aplica, em ordem, as migrações de migrations/ ainda não registradas no banco. No SQLite, um
+    arquivo vazio recebe o schema_sqlite.sql inteiro, um arquivo do layout antigo (gestao_apostas.db)
+    é convertido para ele e as migrações seguintes vêm de migrations/sqlite/."""
+    db = get_db()
+    diretorio = MIGRATIONS_DIR
+    if e_sqlite(db):
+        diretorio = os.path.join(MIGRATIONS_DIR, 'sqlite')
+        with db.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            tabelas = {row[0] for row in cursor.fetchall() if not row[0].startswith('sqlite_')}
+        if not tabelas:
+            with open(SCHEMA_SQLITE, encoding='utf-8') as f:
+                db.executar_script(f.read())
+            print('Schema SQLite criado')
+        elif 'schema_migrations' not in tabelas:
+            if tabelas != set(TABELAS_SQLITE_LEGADO):
+                raise click.ClickException(f"O arquivo tem as tabelas {', '.join(sorted(tabelas))}, mas não é um banco deste app "
+                                           "(falta schema_migrations). Aponte DATABASE_URL para um arquivo novo.")
+            print(f'Layout antigo convertido para o schema SQLite: {_migrar_sqlite_legado(db)} usuário(s) migrado(s)')
+    with db:
+        with db.cursor() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations (versao TEXT PRIMARY KEY, aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            cursor.execute("SELECT versao FROM schema_migrations")
+            aplicadas = {row[0] for row in cursor.fetchall()}
+    for arquivo in sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql')):
+        versao = arquivo[:-4]
+        if versao in aplicadas:
+            continue
+        caminho = os.path.join(diretorio, arquivo)
+        if not os.path.exists(caminho):
+            raise click.ClickException(f'Migração {versao} não tem versão para SQLite ({caminho})')
+        with open(caminho, encoding='utf-8') as f:
+            sql = f.read()
+        if e_sqlite(db):
+            # executescript não roda dentro de uma transação aberta: BEGIN/COMMIT vão no próprio script
+            db.executar_script(f"BEGIN;\n{sql}\nINSERT INTO schema_migrations (versao) VALUES ('{versao}');\nCOMMIT;")
+            print(f'Migração aplicada: {versao}')
+            continue
+        with db:  # cada migração roda em uma única transação
+            with db.cursor() as cursor:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (versao) VALUES (%s)", (versao,))
+        print(f'Migração aplicada: {versao}')
+
+# --- Cache de Usuários ---
+USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'memory')  # memory | sqlite | off
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 300))  # segundos
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1000))
+USER_CACHE_PATH = os.environ.get('USER_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'gestor_user_cache.sqlite3'))
+
+class UserCache:
+    """Cache de (id, email) por usuário para o user_loader, com TTL e descarte LRU.
+    As subclasses implementam o armazenamento; os contadores são do processo."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0, 'errors': 0}
+
+    def _count(self, chave):
+        with self._stats_lock:
+            self._stats[chave] += 1
+
+    def get(self, user_id):
+        try:
+            valor = self._get(int(user_id))
+        except Exception:
+            self._count('errors')
+            valor = None
+        self._count('hits' if valor is not None else 'misses')
+        return valor
+
+    def set(self, user_id, email):
+        try:
+            self._set(int(user_id), email)
+            self._count('sets')
+        except Exception:
+            self._count('errors')
+
+    def delete(self, user_id):
+        try:
+            self._delete(int(user_id))
+            self._count('invalidations')
+        except Exception:
+            self._count('errors')
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        consultas = stats['hits'] + stats['misses']
+        return dict(stats, backend=type(self).__name__, hit_ratio=stats['hits'] / consultas if consultas else None,
+                    size=self._size(), max_size=self.maxsize, ttl=self.ttl)
+
+class MemoryUserCache(UserCache):
+    """Armazenamento no próprio processo (um por worker do gunicorn)."""
+
+    def __init__(self, ttl, maxsize):
+        super().__init__(ttl, maxsize)
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # user_id -> (email, expira_em), do menos para o mais recente
+
+    def _get(self, user_id):
+        with self._lock:
+            item = self._itens.get(user_id)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self._itens[user_id]
+                return None
+            self._itens.move_to_end(user_id)
+            return item[0]
+
+    def _set(self, user_id, email):
+        with self._lock:
+            self._itens[user_id] = (email, time.monotonic() + self.ttl)
+            self._itens.move_to_end(user_id)
+            while len(self._itens) > self.maxsize:
+                self._itens.popitem(last=False)
+
+    def _delete(self, user_id):
+        with self._lock:
+            self._itens.pop(user_id, None)
+
+    def _size(self):
+        return len(self._itens)
+
+class SqliteUserCache(UserCache):
+    """Armazenamento compartilhado entre os workers da mesma máquina em um arquivo SQLite local,
+    no lugar de um Redis/Memcached. Falhas do arquivo viram miss e a consulta vai ao PostgreSQL."""
+
+    TOQUE_FRACAO = 0.1  # acesso (ordem do LRU) só é regravado se mais velho que esta fração do TTL
+
+    def __init__(self, path, ttl, maxsize):
+        super().__init__(ttl, maxsize)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS usuarios_cache (user_id INTEGER PRIMARY KEY, email TEXT NOT NULL, expira_em REAL NOT NULL, acesso REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_cache_acesso ON usuarios_cache (acesso)")
+
+    def _conn(self):
+        # Uma conexão por thread (e por processo, já que o cache é criado depois do fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # é só cache: perder escritas em uma queda não importa
+        return conn
+
+    def _get(self, user_id):
+        agora = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT email, acesso FROM usuarios_cache WHERE user_id = ? AND expira_em > ?", (user_id, agora)).fetchone()
+        if row is None:
+            return None
+        # Um hit é só leitura: escrever a cada um serializaria os workers no lock do arquivo.
+        # A ordem do LRU com resolução de uma fração do TTL basta para o descarte
+        if agora - row[1] > self.ttl * self.TOQUE_FRACAO:
+            try:
+                conn.execute("UPDATE usuarios_cache SET acesso = ? WHERE user_id = ?", (agora, user_id))
+            except sqlite3.Error:
+                pass  # arquivo ocupado: o hit vale mesmo sem atualizar a ordem
+        return row[0]
+
+    def _set(self, user_id, email):
+        agora = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO usuarios_cache (user_id, email, expira_em, acesso) VALUES (?, ?, ?, ?)", (user_id, email, agora + self.ttl, agora))
+            conn.execute("""DELETE FROM usuarios_cache WHERE expira_em <= ? OR user_id IN (
+                                SELECT user_id FROM usuarios_cache ORDER BY acesso DESC LIMIT -1 OFFSET ?)""", (agora, self.maxsize))
+
+    def _delete(self, user_id):
+        self._conn().execute("DELETE FROM usuarios_cache WHERE user_id = ?", (user_id,))
+
+    def _size(self):
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM usuarios_cache").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+def get_user_cache():
+    # Criado sob demanda, como o pool, para não compartilhar estado entre processos após o fork
+    global _user_cache
+    if _user_cache is None and USER_CACHE_BACKEND != 'off':
+        with _user_cache_lock:
+            if _user_cache is None:
+                if USER_CACHE_BACKEND == 'sqlite':
+                    _user_cache = SqliteUserCache(USER_CACHE_PATH, USER_CACHE_TTL, USER_CACHE_SIZE)
+                else:
+                    _user_cache = MemoryUserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+    return _user_cache
+
+def invalidar_usuario(user_id):
+    """Remove o usuário do cache; chamar sempre que a conta (email, senha, exclusão) mudar."""
+    cache = get_user_cache()
+    if cache is not None:
+        cache.delete(user_id)
 
 # --- Modelo de Usuário ---
 class User(UserMixin):
@@ -40,10 +767,16 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
+    cache = get_user_cache()
+    email = cache.get(user_id) if cache is not None else None
+    if email is not None:
+        return User(id=int(user_id), email=email)
     with get_db().cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-        cursor.execute("SELECT * FROM usuarios WHERE id = %s", (user_id,))
+        cursor.execute("SELECT id, email FROM usuarios WHERE id = %s", (user_id,))
         user_row = cursor.fetchone()
     if user_row:
+        if cache is not None:
+            cache.set(user_row['id'], user_row['email'])
         return User(id=user_row['id'], email=user_row['email'])
     return None
 
@@ -61,6 +794,9 @@ def login():
         
         if user_row and check_password_hash(user_row['senha_hash'], password):
             user = User(id=user_row['id'], email=user_row['email'])
+            cache = get_user_cache()
+            if cache is not None:  # a linha acabou de ser lida: já deixa o usuário no cache
+                cache.set(user.id, user.email)
             login_user(user)
             return redirect(url_for('index'))
         else:
@@ -97,6 +833,7 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    invalidar_usuario(current_user.id)
     logout_user()
     return redirect(url_for('login'))
 
@@ -110,42 +847,423 @@ def index():
 def get_current_user_id():
     return current_user.id
 
+# --- Operações de Aposta ---
+def sincronizar_operacoes(cursor, user_id):
+    """Recria operacoes/apostas a partir de transacoes.detalhes (usado após restaurar um backup)."""
+    cursor.execute("""
+        INSERT INTO operacoes (id, user_id, categoria, status, data_criacao)
+        SELECT detalhes->>'operationId', user_id, MAX(detalhes->>'category'),
+               CASE WHEN BOOL_OR(tipo = 'bet_placed' AND detalhes->>'status' = 'ativa') THEN 'ativa' ELSE 'resolvida' END,
+               MIN(data_criacao)
+        FROM transacoes WHERE user_id = %s AND detalhes->>'operationId' IS NOT NULL
+        GROUP BY detalhes->>'operationId', user_id
+    """, (user_id,))
+    cursor.execute("UPDATE transacoes SET operacao_id = detalhes->>'operationId' WHERE user_id = %s AND detalhes->>'operationId' IS NOT NULL", (user_id,))
+    cursor.execute("""
+        INSERT INTO apostas (transacao_id, user_id, operacao_id, conta_id, resultado, odd, stake, is_freebet, status)
+        SELECT id, user_id, operacao_id, conta_id, detalhes->>'result',
+               COALESCE((detalhes->>'odd')::numeric, 0), COALESCE((detalhes->>'stake')::numeric, 0),
+               COALESCE((detalhes->>'isFreebet')::boolean, FALSE), COALESCE(detalhes->>'status', 'ativa')
+        FROM transacoes WHERE user_id = %s AND tipo = 'bet_placed' AND operacao_id IS NOT NULL
+    """, (user_id,))
+
+# --- Resumo Mensal (agregados por usuário, conta, mês e tipo) ---
+TIPOS_APOSTA = ('bet_placed', 'bet_won')
+
+_SQL_AGREGA_RESUMO = """
+    SELECT t.user_id, t.conta_id, date_trunc('month', t.data_criacao)::date AS mes, t.tipo,
+           SUM(t.valor) AS total, SUM(GREATEST(t.valor, 0)) AS creditos, SUM(LEAST(t.valor, 0)) AS debitos,
+           COALESCE(SUM(a.stake), 0) AS apostado, COUNT(*) AS quantidade
+    FROM transacoes t LEFT JOIN apostas a ON a.transacao_id = t.id
+    WHERE t.data_criacao IS NOT NULL AND {filtro}
+    GROUP BY 1, 2, 3, 4
+"""
+
+def acumular_resumo(cursor, transacao_ids, sinal=1, periodo=None):
+    """Soma (sinal=1) ou subtrai (sinal=-1) as transações informadas do resumo_mensal.
+    Deve rodar na mesma transação da escrita; ao subtrair, antes de apagar as transações.
+    Sem `periodo`, as transações são as gravadas na transação corrente (data_criacao = LOCALTIMESTAMP,
+    o DEFAULT da coluna), o que limita a leitura à partição do mês; para linhas antigas, passe o
+    (menor, maior) data_criacao delas."""
+    if not transacao_ids:
+        return
+    if periodo is None:
+        filtro, params = 't.id = ANY(%(ids)s) AND t.data_criacao = LOCALTIMESTAMP', {}
+    else:
+        filtro, params = 't.id = ANY(%(ids)s) AND t.data_criacao BETWEEN %(de)s AND %(ate)s', {'de': periodo[0], 'ate': periodo[1]}
+    cursor.execute("""
+        INSERT INTO resumo_mensal AS r (user_id, conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade)
+        SELECT user_id, conta_id, mes, tipo, %(s)s * total, %(s)s * creditos, %(s)s * debitos, %(s)s * apostado, %(s)s * quantidade
+        FROM ({agregado}) novo WHERE TRUE  -- o WHERE evita que o SQLite leia o ON CONFLICT como ON de um JOIN
+        ON CONFLICT (user_id, mes, conta_id, tipo) DO UPDATE SET
+            total = r.total + EXCLUDED.total, creditos = r.creditos + EXCLUDED.creditos, debitos = r.debitos + EXCLUDED.debitos,
+            apostado = r.apostado + EXCLUDED.apostado, quantidade = r.quantidade + EXCLUDED.quantidade
+        RETURNING user_id
+    """.format(agregado=_SQL_AGREGA_RESUMO.format(filtro=filtro)), dict(params, s=sinal, ids=list(transacao_ids)))
+    if sinal < 0:
+        usuarios = list({row[0] for row in cursor.fetchall()})
+        cursor.execute("DELETE FROM resumo_mensal WHERE user_id = ANY(%s) AND quantidade = 0", (usuarios,))
+
+# Meses de partições arquivadas: o resumo_mensal deles é mantido e não é mais recalculado
+_SQL_FIM_ARQUIVO = "(SELECT COALESCE(MAX(fim), '-infinity'::date) FROM transacoes_arquivadas)"
+
+def reconstruir_resumo(cursor, user_id=None):
+    """Recalcula do zero o resumo_mensal de um usuário (ou de todos), exceto os meses arquivados."""
+    if user_id is None:
+        cursor.execute(f"DELETE FROM resumo_mensal WHERE mes >= {_SQL_FIM_ARQUIVO}")
+        filtro, params = f't.data_criacao >= {_SQL_FIM_ARQUIVO}', ()
+    else:
+        cursor.execute(f"DELETE FROM resumo_mensal WHERE user_id = %s AND mes >= {_SQL_FIM_ARQUIVO}", (user_id,))
+        filtro, params = f't.user_id = %s AND t.data_criacao >= {_SQL_FIM_ARQUIVO}', (user_id,)
+    cursor.execute("INSERT INTO resumo_mensal (user_id, conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade) "
+                   + _SQL_AGREGA_RESUMO.format(filtro=filtro), params)
+
+@app.cli.command('resumo-rebuild')
+@click.option('--user-id', type=int, default=None, help='Limita a um usuário.')
+@click.option('--check', is_flag=True, help='Apenas compara com os dados atuais, sem gravar.')
+def resumo_rebuild(user_id, check):
+    """Recalcula o resumo_mensal a partir de transacoes (ou confere as divergências com --check)."""
+    db = get_db()
+    with db:
+        with db.cursor() as cursor:
+            if not check:
+                reconstruir_resumo(cursor, user_id)
+                print(f'resumo_mensal recalculado ({cursor.rowcount} linhas).')
+                return
+            filtro, params = ('t.user_id = %s', (user_id, user_id)) if user_id else ('TRUE', ())
+            filtro += f' AND t.data_criacao >= {_SQL_FIM_ARQUIVO}'
+            cursor.execute("""
+                SELECT COALESCE(n.user_id, r.user_id), COALESCE(n.conta_id, r.conta_id), COALESCE(n.mes, r.mes), COALESCE(n.tipo, r.tipo),
+                       r.total, n.total, r.quantidade, n.quantidade
+                FROM ({agregado}) n
+                FULL JOIN (SELECT * FROM resumo_mensal WHERE {filtro_r}) r USING (user_id, mes, conta_id, tipo)
+                WHERE n.total IS DISTINCT FROM r.total OR n.creditos IS DISTINCT FROM r.creditos OR n.debitos IS DISTINCT FROM r.debitos
+                   OR n.apostado IS DISTINCT FROM r.apostado OR n.quantidade IS DISTINCT FROM r.quantidade
+            """.format(agregado=_SQL_AGREGA_RESUMO.format(filtro=filtro), filtro_r=('user_id = %s' if user_id else 'TRUE') + f' AND mes >= {_SQL_FIM_ARQUIVO}'), params)
+            divergencias = cursor.fetchall()
+    for user, conta, mes, tipo, atual_total, esperado_total, atual_qtd, esperado_qtd in divergencias:
+        print(f'user={user} conta={conta} mes={mes} tipo={tipo}: total {atual_total} (esperado {esperado_total}), quantidade {atual_qtd} (esperado {esperado_qtd})')
+    print(f'{len(divergencias)} divergência(s) encontrada(s).')
+    if divergencias:
+        raise SystemExit(1)
+
+_RE_PARTICAO = re.compile(r'^transacoes_(\d{4})_(\d{2})$')
+
+def _particoes_mensais(cursor):
+    """Partições mensais anexadas a transacoes, em ordem cronológica: [(nome, inicio, fim)]."""
+    cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'transacoes'::regclass")
+    particoes = []
+    for (nome,) in cursor.fetchall():
+        encontrado = _RE_PARTICAO.match(nome)
+        if encontrado:
+            ano, mes = int(encontrado.group(1)), int(encontrado.group(2))
+            particoes.append((nome, datetime(ano, mes, 1).date(), datetime(ano + mes // 12, mes % 12 + 1, 1).date()))
+    return sorted(particoes, key=lambda p: p[1])
+
+@app.cli.command('transacoes-particoes')
+@click.option('--meses', type=int, default=TRANSACOES_PARTICOES_FUTURAS, show_default=True, help='Meses à frente do corrente.')
+def transacoes_particoes(meses):
+    """Cria as partições mensais de transacoes que faltam e lista as existentes."""
+    db = get_db()
+    if e_sqlite(db):
+        raise click.ClickException('Particionamento de transacoes disponível apenas no PostgreSQL')
+    with db:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT criar_particoes_transacoes(%s)", (meses,))
+            criadas = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, pg_total_relation_size(c.oid)
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'transacoes'::regclass ORDER BY c.relname
+            """)
+            particoes = cursor.fetchall()
+    for nome, limites, linhas, tamanho in particoes:
+        print(f'{nome:<22} {limites:<70} ~{max(linhas, 0)} linhas, {tamanho // 1024} KB')
+    print(f'{criadas} partição(ões) criada(s).')
+
+@app.cli.command('transacoes-arquivar')
+@click.option('--meses', type=int, required=True, help='Arquiva os meses anteriores aos últimos N meses completos.')
+@click.option('--destino', type=click.Path(file_okay=False), default=None,
+              help='Exporta cada partição para DESTINO/<partição>.csv.gz e a remove do banco, em vez de movê-la para o schema arquivo.')
+@click.option('--dry-run', is_flag=True, help='Apenas lista as partições que seriam arquivadas.')
+def transacoes_arquivar(meses, destino, dry_run):
+    """Desanexa de transacoes as partições mensais antigas e as move para o schema `arquivo` (ou exporta com --destino).
+
+    As operações resolvidas que ficam sem lançamentos são removidas junto (com as apostas, em cascata).
+    O resumo_mensal dos meses arquivados é mantido, então relatórios e gráficos continuam com os totais, e um
+    snapshot de saldo é gravado no limite de cada partição para as consultas de saldo por data.
+    Para na primeira partição que ainda tem operações em aberto, para que os meses arquivados sejam sempre contíguos.
+    """
+    if meses < 1:
+        raise click.BadParameter('use pelo menos 1 mês', param_hint='--meses')
+    db = get_db()
+    if e_sqlite(db):
+        raise click.ClickException('Arquivamento de transacoes disponível apenas no PostgreSQL')
+    with db:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT (date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s))::date", (meses,))
+            limite = cursor.fetchone()[0]
+            candidatas = [p for p in _particoes_mensais(cursor) if p[2] <= limite]
+    if destino and not dry_run:
+        os.makedirs(destino, exist_ok=True)
+    arquivadas = 0
+    for nome, inicio, fim in candidatas:
+        arquivo_csv = os.path.join(destino, f'{nome}.csv.gz') if destino else None
+        try:
+            with db:
+                with db.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT COUNT(DISTINCT o.id) FROM {nome} t JOIN operacoes o ON o.user_id = t.user_id AND o.id = t.operacao_id
+                        WHERE o.status = 'ativa'
+                    """)
+                    abertas = cursor.fetchone()[0]
+                    if abertas:
+                        print(f'{nome}: {abertas} operação(ões) em aberto; arquivamento interrompido aqui.')
+                        break
+                    cursor.execute(f"SELECT COUNT(*) FROM {nome}")
+                    linhas = cursor.fetchone()[0]
+                    if dry_run:
+                        print(f'{nome}: {linhas} linhas seriam arquivadas.')
+                        continue
+                    # Saldo no limite do arquivamento, calculado enquanto a partição ainda está anexada
+                    ancorar_saldos(cursor)
+                    _snapshot_em(cursor, fim)
+                    cursor.execute(f"ALTER TABLE transacoes DETACH PARTITION {nome}")
+                    # Sem as FKs herdadas, apagar operações/contas depois não apaga o histórico arquivado
+                    cursor.execute(f"SELECT conname FROM pg_constraint WHERE conrelid = '{nome}'::regclass AND contype = 'f'")
+                    for (constraint,) in cursor.fetchall():
+                        cursor.execute(f'ALTER TABLE {nome} DROP CONSTRAINT "{constraint}"')
+                    cursor.execute(f"""
+                        DELETE FROM operacoes o USING (SELECT DISTINCT user_id, operacao_id FROM {nome} WHERE operacao_id IS NOT NULL) p
+                        WHERE o.user_id = p.user_id AND o.id = p.operacao_id AND o.status <> 'ativa'
+                          AND NOT EXISTS (SELECT 1 FROM transacoes t WHERE t.user_id = o.user_id AND t.operacao_id = o.id)
+                    """)
+                    operacoes_removidas = cursor.rowcount
+                    if arquivo_csv:
+                        with gzip.open(arquivo_csv, 'wt', encoding='utf-8', newline='') as saida:
+                            cursor.copy_expert(f"COPY {nome} TO STDOUT WITH (FORMAT csv, HEADER)", saida)
+                        cursor.execute(f"DROP TABLE {nome}")
+                        local = arquivo_csv
+                    else:
+                        cursor.execute("CREATE SCHEMA IF NOT EXISTS arquivo")
+                        cursor.execute(f"ALTER TABLE {nome} SET SCHEMA arquivo")
+                        local = f'arquivo.{nome}'
+                    cursor.execute("INSERT INTO transacoes_arquivadas (nome, inicio, fim, linhas, destino) VALUES (%s, %s, %s, %s, %s)",
+                                   (nome, inicio, fim, linhas, local))
+        except Exception:
+            if arquivo_csv and not dry_run and os.path.exists(arquivo_csv):
+                os.remove(arquivo_csv)
+            raise
+        if not dry_run:
+            arquivadas += 1
+            print(f'{nome}: {linhas} linhas arquivadas em {local} ({operacoes_removidas} operações removidas).')
+    print(f'{arquivadas} partição(ões) arquivada(s); limite {limite}.')
+
 # --- API Endpoints ---
+@app.route('/api/status/pool', methods=['GET'])
+@login_required
+def pool_stats():
+    return jsonify(get_pool().stats())
+
+@app.route('/api/status/sql', methods=['GET'])
+@login_required
+def sql_stats():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Instrumentação desativada (METRICS_ENABLED)'}), 404
+    return jsonify(metricas.resumo_sql())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Métricas desativadas (METRICS_ENABLED)'}), 404
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Não autorizado'}), 401
+    pool = get_pool().stats()
+    extras = [('db_pool_connections', 'gauge', 'Conexões abertas no pool.', pool['size']),
+              ('db_pool_connections_in_use', 'gauge', 'Conexões em uso.', pool['in_use']),
+              ('db_pool_waits_total', 'counter', 'Checkouts que esperaram por uma conexão.', pool['waits']),
+              ('db_pool_timeouts_total', 'counter', 'Checkouts que estouraram DB_POOL_TIMEOUT.', pool['timeouts'])]
+    cache = get_user_cache()
+    if cache is not None:
+        cache_stats = cache.stats()
+        extras += [('user_cache_hits_total', 'counter', 'Acertos do cache de usuários.', cache_stats['hits']),
+                   ('user_cache_misses_total', 'counter', 'Faltas do cache de usuários.', cache_stats['misses'])]
+    return Response(metricas.prometheus(extras), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/status/user-cache', methods=['GET'])
+@login_required
+def user_cache_stats():
+    cache = get_user_cache()
+    return jsonify(cache.stats() if cache is not None else {'backend': 'off'})
+
+# --- Versionamento (sincronização incremental do painel) ---
+def nova_versao(cursor, user_id):
+    """Incrementa a versão de dados do usuário na transação corrente. Cada escrita chama uma vez e
+    marca com ela as linhas que tocar; o lock na linha de usuarios serializa as escritas do usuário."""
+    cursor.execute("UPDATE usuarios SET versao = versao + 1 WHERE id = %s RETURNING versao", (user_id,))
+    return cursor.fetchone()[0]
+
+def registrar_exclusoes(cursor, user_id, entidade, ids, versao):
+    if ids:
+        execute_values(cursor, "INSERT INTO exclusoes (user_id, entidade, entidade_id, versao) VALUES %s",
+                       [(user_id, entidade, str(i), versao) for i in ids])
+
+# Só as colunas que o painel usa: detalhes (o JSON completo de cada lançamento) e os campos internos
+# (user_id, versao) ficam fora das cargas. As apostas em aberto vêm já achatadas de apostas/operacoes.
+SQL_CONTAS = """SELECT id, nome, casa_de_aposta, saldo, saldo_freebets, meta, volume_clube, dia_pagamento, valor_pagamento,
+                       observacoes, ultimo_periodo_pago, data_ultimo_codigo, ativa FROM contas"""
+SQL_HISTORICO = """SELECT t.id, t.conta_id, t.tipo, t.valor, t.descricao, t.data_criacao, t.operacao_id, c.nome AS nome_conta
+                   FROM transacoes t JOIN contas c ON t.conta_id = c.id"""
+SQL_OPERACOES_ATIVAS = """SELECT a.transacao_id AS id, a.operacao_id, t.descricao, c.nome AS nome_conta, a.resultado, a.odd, a.stake, o.categoria
+                          FROM apostas a JOIN transacoes t ON t.id = a.transacao_id JOIN contas c ON c.id = a.conta_id
+                          JOIN operacoes o ON o.user_id = a.user_id AND o.id = a.operacao_id
+                          WHERE a.user_id = %s AND a.status = 'ativa'"""
+
+def resumo_financeiro(cursor, user_id):
+    start_of_month = datetime.now().date().replace(day=1)
+    cursor.execute("""
+        SELECT SUM(CASE WHEN tipo NOT IN %(apostas)s THEN creditos ELSE 0 END) as entradas,
+               SUM(CASE WHEN tipo NOT IN %(apostas)s THEN debitos ELSE 0 END) as saidas,
+               SUM(CASE WHEN tipo IN %(apostas)s THEN total ELSE 0 END) as lucro_prejuizo
+        FROM resumo_mensal WHERE user_id = %(user_id)s AND mes = %(mes)s
+    """, {'apostas': TIPOS_APOSTA, 'user_id': user_id, 'mes': start_of_month})
+    resumo_mes_transacoes = cursor.fetchone()
+    return {
+        'monthly_credits': float(resumo_mes_transacoes['entradas'] or 0),
+        'monthly_debits': float(resumo_mes_transacoes['saidas'] or 0),
+        'monthly_net': float(resumo_mes_transacoes['lucro_prejuizo'] or 0)
+    }
+
+def carregar_alteracoes(cursor, user_id, desde, versao):
+    """Contas, operações ativas e histórico alterados ou removidos depois da versão `desde`."""
+    cursor.execute(SQL_CONTAS + " WHERE user_id = %s AND versao > %s ORDER BY nome", (user_id, desde))
+    contas = cursor.fetchall()
+    cursor.execute("SELECT id, status FROM operacoes WHERE user_id = %s AND versao > %s", (user_id, desde))
+    operacoes = cursor.fetchall()
+    ativas = [row['id'] for row in operacoes if row['status'] == 'ativa']
+    operacoes_ativas = []
+    if ativas:
+        cursor.execute(SQL_OPERACOES_ATIVAS + " AND a.operacao_id = ANY(%s)", (user_id, ativas))
+        operacoes_ativas = cursor.fetchall()
+    cursor.execute(SQL_HISTORICO + " WHERE t.user_id = %s AND t.versao > %s AND t.data_criacao IS NOT NULL ORDER BY t.data_criacao DESC, t.id DESC", (user_id, desde))
+    historico = cursor.fetchall()
+    cursor.execute("SELECT entidade, entidade_id FROM exclusoes WHERE user_id = %s AND versao > %s", (user_id, desde))
+    exclusoes = cursor.fetchall()
+    return {
+        'versao': versao,
+        'completo': False,
+        'contas': [dict(row) for row in contas if row['ativa']],
+        'contasRemovidas': [row['id'] for row in contas if not row['ativa']],
+        'operacoesAtivas': [dict(row) for row in operacoes_ativas],
+        'operacoesRemovidas': [row['id'] for row in operacoes if row['status'] != 'ativa'] + [row['entidade_id'] for row in exclusoes if row['entidade'] == 'operacao'],
+        'historico': [dict(row) for row in historico],
+        'historicoRemovido': [int(row['entidade_id']) for row in exclusoes if row['entidade'] == 'transacao'],
+        'resumoFinanceiro': resumo_financeiro(cursor, user_id)
+    }
+
+def resposta_escrita(db, user_id, versao, **dados):
+    """Corpo de resposta das rotas de escrita: a nova versão e as entidades alteradas por ela,
+    para o cliente aplicar localmente. Chamar dentro da transação da escrita."""
+    with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        return dict(dados, versao=versao, alteracoes=carregar_alteracoes(cursor, user_id, versao - 1, versao))
+
 @app.route('/api/dados-iniciais', methods=['GET'])
 @login_required
 def get_dados_iniciais():
+    """Carga do painel. Responde 304 se o ETag (versão dos dados + mês) não mudou; com ?since=<versão>
+    devolve só o que mudou desde então (ou a carga completa, se houve um restore nesse meio tempo)."""
     user_id = get_current_user_id()
+    since = request.args.get('since', type=int)
     db = get_db()
     with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        cursor.execute("SELECT versao, versao_reset FROM usuarios WHERE id = %s", (user_id,))
+        usuario = cursor.fetchone()
+        versao = usuario['versao']
+        etag = f"{versao}-{datetime.now():%Y%m}"
+        if since is None and request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        if since is not None and usuario['versao_reset'] <= since <= versao:
+            return jsonify(carregar_alteracoes(cursor, user_id, since, versao))
+
         # Corrigido: comparar booleano com TRUE
-        cursor.execute("SELECT * FROM contas WHERE user_id = %s AND ativa = TRUE ORDER BY nome", (user_id,))
+        cursor.execute(SQL_CONTAS + " WHERE user_id = %s AND ativa = TRUE ORDER BY nome", (user_id,))
         contas = cursor.fetchall()
 
-        cursor.execute("SELECT t.*, c.nome as nome_conta FROM transacoes t JOIN contas c ON t.conta_id = c.id WHERE t.user_id = %s AND t.tipo = 'bet_placed' AND t.detalhes->>'status' = 'ativa'", (user_id,))
+        cursor.execute(SQL_OPERACOES_ATIVAS, (user_id,))
         operacoes_ativas = cursor.fetchall()
 
-        cursor.execute("SELECT t.*, c.nome as nome_conta FROM transacoes t JOIN contas c ON t.conta_id = c.id WHERE t.user_id = %s ORDER BY t.data_criacao DESC LIMIT 30", (user_id,))
+        cursor.execute(SQL_HISTORICO + " WHERE t.user_id = %s AND t.data_criacao IS NOT NULL ORDER BY t.data_criacao DESC, t.id DESC LIMIT %s", (user_id, HISTORICO_PAGE_SIZE))
         historico = cursor.fetchall()
 
-        now = datetime.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        cursor.execute("SELECT SUM(CASE WHEN valor > 0 THEN valor ELSE 0 END) as entradas, SUM(CASE WHEN valor < 0 THEN valor ELSE 0 END) as saidas FROM transacoes WHERE user_id = %s AND data_criacao >= %s AND tipo NOT IN ('bet_placed', 'bet_won')", (user_id, start_of_month))
-        resumo_mes_transacoes = cursor.fetchone()
-
-        cursor.execute("SELECT SUM(valor) as lucro_prejuizo FROM transacoes WHERE user_id = %s AND data_criacao >= %s AND tipo IN ('bet_placed', 'bet_won')", (user_id, start_of_month))
-        lucro_prejuizo_mes = cursor.fetchone()['lucro_prejuizo'] or 0
+        resumo = resumo_financeiro(cursor, user_id)
 
-    return jsonify({
+    response = jsonify({
+        'versao': versao,
+        'completo': True,
         'contas': [dict(row) for row in contas], 
         'operacoesAtivas': [dict(row) for row in operacoes_ativas], 
         'historico': [dict(row) for row in historico],
-        'resumoFinanceiro': { 
-            'monthly_credits': float(resumo_mes_transacoes['entradas'] or 0), 
-            'monthly_debits': float(resumo_mes_transacoes['saidas'] or 0), 
-            'monthly_net': float(lucro_prejuizo_mes) 
-        }
+        'historicoCursor': _cursor_historico(historico[-1]) if len(historico) == HISTORICO_PAGE_SIZE else None,
+        'resumoFinanceiro': resumo
     })
+    if since is None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+HISTORICO_PAGE_SIZE = 30
+HISTORICO_PAGE_MAX = 200
+
+def _cursor_historico(row):
+    """Cursor opaco da paginação: posição (data_criacao, id) da última linha entregue."""
+    return base64.urlsafe_b64encode(json.dumps([row['data_criacao'].isoformat(), row['id']]).encode()).decode()
+
+def _ler_cursor_historico(cursor_param):
+    data_criacao, transacao_id = json.loads(base64.urlsafe_b64decode(cursor_param.encode()))
+    return datetime.fromisoformat(data_criacao), int(transacao_id)
+
+@app.route('/api/transacoes', methods=['GET'])
+@login_required
+def listar_transacoes():
+    """Histórico paginado por cursor (keyset em data_criacao, id), com filtros opcionais:
+    conta_id, tipo (lista separada por vírgulas), de/ate (AAAA-MM-DD, inclusivos), status da operação e limit."""
+    user_id = get_current_user_id()
+    try:
+        limit = min(max(request.args.get('limit', default=HISTORICO_PAGE_SIZE, type=int), 1), HISTORICO_PAGE_MAX)
+        # Linhas sem data_criacao não têm posição no cursor e ficam de fora da paginação
+        condicoes, params = ["t.user_id = %s", "t.data_criacao IS NOT NULL"], [user_id]
+        if request.args.get('cursor'):
+            condicoes.append("(t.data_criacao, t.id) < (%s, %s)")
+            params.extend(_ler_cursor_historico(request.args['cursor']))
+        if request.args.get('conta_id'):
+            condicoes.append("t.conta_id = %s")
+            params.append(int(request.args['conta_id']))
+        if request.args.get('tipo'):
+            condicoes.append("t.tipo = ANY(%s)")
+            params.append(request.args['tipo'].split(','))
+        if request.args.get('de'):
+            condicoes.append("t.data_criacao >= %s")
+            params.append(datetime.strptime(request.args['de'], '%Y-%m-%d'))
+        if request.args.get('ate'):
+            condicoes.append("t.data_criacao < %s")
+            params.append(datetime.strptime(request.args['ate'], '%Y-%m-%d') + timedelta(days=1))
+        if request.args.get('status'):
+            condicoes.append("EXISTS (SELECT 1 FROM operacoes o WHERE o.user_id = t.user_id AND o.id = t.operacao_id AND o.status = %s)")
+            params.append(request.args['status'])
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Parâmetros de consulta inválidos'}), 400
+
+    with get_db().cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        cursor.execute(f"""
+            {SQL_HISTORICO}
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY t.data_criacao DESC, t.id DESC LIMIT %s
+        """, params + [limit + 1])
+        transacoes = cursor.fetchall()
+    proximo = _cursor_historico(transacoes[limit - 1]) if len(transacoes) > limit else None
+    return jsonify({'transacoes': [dict(row) for row in transacoes[:limit]], 'proximoCursor': proximo})
 
 # --- Todas as demais rotas permanecem idênticas, apenas corrija comparações booleanas e TIMESTAMP em SQL ---
 # Por exemplo, para desativar conta:
@@ -154,35 +1272,181 @@ def get_dados_iniciais():
 def deactivate_conta(conta_id):
     user_id = get_current_user_id()
     db = get_db()
-    with db.cursor() as cursor:
-        cursor.execute("UPDATE contas SET ativa = FALSE WHERE id = %s AND user_id = %s", (conta_id, user_id))
-        rowcount = cursor.rowcount
-    db.commit()
-    return jsonify({'message': 'Conta desativada com sucesso'}) if rowcount > 0 else (jsonify({'error': 'Conta não encontrada'}), 404)
+    with db:
+        with db.cursor() as cursor:
+            versao = nova_versao(cursor, user_id)
+            cursor.execute("UPDATE contas SET ativa = FALSE, versao = %s WHERE id = %s AND user_id = %s", (versao, conta_id, user_id))
+            if cursor.rowcount == 0:
+                db.rollback()
+                return jsonify({'error': 'Conta não encontrada'}), 404
+            resposta = resposta_escrita(db, user_id, versao, message='Conta desativada com sucesso')
+    return jsonify(resposta)
+
+REGISTRAR_LOTE_MAX = 500  # operações por chamada de /api/operacoes em lote
+
+def _validar_operacao(op_data):
+    """Normaliza uma operação do payload em (categoria, jogo, apostas) ou levanta ValueError,
+    antes de qualquer escrita no banco."""
+    if not isinstance(op_data, dict):
+        raise ValueError('Operação inválida')
+    apostas = []
+    for leg in op_data.get('legs') or []:
+        try:
+            odd = float(leg.get('odd'))
+            for bet in leg.get('accounts') or []:
+                conta_id, stake = int(bet.get('accountId')), float(bet.get('stake'))
+                if stake <= 0:
+                    raise ValueError
+                apostas.append((conta_id, leg.get('result'), odd, stake, bool(bet.get('isFreebet', False))))
+        except (TypeError, ValueError):
+            raise ValueError(f"Aposta inválida no mercado {leg.get('result')!r}: conta, odd e stake são obrigatórios")
+    if not apostas:
+        raise ValueError('A operação precisa de ao menos uma aposta')
+    return op_data.get('category'), op_data.get('gameName'), apostas
+
+def reservar_ids_transacoes(cursor, quantidade):
+    """Próximos `quantidade` ids de transacoes, para um INSERT em lote que precisa saber o id de cada
+    linha. No PostgreSQL vêm da sequence. No SQLite, chamar depois de uma escrita na transação: com o
+    lock de escrita, ninguém mais avança sqlite_sequence até o commit."""
+    if e_sqlite(cursor):
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'transacoes'")
+        ultimo = cursor.fetchone()[0]
+        return list(range(ultimo + 1, ultimo + quantidade + 1))
+    cursor.execute("SELECT nextval(pg_get_serial_sequence('transacoes', 'id')) FROM generate_series(1, %s)", (quantidade,))
+    return [row[0] for row in cursor.fetchall()]
+
+def registrar_operacoes(cursor, user_id, operacoes, versao):
+    """Registra operações já validadas com comandos em lote: débito agregado por conta, um INSERT
+    multi-linha em transacoes e outro em apostas. Retorna os ids das operações, na mesma ordem."""
+    debitos = {}
+    for _, _, apostas in operacoes:
+        for conta_id, _, _, stake, is_freebet in apostas:
+            dinheiro, freebet = debitos.get(conta_id, (0, 0))
+            debitos[conta_id] = (dinheiro, freebet + stake) if is_freebet else (dinheiro + stake, freebet)
+    # Contas travadas em ordem de id para não haver deadlock entre operações concorrentes
+    cursor.execute("SELECT id FROM contas WHERE user_id = %s AND id = ANY(%s) ORDER BY id FOR UPDATE", (user_id, sorted(debitos)))
+    faltantes = set(debitos) - {row[0] for row in cursor.fetchall()}
+    if faltantes:
+        raise ValueError(f'Conta {min(faltantes)} não encontrada')
+    execute_values(cursor, """
+        UPDATE contas c SET saldo = c.saldo - v.dinheiro, saldo_freebets = c.saldo_freebets - v.freebet, versao = v.versao
+        FROM (VALUES %s) v(id, dinheiro, freebet, versao) WHERE c.id = v.id
+    """, [(conta_id, *valores, versao) for conta_id, valores in sorted(debitos.items())],
+        template='(%s::int, %s::numeric, %s::numeric, %s::bigint)', page_size=len(debitos))
+
+    # Os ids das transações são reservados antes do INSERT: a ordem das linhas do RETURNING não é
+    # garantida, e cada aposta precisa apontar para a transação da sua própria conta
+    transacao_ids = reservar_ids_transacoes(cursor, sum(len(apostas) for _, _, apostas in operacoes))
+    operation_ids, linhas_transacoes, linhas_apostas = [], [], []
+    for categoria, jogo, apostas in operacoes:
+        operation_id = f"op_{uuid.uuid4().hex}"
+        operation_ids.append(operation_id)
+        for conta_id, resultado, odd, stake, is_freebet in apostas:
+            transacao_id = transacao_ids[len(linhas_transacoes)]
+            detalhes = json.dumps({'operationId': operation_id, 'result': resultado, 'category': categoria, 'odd': odd, 'stake': stake, 'isFreebet': is_freebet, 'status': 'ativa'})
+            linhas_transacoes.append((transacao_id, conta_id, user_id, 'bet_placed', -stake if not is_freebet else 0, f"{jogo} - {resultado}", detalhes, operation_id, versao))
+            linhas_apostas.append((transacao_id, user_id, operation_id, conta_id, resultado, odd, stake, is_freebet))
+    execute_values(cursor, "INSERT INTO operacoes (id, user_id, categoria, versao) VALUES %s",
+                   [(op_id, user_id, categoria, versao) for op_id, (categoria, _, _) in zip(operation_ids, operacoes)], page_size=len(operacoes))
+    execute_values(cursor, "INSERT INTO transacoes (id, conta_id, user_id, tipo, valor, descricao, detalhes, operacao_id, versao) VALUES %s",
+                   linhas_transacoes, page_size=len(linhas_transacoes))
+    execute_values(cursor, "INSERT INTO apostas (transacao_id, user_id, operacao_id, conta_id, resultado, odd, stake, is_freebet) VALUES %s",
+                   linhas_apostas, page_size=len(linhas_apostas))
+    acumular_resumo(cursor, transacao_ids)
+    return operation_ids
 
 @app.route('/api/operacoes', methods=['POST'])
 @login_required
 def registrar_operacao():
+    """Aceita uma operação ou, para lançamento em massa, uma lista (ou {"operacoes": [...]})."""
     user_id, op_data = get_current_user_id(), request.get_json()
+    lote = op_data if isinstance(op_data, list) else op_data.get('operacoes') if isinstance(op_data, dict) and 'operacoes' in op_data else None
+    try:
+        operacoes = [_validar_operacao(item) for item in (lote if lote is not None else [op_data])]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not operacoes:
+        return jsonify({'error': 'Nenhuma operação enviada'}), 400
+    if len(operacoes) > REGISTRAR_LOTE_MAX:
+        return jsonify({'error': f'No máximo {REGISTRAR_LOTE_MAX} operações por chamada'}), 400
     db = get_db()
     try:
         with db: # A conexão do psycopg2 gerencia a transação (commit/rollback)
             with db.cursor() as cursor:
-                operation_id = f"op_{int(datetime.now().timestamp())}"
-                for leg in op_data.get('legs', []):
-                    for bet in leg.get('accounts', []):
-                        conta_id, stake, is_freebet, odd = int(bet.get('accountId')), float(bet.get('stake')), bet.get('isFreebet', False), float(leg.get('odd'))
-                        if is_freebet:
-                            cursor.execute("UPDATE contas SET saldo_freebets = saldo_freebets - %s WHERE id = %s", (stake, conta_id))
-                        else:
-                            cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s", (stake, conta_id))
-                        detalhes = json.dumps({'operationId': operation_id, 'result': leg.get('result'), 'category': op_data.get('category'),'odd': odd, 'stake': stake, 'isFreebet': is_freebet, 'status': 'ativa'})
-                        cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, detalhes) VALUES (%s, %s, %s, %s, %s, %s)", 
-                                       (conta_id, user_id, 'bet_placed', -stake if not is_freebet else 0, f"{op_data.get('gameName')} - {leg.get('result')}", detalhes))
-        return jsonify({'message': 'Operação registrada com sucesso!'})
+                versao = nova_versao(cursor, user_id)
+                operation_ids = registrar_operacoes(cursor, user_id, operacoes, versao)
+                if lote is None:
+                    resposta = resposta_escrita(db, user_id, versao, message='Operação registrada com sucesso!', operationId=operation_ids[0])
+                else:
+                    resposta = resposta_escrita(db, user_id, versao, message=f'{len(operation_ids)} operações registradas com sucesso!', operationIds=operation_ids)
+        return jsonify(resposta)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+RESOLVER_LOTE_MAX = 500  # operações por chamada de /api/operacoes/resolver-lote
+
+def resolver_operacoes(cursor, user_id, pedidos, versao):
+    """Liquida várias operações de uma vez com comandos em lote: status das apostas, lançamentos
+    bet_won, crédito agregado por conta e o resumo mensal. `pedidos` é uma lista de
+    (operationId, winningMarket), com winningMarket None para operação perdida.
+    Retorna o resultado de cada pedido, na mesma ordem."""
+    operacao_ids = list(dict.fromkeys(op_id for op_id, _ in pedidos))
+    cursor.execute("""
+        SELECT a.*, t.descricao, t.detalhes FROM apostas a JOIN transacoes t ON t.id = a.transacao_id
+        WHERE a.user_id = %s AND a.operacao_id = ANY(%s) AND a.status = 'ativa'
+        ORDER BY a.transacao_id FOR UPDATE OF a
+    """, (user_id, operacao_ids))
+    apostas_por_operacao = {}
+    for aposta in cursor.fetchall():
+        apostas_por_operacao.setdefault(aposta['operacao_id'], []).append(aposta)
+
+    resultados, status_apostas, ganhos, creditos, resolvidas = [], [], [], {}, []
+    for operation_id, winning_market in pedidos:
+        if operation_id in resolvidas:
+            resultados.append({'operationId': operation_id, 'status': 'duplicada'})
+            continue
+        apostas = apostas_por_operacao.get(operation_id)
+        if not apostas:
+            resultados.append({'operationId': operation_id, 'status': 'nao_encontrada'})
+            continue
+        resolvidas.append(operation_id)
+        retorno_total, ganhou = 0, False
+        for aposta in apostas:
+            is_winner = winning_market is not None and aposta['resultado'] == winning_market
+            if is_winner:
+                ganhou = True
+                retorno = aposta['stake'] * aposta['odd']
+                if aposta['is_freebet']:
+                    retorno -= aposta['stake']
+                retorno_total += retorno
+                creditos[aposta['conta_id']] = creditos.get(aposta['conta_id'], 0) + retorno
+                ganhos.append((aposta['conta_id'], user_id, 'bet_won', retorno, f"Ganho: {aposta['descricao']}", json.dumps(aposta['detalhes']), operation_id, versao))
+            status_apostas.append((aposta['transacao_id'], 'ganha' if is_winner else 'perdida'))
+        resultados.append({'operationId': operation_id, 'status': 'ganha' if ganhou else 'perdida', 'retorno': float(retorno_total)})
+    if not resolvidas:
+        return resultados
+
+    execute_values(cursor, "UPDATE apostas a SET status = v.status FROM (VALUES %s) v(transacao_id, status) WHERE a.transacao_id = v.transacao_id",
+                   status_apostas, page_size=len(status_apostas))
+    if creditos:
+        # Contas travadas em ordem de id para não haver deadlock entre liquidações concorrentes
+        cursor.execute("SELECT id FROM contas WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (sorted(creditos),))
+        execute_values(cursor, "UPDATE contas c SET saldo = c.saldo + v.credito, versao = v.versao FROM (VALUES %s) v(id, credito, versao) WHERE c.id = v.id",
+                       [(conta_id, credito, versao) for conta_id, credito in sorted(creditos.items())],
+                       template='(%s::int, %s::numeric, %s::bigint)', page_size=len(creditos))
+        ganhos_ids = execute_values(cursor, "INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, detalhes, operacao_id, versao) VALUES %s RETURNING id",
+                                    ganhos, page_size=len(ganhos), fetch=True)
+        acumular_resumo(cursor, [row[0] for row in ganhos_ids])
+    cursor.execute("UPDATE operacoes SET status = 'resolvida', versao = %s WHERE user_id = %s AND id = ANY(%s)", (versao, user_id, resolvidas))
+    # Mantém o status em detalhes (lido pelo frontend e pelo backup) em sincronia com apostas
+    detalhes = ("json_set(t.detalhes, '$.status', a.status)" if e_sqlite(cursor)
+                else "(t.detalhes::jsonb || jsonb_build_object('status', a.status))::json")
+    cursor.execute(f"""
+        UPDATE transacoes t SET detalhes = {detalhes}, versao = %s
+        FROM apostas a WHERE a.transacao_id = t.id AND a.user_id = %s AND a.operacao_id = ANY(%s)
+    """, (versao, user_id, resolvidas))
+    return resultados
+
 @app.route('/api/operacoes/resolver', methods=['POST'])
 @login_required
 def resolver_operacao():
@@ -192,33 +1456,36 @@ def resolver_operacao():
     try:
         with db: # Gerencia a transação
             with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute("SELECT * FROM transacoes WHERE user_id = %s AND tipo = 'bet_placed' AND detalhes->>'operationId' = %s AND detalhes->>'status' = 'ativa'", (user_id, operation_id))
-                apostas = cursor.fetchall()
-                if not apostas:
+                versao = nova_versao(cursor, user_id)
+                resultado, = resolver_operacoes(cursor, user_id, [(operation_id, winning_market)], versao)
+                if resultado['status'] == 'nao_encontrada':
+                    db.rollback()
                     return jsonify({'error': 'Operação não encontrada ou já resolvida'}), 404
+                message = 'Operação marcada como perdida!' if winning_market is None else 'Operação resolvida com sucesso!'
+                resposta = resposta_escrita(db, user_id, versao, message=message)
+        return jsonify(resposta)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-                if winning_market is None:
-                    for aposta in apostas:
-                        detalhes = dict(aposta['detalhes'])
-                        detalhes['status'] = 'perdida'
-                        cursor.execute("UPDATE transacoes SET detalhes = %s WHERE id = %s", (json.dumps(detalhes), aposta['id']))
-                    return jsonify({'message': 'Operação marcada como perdida!'})
-
-                for aposta in apostas:
-                    detalhes = dict(aposta['detalhes'])
-                    is_winner = detalhes.get('result') == winning_market
-                    if is_winner:
-                        retorno = detalhes['stake'] * detalhes['odd']
-                        if detalhes['isFreebet']:
-                            retorno -= detalhes['stake']
-                        cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s", (retorno, aposta['conta_id']))
-                        cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, detalhes) VALUES (%s, %s, %s, %s, %s, %s)", 
-                                       (aposta['conta_id'], user_id, 'bet_won', retorno, f"Ganho: {aposta['descricao']}", json.dumps(detalhes)))
-                        detalhes['status'] = 'ganha'
-                    else:
-                        detalhes['status'] = 'perdida'
-                    cursor.execute("UPDATE transacoes SET detalhes = %s WHERE id = %s", (json.dumps(detalhes), aposta['id']))
-        return jsonify({'message': 'Operação resolvida com sucesso!'})
+@app.route('/api/operacoes/resolver-lote', methods=['POST'])
+@login_required
+def resolver_operacoes_lote():
+    """Liquida uma lista de {operationId, winningMarket} em uma única transação."""
+    user_id, data = get_current_user_id(), request.get_json()
+    itens = data.get('operacoes') if isinstance(data, dict) else data
+    if not isinstance(itens, list) or not itens or not all(isinstance(item, dict) and item.get('operationId') for item in itens):
+        return jsonify({'error': 'Envie uma lista de {operationId, winningMarket}'}), 400
+    if len(itens) > RESOLVER_LOTE_MAX:
+        return jsonify({'error': f'No máximo {RESOLVER_LOTE_MAX} operações por chamada'}), 400
+    db = get_db()
+    try:
+        with db: # Gerencia a transação
+            with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                versao = nova_versao(cursor, user_id)
+                resultados = resolver_operacoes(cursor, user_id, [(item['operationId'], item.get('winningMarket')) for item in itens], versao)
+                resolvidas = sum(1 for r in resultados if r['status'] in ('ganha', 'perdida'))
+                resposta = resposta_escrita(db, user_id, versao, message=f'{resolvidas} de {len(itens)} operações resolvidas.', resultados=resultados)
+        return jsonify(resposta)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -232,12 +1499,16 @@ def add_transacao_generica():
     try:
         with db: # Gerencia a transação
             with db.cursor() as cursor:
-                cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s AND user_id = %s", (valor_real, conta_id, user_id))
+                versao = nova_versao(cursor, user_id)
+                cursor.execute("UPDATE contas SET saldo = saldo + %s, versao = %s WHERE id = %s AND user_id = %s", (valor_real, versao, conta_id, user_id))
                 if cursor.rowcount == 0:
+                    db.rollback()
                     return jsonify({'error': 'Conta não encontrada'}), 404
-                cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao) VALUES (%s, %s, %s, %s, %s)", 
-                               (conta_id, user_id, tipo, valor_real, descricao))
-        return jsonify({'message': 'Transação registrada com sucesso!'})
+                cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, versao) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id", 
+                               (conta_id, user_id, tipo, valor_real, descricao, versao))
+                acumular_resumo(cursor, [cursor.fetchone()[0]])
+                resposta = resposta_escrita(db, user_id, versao, message='Transação registrada com sucesso!')
+        return jsonify(resposta)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -250,11 +1521,16 @@ def transferencia_entre_contas():
     try:
         with db: # Gerencia a transação
             with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s AND user_id = %s", (valor, from_id, user_id))
-                if cursor.rowcount == 0: return jsonify({'error': 'Conta de origem não encontrada'}), 404
+                versao = nova_versao(cursor, user_id)
+                cursor.execute("UPDATE contas SET saldo = saldo - %s, versao = %s WHERE id = %s AND user_id = %s", (valor, versao, from_id, user_id))
+                if cursor.rowcount == 0:
+                    db.rollback()
+                    return jsonify({'error': 'Conta de origem não encontrada'}), 404
                 
-                cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s AND user_id = %s", (valor, to_id, user_id))
-                if cursor.rowcount == 0: return jsonify({'error': 'Conta de destino não encontrada'}), 404
+                cursor.execute("UPDATE contas SET saldo = saldo + %s, versao = %s WHERE id = %s AND user_id = %s", (valor, versao, to_id, user_id))
+                if cursor.rowcount == 0:
+                    db.rollback()
+                    return jsonify({'error': 'Conta de destino não encontrada'}), 404
 
                 cursor.execute("SELECT nome FROM contas WHERE id = %s", (from_id,))
                 from_name = cursor.fetchone()['nome']
@@ -262,11 +1538,12 @@ def transferencia_entre_contas():
                 cursor.execute("SELECT nome FROM contas WHERE id = %s", (to_id,))
                 to_name = cursor.fetchone()['nome']
                 
-                cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao) VALUES (%s, %s, %s, %s, %s)", 
-                               (from_id, user_id, 'transfer_out', -valor, f"Para: {to_name} ({descricao})"))
-                cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao) VALUES (%s, %s, %s, %s, %s)", 
-                               (to_id, user_id, 'transfer_in', valor, f"De: {from_name} ({descricao})"))
-        return jsonify({'message': 'Transferência realizada com sucesso!'})
+                cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, versao) VALUES (%s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s) RETURNING id", 
+                               (from_id, user_id, 'transfer_out', -valor, f"Para: {to_name} ({descricao})", versao,
+                                to_id, user_id, 'transfer_in', valor, f"De: {from_name} ({descricao})", versao))
+                acumular_resumo(cursor, [row['id'] for row in cursor.fetchall()])
+                resposta = resposta_escrita(db, user_id, versao, message='Transferência realizada com sucesso!')
+        return jsonify(resposta)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -282,37 +1559,123 @@ def reverter_transacao(transacao_id):
                 transacao = cursor.fetchone()
                 if not transacao: return jsonify({'error': 'Transação não encontrada'}), 404
 
-                detalhes = transacao['detalhes'] if transacao['detalhes'] else {}
-                operation_id = detalhes.get('operationId')
+                versao = nova_versao(cursor, user_id)
+                operation_id = transacao['operacao_id']
 
                 if operation_id:
-                    cursor.execute("SELECT * FROM transacoes WHERE user_id = %s AND detalhes->>'operationId' = %s", (user_id, operation_id))
+                    cursor.execute("SELECT t.*, a.is_freebet, a.stake FROM transacoes t LEFT JOIN apostas a ON a.transacao_id = t.id WHERE t.user_id = %s AND t.operacao_id = %s", (user_id, operation_id))
                     apostas_relacionadas = cursor.fetchall()
                     for aposta in apostas_relacionadas:
-                        cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s", (aposta['valor'], aposta['conta_id']))
-                        aposta_detalhes = aposta['detalhes'] if aposta['detalhes'] else {}
-                        if aposta['tipo'] == 'bet_placed' and aposta_detalhes.get('isFreebet'):
-                            cursor.execute("UPDATE contas SET saldo_freebets = saldo_freebets + %s WHERE id = %s", (aposta_detalhes.get('stake', 0), aposta['conta_id']))
-                        cursor.execute("DELETE FROM transacoes WHERE id = %s", (aposta['id'],))
+                        cursor.execute("UPDATE contas SET saldo = saldo - %s, versao = %s WHERE id = %s", (aposta['valor'], versao, aposta['conta_id']))
+                        if aposta['tipo'] == 'bet_placed' and aposta['is_freebet']:
+                            cursor.execute("UPDATE contas SET saldo_freebets = saldo_freebets + %s WHERE id = %s", (aposta['stake'], aposta['conta_id']))
+                    datas = [aposta['data_criacao'] for aposta in apostas_relacionadas]
+                    acumular_resumo(cursor, [aposta['id'] for aposta in apostas_relacionadas], sinal=-1, periodo=(min(datas), max(datas)))
+                    desfazer_em_snapshots(cursor, [(aposta['conta_id'], aposta['data_criacao'], aposta['valor'],
+                                                    aposta['stake'] if aposta['tipo'] == 'bet_placed' and aposta['is_freebet'] else 0)
+                                                   for aposta in apostas_relacionadas])
+                    # Apaga a operação; transações e apostas relacionadas saem em cascata
+                    cursor.execute("DELETE FROM operacoes WHERE user_id = %s AND id = %s", (user_id, operation_id))
+                    registrar_exclusoes(cursor, user_id, 'operacao', [operation_id], versao)
+                    registrar_exclusoes(cursor, user_id, 'transacao', [aposta['id'] for aposta in apostas_relacionadas], versao)
                 else:
-                    cursor.execute("UPDATE contas SET saldo = saldo - %s WHERE id = %s", (transacao['valor'], transacao['conta_id']))
-                    cursor.execute("DELETE FROM transacoes WHERE id = %s", (transacao_id,))
-        return jsonify({'message': 'Transação e seus efeitos foram revertidos!'})
+                    cursor.execute("UPDATE contas SET saldo = saldo - %s, versao = %s WHERE id = %s", (transacao['valor'], versao, transacao['conta_id']))
+                    acumular_resumo(cursor, [transacao_id], sinal=-1, periodo=(transacao['data_criacao'], transacao['data_criacao']))
+                    desfazer_em_snapshots(cursor, [(transacao['conta_id'], transacao['data_criacao'], transacao['valor'], 0)])
+                    cursor.execute("DELETE FROM transacoes WHERE id = %s AND data_criacao = %s", (transacao_id, transacao['data_criacao']))
+                    registrar_exclusoes(cursor, user_id, 'transacao', [transacao_id], versao)
+                resposta = resposta_escrita(db, user_id, versao, message='Transação e seus efeitos foram revertidos!')
+        return jsonify(resposta)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+BACKUP_BATCH_SIZE = int(os.environ.get('BACKUP_BATCH_SIZE', 2000))
+
+def _ler_em_lotes(db, nome, sql, params):
+    """Percorre o resultado com um cursor nomeado (do lado do servidor), um lote por vez."""
+    with db.cursor(name=nome, cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        cursor.itersize = BACKUP_BATCH_SIZE
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(BACKUP_BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+
+def gerar_backup(db, user_id, formato='json', progresso=None):
+    """Gera o backup em pedaços de texto, com memória constante independente do histórico.
+    'json' mantém o layout lido pelo /api/restore; 'ndjson' emite um registro por linha.
+    `progresso(contas=, transacoes=)`, se informado, é chamado a cada lote lido."""
+    tabelas = (('contas', 'conta', "SELECT * FROM contas WHERE user_id = %s ORDER BY id"),
+               ('transacoes', 'transacao', "SELECT * FROM transacoes WHERE user_id = %s ORDER BY id"))
+    backup_date = datetime.now().isoformat()
+    contagem = {'contas': 0, 'transacoes': 0}
+    def lotes(tabela, sql):
+        for rows in _ler_em_lotes(db, f'backup_{tabela}', sql, (user_id,)):
+            contagem[tabela] += len(rows)
+            if progresso:
+                progresso(**contagem)
+            yield rows
+    with db:  # o cursor nomeado precisa de uma transação aberta
+        if formato == 'ndjson':
+            yield json.dumps({'backupDate': backup_date}) + '\n'
+            for tabela, registro, sql in tabelas:
+                for rows in lotes(tabela, sql):
+                    yield ''.join(json.dumps({registro: dict(row)}, default=str) + '\n' for row in rows)
+            return
+        yield '{"backupDate": %s' % json.dumps(backup_date)
+        for tabela, _, sql in tabelas:
+            yield ', "%s": [' % tabela
+            separador = '\n'
+            for rows in lotes(tabela, sql):
+                yield separador + ',\n'.join(json.dumps(dict(row), default=str) for row in rows)
+                separador = ',\n'
+            yield '\n]'
+        yield '}\n'
+
+def _stream_com_conexao(gerar, *args):
+    """Executa o gerador `gerar(db, *args)` com uma conexão própria, devolvida ao pool só quando a
+    resposta termina ou é fechada. A conexão de get_db() não serve: o teardown do contexto a
+    devolve ao fim da view, antes de o corpo em streaming ser enviado."""
+    pool = get_pool()
+    db = pool.getconn()  # na view, para um PoolTimeout ainda virar 503
+    def stream():
+        try:
+            yield None
+            yield from gerar(db, *args)
+        finally:
+            pool.putconn(db)
+    chunks = stream()
+    next(chunks)  # entra no try: a partir daqui close() sempre devolve a conexão
+    return chunks
+
+def _comprimir_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/api/backup', methods=['GET'])
 @login_required
 def backup_dados():
     user_id = get_current_user_id()
-    with get_db().cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-        cursor.execute("SELECT * FROM contas WHERE user_id = %s", (user_id,))
-        contas = [dict(row) for row in cursor.fetchall()]
-        cursor.execute("SELECT * FROM transacoes WHERE user_id = %s", (user_id,))
-        transacoes = [dict(row) for row in cursor.fetchall()]
-    backup_data = {'backupDate': datetime.now().isoformat(), 'contas': contas, 'transacoes': transacoes}
-    return Response(json.dumps(backup_data, indent=2, default=str), mimetype='application/json', headers={'Content-Disposition': 'attachment;filename=backup_gestao.json'})
+    formato = 'ndjson' if request.args.get('format') == 'ndjson' else 'json'
+    if _pedido_assincrono():
+        return enfileirar_job(user_id, 'backup', {'format': formato, 'gzip': bool(request.args.get('gzip', type=int))})
+    filename = f'backup_gestao.{formato}'
+    chunks = stream = _stream_com_conexao(gerar_backup, user_id, formato)
+    if request.args.get('gzip', type=int):
+        chunks, filename, mimetype = _comprimir_gzip(stream), filename + '.gz', 'application/gzip'
+    else:
+        mimetype = 'application/x-ndjson' if formato == 'ndjson' else 'application/json'
+    response = Response(chunks, mimetype=mimetype, headers={'Content-Disposition': f'attachment;filename={filename}'})
+    # Fechar o gerador do gzip não fecha o de dentro: sem isso, a conexão de um download interrompido
+    # só voltaria ao pool quando o coletor de lixo passasse
+    response.call_on_close(stream.close)
+    return response
 
 @app.route('/api/relatorio', methods=['GET'])
 @login_required
@@ -323,33 +1686,34 @@ def get_relatorio():
     start_date, end_date = datetime(year, month, 1), (datetime(year, month, 1) + timedelta(days=32)).replace(day=1)
     
     with get_db().cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-        cursor.execute("SELECT t.*, c.nome as nome_conta, c.casa_de_aposta FROM transacoes t JOIN contas c ON t.conta_id = c.id WHERE t.user_id = %s AND t.data_criacao >= %s AND t.data_criacao < %s", (user_id, start_date, end_date))
-        transacoes = [dict(row) for row in cursor.fetchall()]
-    
-    net_profit = sum(t['valor'] for t in transacoes if t['tipo'] in ['bet_placed', 'bet_won'])
-    total_expenses = sum(t['valor'] for t in transacoes if t['tipo'] == 'expense')
-    total_payments = sum(t['valor'] for t in transacoes if t['tipo'] == 'payment')
-
-    analysis = {}
-    for t in transacoes:
-        if t['casa_de_aposta'] != 'pessoal':
-            if t['conta_id'] not in analysis: 
-                analysis[t['conta_id']] = {'name': t['nome_conta'], 'profit': 0, 'wagered': 0, 'betCount': 0}
-            if t['tipo'] in ['bet_placed', 'bet_won']: 
-                analysis[t['conta_id']]['profit'] += t['valor']
-            if t['tipo'] == 'bet_placed':
-                details = t['detalhes'] if t['detalhes'] else {}
-                analysis[t['conta_id']]['wagered'] += details.get('stake', 0)
-                analysis[t['conta_id']]['betCount'] += 1
-                
+        cursor.execute("""
+            SELECT SUM(CASE WHEN tipo IN %(apostas)s THEN total ELSE 0 END) as net_profit,
+                   SUM(CASE WHEN tipo = 'expense' THEN total ELSE 0 END) as total_expenses,
+                   SUM(CASE WHEN tipo = 'payment' THEN total ELSE 0 END) as total_payments
+            FROM resumo_mensal WHERE user_id = %(user_id)s AND mes = %(mes)s
+        """, {'apostas': TIPOS_APOSTA, 'user_id': user_id, 'mes': start_date.date()})
+        summary = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT c.nome, SUM(CASE WHEN r.tipo IN %(apostas)s THEN r.total ELSE 0 END) as profit,
+                   SUM(r.apostado) as wagered, SUM(CASE WHEN r.tipo = 'bet_placed' THEN r.quantidade ELSE 0 END) as bet_count
+            FROM resumo_mensal r JOIN contas c ON c.id = r.conta_id
+            WHERE r.user_id = %(user_id)s AND r.mes = %(mes)s AND c.casa_de_aposta IS DISTINCT FROM 'pessoal'
+            GROUP BY r.conta_id, c.nome ORDER BY c.nome
+        """, {'apostas': TIPOS_APOSTA, 'user_id': user_id, 'mes': start_date.date()})
+        analysis = [{'name': row['nome'], 'profit': float(row['profit']), 'wagered': float(row['wagered']), 'betCount': row['bet_count']} for row in cursor.fetchall()]
+
+        cursor.execute("SELECT t.id, t.conta_id, t.valor, t.descricao, t.data_criacao, c.nome as nome_conta, c.casa_de_aposta FROM transacoes t JOIN contas c ON t.conta_id = c.id WHERE t.user_id = %s AND t.tipo = 'expense' AND t.data_criacao >= %s AND t.data_criacao < %s", (user_id, start_date, end_date))
+        expenses = [dict(row) for row in cursor.fetchall()]
+
     report_data = {
         'summary': {
-            'netProfit': float(net_profit), 
-            'totalExpenses': float(total_expenses), 
-            'totalPayments': float(total_payments) 
+            'netProfit': float(summary['net_profit'] or 0), 
+            'totalExpenses': float(summary['total_expenses'] or 0), 
+            'totalPayments': float(summary['total_payments'] or 0) 
         },
-        'accountAnalysis': list(analysis.values()),
-        'expenses': [t for t in transacoes if t['tipo'] == 'expense']
+        'accountAnalysis': analysis,
+        'expenses': expenses
     }
     return jsonify(report_data)
 
@@ -360,18 +1724,196 @@ def registrar_pagamento(conta_id):
     db = get_db()
     try:
         with db.cursor() as cursor:
+            versao = nova_versao(cursor, user_id)
             periodo_pago = datetime.now().strftime('%Y-%m')
-            cursor.execute("UPDATE contas SET ultimo_periodo_pago = %s WHERE id = %s AND user_id = %s", (periodo_pago, conta_id, user_id))
+            cursor.execute("UPDATE contas SET ultimo_periodo_pago = %s, versao = %s WHERE id = %s AND user_id = %s", (periodo_pago, versao, conta_id, user_id))
             rowcount = cursor.rowcount
-        db.commit()
         if rowcount > 0:
-            return jsonify({'message': 'Pagamento registrado com sucesso!'})
+            resposta = resposta_escrita(db, user_id, versao, message='Pagamento registrado com sucesso!')
+            db.commit()
+            return jsonify(resposta)
         else:
+            db.rollback()
             return jsonify({'error': 'Conta não encontrada'}), 404
     except Exception as e:
         db.rollback()
         return jsonify({'error': str(e)}), 500
 
+RESTORE_BATCH_SIZE = int(os.environ.get('RESTORE_BATCH_SIZE', 5000))
+RESTORE_MAX_ERROS = 50  # detalhes de erro devolvidos na validação
+
+CONTAS_COLUNAS = ('id', 'user_id', 'nome', 'casa_de_aposta', 'saldo', 'saldo_freebets', 'meta', 'volume_clube', 'dia_pagamento',
+                  'valor_pagamento', 'observacoes', 'ultimo_periodo_pago', 'ativa', 'data_ultimo_codigo')
+TRANSACOES_COLUNAS = ('id', 'conta_id', 'user_id', 'tipo', 'valor', 'descricao', 'detalhes', 'data_criacao')
+
+def _abrir_backup(stream):
+    """Prepara o arquivo enviado para leitura incremental: descompacta gzip e detecta json/ndjson."""
+    if stream.read(2) == b'\x1f\x8b':
+        stream.seek(0)
+        stream = gzip.GzipFile(fileobj=stream)
+    stream.seek(0)
+    primeira_linha = stream.readline()
+    stream.seek(0)
+    try:
+        cabecalho = json.loads(primeira_linha)
+        formato = 'ndjson' if isinstance(cabecalho, dict) and 'contas' not in cabecalho else 'json'
+    except ValueError:
+        formato = 'json'  # JSON indentado: a primeira linha sozinha não é um documento
+    return stream, formato
+
+def _registros_backup(stream, formato):
+    """Gera ('conta' | 'transacao', dict) conforme lê o backup, sem carregá-lo inteiro."""
+    if formato == 'ndjson':
+        for linha in io.TextIOWrapper(stream, encoding='utf-8'):
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            for chave in ('conta', 'transacao'):
+                if chave in registro:
+                    yield chave, registro[chave]
+        return
+    prefixos = {'contas.item': 'conta', 'transacoes.item': 'transacao'}
+    eventos = ijson.parse(stream, use_float=True)
+    for prefixo, evento, valor in eventos:
+        if prefixo in prefixos and evento == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(evento, valor)
+            for p, e, v in eventos:
+                builder.event(e, v)
+                if p == prefixo and e == 'end_map':
+                    break
+            yield prefixos[prefixo], builder.value
+
+def _valor_csv(valor):
+    # No COPY em CSV, campo vazio sem aspas é NULL e qualquer valor entre aspas é literal
+    if valor is None:
+        return ''
+    return '"' + str(valor).replace('"', '""') + '"'
+
+def _copy_lote(cursor, tabela, colunas, linhas):
+    if e_sqlite(cursor):
+        # Sem COPY no SQLite: um INSERT preparado executado por linha, dentro da mesma transação
+        cursor.executemany(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})", linhas)
+        return
+    buffer = io.StringIO()
+    for linha in linhas:
+        buffer.write(','.join(_valor_csv(v) for v in linha))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def restaurar_backup(cursor, user_id, stream, dry_run=False, progresso=None):
+    """Substitui os dados do usuário pelos do backup, em lotes via COPY e na transação do cursor.
+    Com dry_run apenas lê e valida o arquivo. Retorna contagens, tempo e erros encontrados.
+    Transações de meses arquivados são recusadas; o resumo_mensal desses meses é preservado.
+    `progresso(etapa=, contas=, transacoes=)`, se informado, é chamado a cada lote."""
+    inicio = time.monotonic()
+    stream, formato = _abrir_backup(stream)
+    contagem = {'conta': 0, 'transacao': 0}
+    contas_ids, contas_nomes, erros = set(), set(), []
+    lotes = {'conta': [], 'transacao': []}
+    meses, meses_com_particao = set(), set()  # 'AAAA-MM' das transações lidas / com partição garantida
+    agora = datetime.now()  # data_criacao de transações sem data (a coluna é NOT NULL)
+    # Meses arquivados não voltam para as partições vivas: ficariam abaixo do limite do arquivo, fora do
+    # resumo_mensal reconstruído e no caminho de um próximo transacoes-arquivar
+    fim_arquivo = _fim_arquivo(cursor)
+
+    def descarregar(tipo):
+        if lotes[tipo] and not dry_run:
+            if tipo == 'conta':
+                _copy_lote(cursor, 'contas', CONTAS_COLUNAS, lotes[tipo])
+            else:
+                # Meses antigos do backup ganham partição própria em vez de irem para transacoes_padrao
+                if not e_sqlite(cursor):
+                    for mes in sorted(meses - meses_com_particao):
+                        cursor.execute("SELECT criar_particao_transacoes(%s)", (f'{mes}-01',))
+                        meses_com_particao.add(mes)
+                _copy_lote(cursor, 'transacoes', TRANSACOES_COLUNAS, lotes[tipo])
+        lotes[tipo] = []
+        if progresso:
+            progresso(etapa='lendo', contas=contagem['conta'], transacoes=contagem['transacao'])
+
+    resumo_arquivado = []
+    if not dry_run:
+        if fim_arquivo is not None:
+            # Os totais dos meses arquivados só existem no resumo_mensal, que o DELETE de contas apaga em cascata
+            cursor.execute("""SELECT user_id, conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade
+                              FROM resumo_mensal WHERE user_id = %s AND mes < %s""", (user_id, fim_arquivo))
+            resumo_arquivado = [tuple(row) for row in cursor.fetchall()]
+        # Substituição completa: clientes com versão anterior a esta recebem a carga inteira
+        cursor.execute("UPDATE usuarios SET versao = versao + 1, versao_reset = versao + 1 WHERE id = %s", (user_id,))
+        cursor.execute("DELETE FROM exclusoes WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM operacoes WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM transacoes WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM contas WHERE user_id = %s", (user_id,))
+    for tipo, registro in _registros_backup(stream, formato):
+        contagem[tipo] += 1
+        if tipo == 'conta':
+            if registro.get('id') is None or not registro.get('nome'):
+                erro = 'conta sem id ou nome'
+            elif registro['nome'] in contas_nomes:
+                erro = f"nome de conta repetido: {registro['nome']}"
+            else:
+                erro = None
+                contas_ids.add(int(registro['id']))
+                contas_nomes.add(registro['nome'])
+                linha = tuple(user_id if c == 'user_id' else registro.get(c) for c in CONTAS_COLUNAS)
+        else:
+            if registro.get('id') is None or registro.get('tipo') is None or registro.get('valor') is None:
+                erro = 'transação sem id, tipo ou valor'
+            elif registro.get('conta_id') not in contas_ids:
+                erro = f"transação {registro.get('id')} referencia a conta {registro.get('conta_id')}, ausente do backup (ou listada depois das transações)"
+            elif fim_arquivo is not None and registro.get('data_criacao') and _como_datetime(registro['data_criacao']) < fim_arquivo:
+                erro = f"transação {registro['id']} é de um mês arquivado (anterior a {fim_arquivo.date()})"
+            else:
+                erro = None
+                detalhes, data_criacao = registro.get('detalhes'), registro.get('data_criacao') or agora
+                meses.add(str(data_criacao)[:7])
+                linha = (registro['id'], registro['conta_id'], user_id, registro['tipo'], registro['valor'], registro.get('descricao'),
+                         json.dumps(detalhes) if detalhes is not None else None, data_criacao)
+        if erro:
+            if len(erros) < RESTORE_MAX_ERROS:
+                erros.append({'registro': tipo, 'posicao': contagem[tipo], 'erro': erro})
+            continue
+        if not erros:
+            lotes[tipo].append(linha)
+            if len(lotes[tipo]) >= RESTORE_BATCH_SIZE:
+                if tipo == 'transacao':
+                    descarregar('conta')
+                descarregar(tipo)
+    if not erros and not dry_run:
+        descarregar('conta')
+        descarregar('transacao')
+        if progresso:
+            progresso(etapa='finalizando', contas=contagem['conta'], transacoes=contagem['transacao'])
+        # Os ids vieram explícitos do backup: as sequences precisam andar até o maior id
+        # (no SQLite, AUTOINCREMENT já acompanha o maior id inserido)
+        if not e_sqlite(cursor):
+            for tabela in ('contas', 'transacoes'):
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), GREATEST((SELECT MAX(id) FROM {tabela}), 1))")
+        sincronizar_operacoes(cursor, user_id)
+        reconstruir_resumo(cursor, user_id)
+        resumo_arquivado = [linha for linha in resumo_arquivado if linha[1] in contas_ids]
+        if resumo_arquivado:
+            execute_values(cursor, "INSERT INTO resumo_mensal (user_id, conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade) VALUES %s",
+                           resumo_arquivado, page_size=len(resumo_arquivado))
+    segundos = time.monotonic() - inicio
+    total = contagem['conta'] + contagem['transacao']
+    return {'formato': formato, 'contas': contagem['conta'], 'transacoes': contagem['transacao'], 'erros': erros,
+            'segundos': round(segundos, 3), 'linhasPorSegundo': round(total / segundos) if segundos else total}
+
+def processar_restore(db, user_id, stream, dry_run=False, progresso=None):
+    """Executa o restore em uma transação e monta a resposta do /api/restore: (corpo, status HTTP)."""
+    with db: # Gerencia transação
+        with db.cursor() as cursor:
+            stats = restaurar_backup(cursor, user_id, stream, dry_run=dry_run, progresso=progresso)
+            if stats['erros'] and not dry_run:
+                db.rollback()
+                return {'error': 'Backup inválido, nada foi restaurado', 'stats': stats}, 400
+    if dry_run:
+        return {'message': f"Backup válido: {stats['contas']} contas e {stats['transacoes']} transações" if not stats['erros'] else 'Backup com erros', 'stats': stats}, 200
+    return {'message': f"{stats['contas']} contas e {stats['transacoes']} transações restauradas com sucesso!", 'stats': stats}, 200
+
 @app.route('/api/restore', methods=['POST'])
 @login_required
 def restore_backup():
@@ -381,29 +1923,115 @@ def restore_backup():
     file = request.files['backupFile']
     if file.filename == '':
         return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+    dry_run = (request.form.get('dryRun') or request.args.get('dryRun')) in ('1', 'true')
+    if _pedido_assincrono():
+        return enfileirar_job(user_id, 'restore', {'dryRun': dry_run}, entrada=file)
     try:
-        backup_data = json.load(file)
-        contas = backup_data.get('contas', [])
-        transacoes = backup_data.get('transacoes', [])
-        db = get_db()
-        with db: # Gerencia transação
-            with db.cursor() as cursor:
-                cursor.execute("DELETE FROM transacoes WHERE user_id = %s", (user_id,))
-                cursor.execute("DELETE FROM contas WHERE user_id = %s", (user_id,))
-                for conta in contas:
-                    cursor.execute("""
-                        INSERT INTO contas (id, user_id, nome, casa_de_aposta, saldo, saldo_freebets, meta, volume_clube, dia_pagamento, valor_pagamento, observacoes, ultimo_periodo_pago, ativa, data_ultimo_codigo)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (conta.get('id'), user_id, conta.get('nome'), conta.get('casa_de_aposta'), conta.get('saldo'), conta.get('saldo_freebets'), conta.get('meta'), conta.get('volume_clube'), conta.get('dia_pagamento'), conta.get('valor_pagamento'), conta.get('observacoes'), conta.get('ultimo_periodo_pago'), conta.get('ativa'), conta.get('data_ultimo_codigo')))
-                for transacao in transacoes:
-                     cursor.execute("""
-                        INSERT INTO transacoes (id, conta_id, user_id, tipo, valor, descricao, detalhes, data_criacao)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (transacao.get('id'), transacao.get('conta_id'), user_id, transacao.get('tipo'), transacao.get('valor'), transacao.get('descricao'), json.dumps(transacao.get('detalhes')), transacao.get('data_criacao')))
-        return jsonify({'message': f'{len(contas)} contas e {len(transacoes)} transações restauradas com sucesso!'})
+        corpo, status = processar_restore(get_db(), user_id, file.stream, dry_run=dry_run)
+        return jsonify(corpo), status
     except Exception as e:
         return jsonify({'error': f'Erro ao processar o backup: {str(e)}'}), 500
 
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERROS = 100  # detalhes de linhas rejeitadas devolvidos na resposta
+
+IMPORT_COLUNAS = ('nome', 'casa_de_aposta', 'saldo', 'saldo_freebets', 'dia_pagamento', 'valor_pagamento', 'observacoes', 'data_ultimo_codigo')
+
+def _coagir_conta_csv(conta_data):
+    """Converte uma linha do CSV para os tipos da tabela contas (ValueError se inválida)."""
+    nome = (conta_data.get('nome') or '').strip()
+    if not nome:
+        raise ValueError('nome vazio')
+    def numero(campo, padrao=None):
+        valor = (conta_data.get(campo) or '').strip()
+        if not valor:
+            return padrao
+        if ',' in valor and '.' not in valor:  # aceita decimal com vírgula (1,5)
+            valor = valor.replace(',', '.')
+        try:
+            return float(valor)
+        except ValueError:
+            raise ValueError(f'{campo} inválido: {valor}')
+    dia_pagamento = numero('dia_pagamento')
+    if dia_pagamento is not None and not (1 <= dia_pagamento <= 31 and dia_pagamento == int(dia_pagamento)):
+        raise ValueError(f"dia_pagamento inválido: {conta_data.get('dia_pagamento')}")
+    data_ultimo_codigo = (conta_data.get('data_ultimo_codigo') or '').strip() or None
+    if data_ultimo_codigo:
+        try:
+            data_ultimo_codigo = datetime.strptime(data_ultimo_codigo, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f'data_ultimo_codigo inválida (use AAAA-MM-DD): {data_ultimo_codigo}')
+    return (nome, conta_data.get('casa_de_aposta') or None, numero('saldo', 0.0), numero('saldo_freebets', 0.0),
+            int(dia_pagamento) if dia_pagamento is not None else None, numero('valor_pagamento'),
+            conta_data.get('observacoes') or None, data_ultimo_codigo)
+
+def _upsert_contas(cursor, user_id, versao, linhas):
+    """Cria ou atualiza um lote de contas em um único INSERT ... ON CONFLICT. Retorna (criadas, atualizadas)."""
+    sql = f"""
+        INSERT INTO contas (user_id, versao, {', '.join(IMPORT_COLUNAS)}) VALUES %s
+        ON CONFLICT (user_id, nome) DO UPDATE SET versao = EXCLUDED.versao,
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in IMPORT_COLUNAS if c != 'nome')}
+    """
+    valores = [(user_id, versao) + linha for linha in linhas]
+    if e_sqlite(cursor):
+        # Sem xmax no SQLite: as atualizadas são as que já existiam (a escrita já está serializada aqui)
+        cursor.execute("SELECT COUNT(*) FROM contas WHERE user_id = %s AND nome = ANY(%s)", (user_id, [linha[0] for linha in linhas]))
+        atualizadas = cursor.fetchone()[0]
+        execute_values(cursor, sql, valores, page_size=len(linhas))
+        return len(linhas) - atualizadas, atualizadas
+    resultado = execute_values(cursor, sql + "RETURNING (xmax = 0) AS criada", valores, page_size=len(linhas), fetch=True)
+    criadas = sum(1 for (criada,) in resultado if criada)
+    return criadas, len(resultado) - criadas
+
+def importar_contas_csv(cursor, user_id, stream, progresso=None):
+    """Lê o CSV em streaming e aplica as contas em upserts por lote. Retorna contagens e erros por linha.
+    `progresso(linhas=, criadas=, atualizadas=, rejeitadas=)`, se informado, é chamado a cada lote."""
+    stats = {'criadas': 0, 'atualizadas': 0, 'rejeitadas': 0, 'erros': []}
+    versao = nova_versao(cursor, user_id)
+    def rejeitar(linha, erro):
+        stats['rejeitadas'] += 1
+        if len(stats['erros']) < IMPORT_MAX_ERROS:
+            stats['erros'].append({'linha': linha, 'erro': erro})
+    def aplicar(lote):
+        if lote:
+            criadas, atualizadas = _upsert_contas(cursor, user_id, versao, list(lote.values()))
+            stats['criadas'] += criadas
+            stats['atualizadas'] += atualizadas
+            lote.clear()
+
+    csv_reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    lote = {}  # nome -> linha; um mesmo upsert não pode tocar a mesma conta duas vezes
+    linhas_do_lote = {}
+    for conta_data in csv_reader:
+        try:
+            linha = _coagir_conta_csv(conta_data)
+        except ValueError as e:
+            rejeitar(csv_reader.line_num, str(e))
+            continue
+        if linha[0] in lote:
+            rejeitar(linhas_do_lote[linha[0]], f'nome repetido no arquivo (vale a linha {csv_reader.line_num})')
+        lote[linha[0]] = linha
+        linhas_do_lote[linha[0]] = csv_reader.line_num
+        if len(lote) >= IMPORT_BATCH_SIZE:
+            aplicar(lote)
+            linhas_do_lote.clear()
+            if progresso:
+                progresso(linhas=csv_reader.line_num, criadas=stats['criadas'], atualizadas=stats['atualizadas'], rejeitadas=stats['rejeitadas'])
+    aplicar(lote)
+    # O saldo do CSV substitui o das contas sem passar pelo ledger: elas são ancoradas de novo nele
+    reancorar_saldos(cursor, user_id, versao)
+    return stats
+
+def processar_import_csv(db, user_id, stream, progresso=None):
+    """Importa o CSV em uma transação e monta a resposta do /api/import-csv."""
+    with db: # Gerencia transação
+        with db.cursor() as cursor:
+            stats = importar_contas_csv(cursor, user_id, stream, progresso=progresso)
+    message = f"{stats['criadas']} contas criadas e {stats['atualizadas']} atualizadas com sucesso!"
+    if stats['rejeitadas']:
+        message += f" {stats['rejeitadas']} linhas rejeitadas."
+    return dict(stats, message=message)
+
 @app.route('/api/import-csv', methods=['POST'])
 @login_required
 def import_csv():
@@ -413,36 +2041,10 @@ def import_csv():
     file = request.files['csvFile']
     if file.filename == '':
         return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+    if _pedido_assincrono():
+        return enfileirar_job(user_id, 'import-csv', {}, entrada=file)
     try:
-        stream = io.StringIO(file.stream.read().decode("UTF-8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        contas_para_processar = list(csv_reader)
-        criadas = 0
-        atualizadas = 0
-        db = get_db()
-        with db: # Gerencia transação
-            with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                for conta_data in contas_para_processar:
-                    nome = conta_data.get('nome')
-                    if not nome: continue
-                    cursor.execute("SELECT id FROM contas WHERE nome = %s AND user_id = %s", (nome, user_id))
-                    conta_existente = cursor.fetchone()
-                    dados = {
-                        "nome": nome, "casa_de_aposta": conta_data.get('casa_de_aposta') or None, "saldo": float(conta_data.get('saldo') or 0), "saldo_freebets": float(conta_data.get('saldo_freebets') or 0), "dia_pagamento": int(conta_data.get('dia_pagamento')) if conta_data.get('dia_pagamento') else None, "valor_pagamento": float(conta_data.get('valor_pagamento')) if conta_data.get('valor_pagamento') else None, "observacoes": conta_data.get('observacoes') or None, "data_ultimo_codigo": conta_data.get('data_ultimo_codigo') or None,
-                    }
-                    if conta_existente:
-                        cursor.execute("""
-                            UPDATE contas SET casa_de_aposta=%s, saldo=%s, saldo_freebets=%s, dia_pagamento=%s, valor_pagamento=%s, observacoes=%s, data_ultimo_codigo=%s
-                            WHERE id = %s AND user_id = %s
-                        """, (dados['casa_de_aposta'], dados['saldo'], dados['saldo_freebets'], dados['dia_pagamento'], dados['valor_pagamento'], dados['observacoes'], dados['data_ultimo_codigo'], conta_existente['id'], user_id))
-                        atualizadas += 1
-                    else:
-                        cursor.execute("""
-                            INSERT INTO contas (user_id, nome, casa_de_aposta, saldo, saldo_freebets, dia_pagamento, valor_pagamento, observacoes, data_ultimo_codigo)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (user_id, dados['nome'], dados['casa_de_aposta'], dados['saldo'], dados['saldo_freebets'], dados['dia_pagamento'], dados['valor_pagamento'], dados['observacoes'], dados['data_ultimo_codigo']))
-                        criadas += 1
-        return jsonify({'message': f'{criadas} contas criadas e {atualizadas} atualizadas com sucesso!'})
+        return jsonify(processar_import_csv(get_db(), user_id, file.stream))
     except Exception as e:
         return jsonify({'error': f'Erro ao processar o CSV: {str(e)}'}), 500
         
@@ -456,5 +2058,688 @@ def csv_template():
         headers={"Content-disposition": "attachment; filename=modelo_contas.csv"}
     )
 
+# --- Saldos em Qualquer Data (snapshots periódicos + delta do ledger) ---
+SALDOS_SNAPSHOT_INTERVALO = os.environ.get('SALDOS_SNAPSHOT_INTERVALO', 'month')  # day | week | month
+if SALDOS_SNAPSHOT_INTERVALO not in ('day', 'week', 'month'):
+    raise ValueError(f'SALDOS_SNAPSHOT_INTERVALO inválido: {SALDOS_SNAPSHOT_INTERVALO}')
+SALDOS_SNAPSHOT_MARGEM = 3600  # segundos: um período só é fechado depois disso (data_criacao é o início da transação que grava)
+SALDOS_CURVA_MAX_PONTOS = 400
+SALDOS_TOLERANCIA = 0.005  # diferença mínima para a conciliação apontar divergência
+SALDOS_SNAPSHOT_MANUTENCAO = 3600.0  # segundos entre as gravações de snapshots feitas pela manutenção dos jobs
+
+# Snapshot mais recente de cada conta com em {op} {ate} (o de abertura, -infinity, sempre serve). Sem LATERAL
+# nem generate_series, que o SQLite não tem: os fragmentos abaixo entram no FROM de consultas sobre contas c
+_SQL_SNAPSHOT_ANTERIOR = """
+    JOIN saldos_snapshot s ON s.conta_id = c.id
+     AND s.em = (SELECT MAX(x.em) FROM saldos_snapshot x WHERE x.conta_id = c.id AND x.em {op} {ate})
+"""
+# Movimento de cada conta em [de, ate), agregado com GROUP BY por conta: SUM(t.valor) soma no saldo e
+# SUM(a.stake) (apostas com freebet) sai do saldo_freebets
+_SQL_DELTA_SALDO = """
+    LEFT JOIN transacoes t ON t.conta_id = c.id AND t.data_criacao >= {de} AND t.data_criacao < {ate}
+    LEFT JOIN apostas a ON a.transacao_id = t.id AND t.tipo = 'bet_placed' AND a.is_freebet
+"""
+# Saldo de cada conta em {ate} para as consultas, que não gravam: snapshot mais recente + delta até {ate}.
+# Contas ainda não ancoradas (sem snapshot; `saldos-snapshot` ou a manutenção dos jobs as ancoram) partem do
+# saldo atual menos o que o ledger registrou a partir de {ate}. Entra no FROM, com GROUP BY por conta e
+# _SQL_SALDO_COLUNAS no SELECT
+_SQL_SALDO_EM = """
+    LEFT JOIN saldos_snapshot s ON s.conta_id = c.id
+     AND s.em = (SELECT MAX(x.em) FROM saldos_snapshot x WHERE x.conta_id = c.id AND x.em <= {ate})
+    LEFT JOIN transacoes t ON t.conta_id = c.id
+     AND ((t.data_criacao >= s.em AND t.data_criacao < {ate}) OR (s.conta_id IS NULL AND t.data_criacao >= {ate}))
+    LEFT JOIN apostas a ON a.transacao_id = t.id AND t.tipo = 'bet_placed' AND a.is_freebet
+"""
+_SQL_SALDO_COLUNAS = """
+    CASE WHEN s.conta_id IS NULL THEN COALESCE(c.saldo, 0) - COALESCE(SUM(t.valor), 0) ELSE s.saldo + COALESCE(SUM(t.valor), 0) END AS saldo,
+    CASE WHEN s.conta_id IS NULL THEN COALESCE(c.saldo_freebets, 0) + COALESCE(SUM(a.stake), 0)
+         ELSE s.saldo_freebets - COALESCE(SUM(a.stake), 0) END AS saldo_freebets
+"""
+_SQL_SALDO_GRUPO = 'c.saldo, c.saldo_freebets, s.conta_id, s.em, s.saldo, s.saldo_freebets'
+
+def _filtro_contas(user_id):
+    return ('c.user_id = %(user_id)s', {'user_id': user_id}) if user_id is not None else ('TRUE', {})
+
+def _como_datetime(valor):
+    """Instantes calculados no SQL: o SQLite os devolve como texto, e MAX(fim) de transacoes_arquivadas é uma data."""
+    if isinstance(valor, str):
+        return datetime.fromisoformat(valor)
+    if valor is not None and not isinstance(valor, datetime):
+        return datetime.combine(valor, datetime.min.time())
+    return valor
+
+def _inicio_periodo(instante, intervalo):
+    """date_trunc(intervalo, instante) para day | week | month."""
+    dia = instante.date()
+    if intervalo == 'month':
+        dia = dia.replace(day=1)
+    elif intervalo == 'week':
+        dia -= timedelta(days=dia.weekday())
+    return datetime.combine(dia, datetime.min.time())
+
+def _proximo_periodo(inicio, intervalo):
+    if intervalo == 'month':
+        return inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+    return inicio + timedelta(days=7 if intervalo == 'week' else 1)
+
+def _periodos(inicio, fim, intervalo):
+    """Inícios de período de `inicio` (já truncado) até antes de `fim`."""
+    while inicio < fim:
+        yield inicio
+        inicio = _proximo_periodo(inicio, intervalo)
+
+def _fim_arquivo(cursor):
+    """Fim (exclusivo) do último mês arquivado, ou None."""
+    cursor.execute("SELECT MAX(fim) FROM transacoes_arquivadas")
+    return _como_datetime(cursor.fetchone()[0])
+
+def ancorar_saldos(cursor, user_id=None):
+    """Cria o snapshot de abertura das contas que ainda não têm nenhum: o saldo atual menos tudo o que o
+    ledger registrou. As contas ficam travadas para que saldo e ledger sejam lidos no mesmo estado (toda
+    escrita atualiza contas antes de gravar em transacoes). Retorna quantas contas foram ancoradas."""
+    filtro, params = _filtro_contas(user_id)
+    cursor.execute(f"""
+        SELECT c.id FROM contas c
+        WHERE {filtro} AND NOT EXISTS (SELECT 1 FROM saldos_snapshot s WHERE s.conta_id = c.id)
+        ORDER BY c.id FOR UPDATE
+    """, params)
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return 0
+    cursor.execute(f"""
+        INSERT INTO saldos_snapshot (conta_id, user_id, em, saldo, saldo_freebets)
+        SELECT c.id, c.user_id, '-infinity', COALESCE(c.saldo, 0) - COALESCE(SUM(t.valor), 0), COALESCE(c.saldo_freebets, 0) + COALESCE(SUM(a.stake), 0)
+        FROM contas c {_SQL_DELTA_SALDO.format(de="'-infinity'", ate="'infinity'")}
+        WHERE c.id = ANY(%(ids)s)
+        GROUP BY c.id, c.user_id, c.saldo, c.saldo_freebets
+        ON CONFLICT (conta_id, em) DO NOTHING
+    """, {'ids': ids})
+    return cursor.rowcount
+
+def reancorar_saldos(cursor, user_id, versao):
+    """Refaz a abertura das contas do usuário gravadas na `versao` com saldo definido fora do ledger (importação
+    de CSV): os snapshots delas são descartados e a nova abertura é o saldo atual menos o ledger. Os saldos por
+    data passam a partir do saldo importado, e a conciliação não aponta a mudança como divergência."""
+    cursor.execute("DELETE FROM saldos_snapshot WHERE conta_id IN (SELECT id FROM contas WHERE user_id = %s AND versao = %s)", (user_id, versao))
+    return ancorar_saldos(cursor, user_id)
+
+def _snapshot_em(cursor, em, user_id=None):
+    """Grava o snapshot em `em` das contas que ainda não o têm: o snapshot anterior mais o delta até `em`."""
+    filtro, params = _filtro_contas(user_id)
+    cursor.execute(f"""
+        INSERT INTO saldos_snapshot (conta_id, user_id, em, saldo, saldo_freebets)
+        SELECT c.id, c.user_id, %(em)s, s.saldo + COALESCE(SUM(t.valor), 0), s.saldo_freebets - COALESCE(SUM(a.stake), 0)
+        FROM contas c
+        {_SQL_SNAPSHOT_ANTERIOR.format(op='<', ate='%(em)s')}
+        {_SQL_DELTA_SALDO.format(de='s.em', ate='%(em)s')}
+        WHERE {filtro} AND NOT EXISTS (SELECT 1 FROM saldos_snapshot x WHERE x.conta_id = c.id AND x.em = %(em)s)
+        GROUP BY c.id, c.user_id, s.saldo, s.saldo_freebets
+        ON CONFLICT (conta_id, em) DO NOTHING
+    """, dict(params, em=em))
+    return cursor.rowcount
+
+def gravar_snapshots(cursor, user_id=None):
+    """Ancora as contas novas e fecha os períodos terminados desde o último snapshot de cada conta.
+    Em regime, quando não há período novo, custa duas consultas. Retorna quantos snapshots foram criados."""
+    criados = ancorar_saldos(cursor, user_id)
+    filtro, params = _filtro_contas(user_id)
+    # Começa do snapshot periódico mais antigo entre os "últimos" de cada conta; contas sem nenhum começam
+    # na primeira transação do usuário
+    cursor.execute(f"""
+        SELECT MIN(COALESCE((SELECT MAX(s.em) FROM saldos_snapshot s WHERE s.conta_id = c.id AND s.em > '-infinity'),
+                            (SELECT MIN(t.data_criacao) FROM transacoes t WHERE t.user_id = c.user_id))),
+               LOCALTIMESTAMP - make_interval(secs => %(margem)s)
+        FROM contas c WHERE {filtro}
+    """, dict(params, margem=SALDOS_SNAPSHOT_MARGEM))
+    inicio, fechado_ate = (_como_datetime(valor) for valor in cursor.fetchone())
+    if inicio is None or inicio == datetime.min:
+        # Nenhuma transação nem snapshot periódico (contas recém-criadas ou importadas): o de abertura basta.
+        # Nunca começar de '-infinity', o que geraria um período por mês desde o ano 1
+        return criados
+    # Meses arquivados não são recalculados (o snapshot do limite já existe)
+    fim_arquivo = _fim_arquivo(cursor)
+    if fim_arquivo is not None:
+        inicio = max(inicio, fim_arquivo)
+    i = SALDOS_SNAPSHOT_INTERVALO
+    limite = _proximo_periodo(_inicio_periodo(fechado_ate, i), i)
+    for em in _periodos(_proximo_periodo(_inicio_periodo(inicio, i), i), limite, i):
+        criados += _snapshot_em(cursor, em, user_id)
+    return criados
+
+def desfazer_em_snapshots(cursor, linhas):
+    """Tira dos snapshots posteriores o efeito de transações apagadas (reversões), para que continuem
+    iguais ao ledger. `linhas`: [(conta_id, data_criacao, valor, stake devolvida ao saldo de freebets)]."""
+    if linhas:
+        execute_values(cursor, """
+            UPDATE saldos_snapshot s SET saldo = s.saldo - d.valor, saldo_freebets = s.saldo_freebets + d.freebet
+            FROM (SELECT x.conta_id, x.em, SUM(v.valor) AS valor, SUM(v.freebet) AS freebet
+                  FROM saldos_snapshot x JOIN (VALUES %s) v(conta_id, data_criacao, valor, freebet)
+                    ON x.conta_id = v.conta_id AND x.em > v.data_criacao
+                  GROUP BY x.conta_id, x.em) d
+            WHERE s.conta_id = d.conta_id AND s.em = d.em
+        """, linhas, template='(%s::int, %s::timestamp, %s::numeric, %s::numeric)', page_size=len(linhas))
+
+def saldos_em(cursor, user_id, em):
+    """Saldo de cada conta do usuário no instante `em` (transações com data_criacao < em). Só lê."""
+    cursor.execute(f"""
+        SELECT c.id, c.nome, c.casa_de_aposta, c.ativa, {_SQL_SALDO_COLUNAS}, s.em
+        FROM contas c
+        {_SQL_SALDO_EM.format(ate='%(em)s')}
+        WHERE c.user_id = %(user_id)s
+        GROUP BY c.id, c.nome, c.casa_de_aposta, c.ativa, {_SQL_SALDO_GRUPO}
+        ORDER BY c.id
+    """, {'user_id': user_id, 'em': em})
+    return [{'id': row['id'], 'nome': row['nome'], 'casa_de_aposta': row['casa_de_aposta'], 'ativa': row['ativa'],
+             'saldo': row['saldo'], 'saldo_freebets': row['saldo_freebets'],
+             'snapshot_em': row['em'] if row['em'] != datetime.min else None}  # o de abertura é -infinity; sem âncora, None
+            for row in cursor.fetchall()]
+
+def curva_saldos(cursor, user_id, de, ate, intervalo, conta_id=None):
+    """Saldo de cada conta ao fim de cada período (day/week/month) entre `de` e `ate`: o saldo no início do
+    primeiro período (snapshot + delta) mais a soma acumulada dos movimentos agregados por período. Só lê."""
+    params = {'user_id': user_id, 'de': de, 'ate': ate, 'intervalo': intervalo, 'conta_id': conta_id}
+    cursor.execute(f"""
+        SELECT c.id, {_SQL_SALDO_COLUNAS}
+        FROM contas c
+        {_SQL_SALDO_EM.format(ate='%(de)s')}
+        WHERE c.user_id = %(user_id)s {'AND c.id = %(conta_id)s' if conta_id is not None else ''}
+        GROUP BY c.id, {_SQL_SALDO_GRUPO}
+        ORDER BY c.id
+    """, params)
+    base = cursor.fetchall()
+    cursor.execute("""
+        SELECT t.conta_id, date_trunc(%(intervalo)s, t.data_criacao) AS periodo, SUM(t.valor) AS valor, SUM(a.stake) AS freebet
+        FROM transacoes t LEFT JOIN apostas a ON a.transacao_id = t.id AND t.tipo = 'bet_placed' AND a.is_freebet
+        WHERE t.user_id = %(user_id)s AND t.data_criacao >= %(de)s AND t.data_criacao < %(ate)s
+        GROUP BY 1, 2
+    """, params)
+    movimentos = {(conta, _como_datetime(periodo)): (valor, freebet or 0) for conta, periodo, valor, freebet in cursor.fetchall()}
+    periodos = list(_periodos(de, ate, intervalo))
+    linhas = []
+    for conta, saldo, saldo_freebets in base:
+        for periodo in periodos:
+            valor, freebet = movimentos.get((conta, periodo), (0, 0))
+            saldo, saldo_freebets = saldo + valor, saldo_freebets - freebet
+            linhas.append({'conta_id': conta, 'periodo': periodo.date(), 'saldo': saldo, 'saldo_freebets': saldo_freebets})
+    return linhas
+
+def conciliar_saldos(cursor, user_id=None):
+    """Contas cujo saldo (ou saldo de freebets) difere do ledger: snapshot mais recente + transações desde então.
+    Aponta mudanças feitas fora do ledger depois que a conta foi ancorada (edições diretas no banco); contas ainda
+    não ancoradas não têm referência e não entram."""
+    filtro, params = _filtro_contas(user_id)
+    cursor.execute(f"""
+        SELECT * FROM (
+            SELECT c.id, c.user_id, c.nome, COALESCE(c.saldo, 0) AS saldo, s.saldo + COALESCE(SUM(t.valor), 0) AS saldo_ledger,
+                   COALESCE(c.saldo_freebets, 0) AS saldo_freebets, s.saldo_freebets - COALESCE(SUM(a.stake), 0) AS saldo_freebets_ledger
+            FROM contas c
+            {_SQL_SNAPSHOT_ANTERIOR.format(op='<=', ate="'infinity'")}
+            {_SQL_DELTA_SALDO.format(de='s.em', ate="'infinity'")}
+            WHERE {filtro}
+            GROUP BY c.id, c.user_id, c.nome, c.saldo, c.saldo_freebets, s.saldo, s.saldo_freebets
+        ) x
+        WHERE ABS(saldo - saldo_ledger) > %(tolerancia)s OR ABS(saldo_freebets - saldo_freebets_ledger) > %(tolerancia)s
+        ORDER BY user_id, id
+    """, dict(params, tolerancia=SALDOS_TOLERANCIA))
+    return cursor.fetchall()
+
+def _instante_fim_do_dia(valor, padrao):
+    """'AAAA-MM-DD' -> início do dia seguinte (o saldo "no dia" inclui as transações do dia todo)."""
+    dia = datetime.strptime(valor, '%Y-%m-%d') if valor else padrao
+    return dia.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+def _verificar_fora_do_arquivo(cursor, instante):
+    fim_arquivo = _fim_arquivo(cursor)
+    if fim_arquivo is not None and instante < fim_arquivo:
+        raise ValueError(f'Período arquivado: use datas a partir de {fim_arquivo.date()}')
+
+@app.route('/api/saldos', methods=['GET'])
+@login_required
+def get_saldos():
+    """Saldos das contas ao fim do dia `data` (AAAA-MM-DD, padrão hoje)."""
+    user_id = get_current_user_id()
+    try:
+        em = _instante_fim_do_dia(request.args.get('data'), datetime.now())
+    except ValueError:
+        return jsonify({'error': 'Parâmetros de consulta inválidos'}), 400
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            try:
+                _verificar_fora_do_arquivo(cursor, em)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            contas = saldos_em(cursor, user_id, em)
+    return jsonify({'data': (em - timedelta(days=1)).date().isoformat(), 'contas': contas,
+                    'total': sum(c['saldo'] for c in contas), 'totalFreebets': sum(c['saldo_freebets'] for c in contas)})
+
+@app.route('/api/saldos/curva', methods=['GET'])
+@login_required
+def get_curva_saldos():
+    """Saldo ao fim de cada período entre `de` e `ate` (AAAA-MM-DD; padrão: os últimos 12 meses),
+    com `intervalo` day | week | month (padrão month) e `contaId` opcional."""
+    user_id = get_current_user_id()
+    intervalo = request.args.get('intervalo', 'month')
+    try:
+        if intervalo not in ('day', 'week', 'month'):
+            raise ValueError(intervalo)
+        ate = _instante_fim_do_dia(request.args.get('ate'), datetime.now())
+        de = datetime.strptime(request.args['de'], '%Y-%m-%d') if request.args.get('de') else ate - timedelta(days=365)
+        conta_id = request.args.get('contaId', type=int)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros de consulta inválidos'}), 400
+    # Períodos inteiros: do início do período de `de` ao fim do período de `ate`
+    de = _inicio_periodo(de, intervalo)
+    ate = _proximo_periodo(_inicio_periodo(ate - timedelta(microseconds=1), intervalo), intervalo)
+    if not 0 < sum(1 for _ in islice(_periodos(de, ate, intervalo), SALDOS_CURVA_MAX_PONTOS + 1)) <= SALDOS_CURVA_MAX_PONTOS:
+        return jsonify({'error': f'Intervalo inválido ou com mais de {SALDOS_CURVA_MAX_PONTOS} pontos'}), 400
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            try:
+                _verificar_fora_do_arquivo(cursor, de)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            linhas = curva_saldos(cursor, user_id, de, ate, intervalo, conta_id)
+    contas, total = {}, {}
+    for row in linhas:
+        contas.setdefault(row['conta_id'], []).append({'periodo': row['periodo'].isoformat(), 'saldo': row['saldo'], 'saldoFreebets': row['saldo_freebets']})
+        total[row['periodo']] = total.get(row['periodo'], 0) + row['saldo']
+    return jsonify({'intervalo': intervalo, 'de': de.date().isoformat(), 'ate': (ate - timedelta(days=1)).date().isoformat(),
+                    'contas': [{'id': conta, 'pontos': pontos} for conta, pontos in contas.items()],
+                    'total': [{'periodo': periodo.isoformat(), 'saldo': saldo} for periodo, saldo in total.items()]})
+
+@app.route('/api/saldos/conciliacao', methods=['GET'])
+@login_required
+def get_conciliacao_saldos():
+    user_id = get_current_user_id()
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            divergencias = [dict(row) for row in conciliar_saldos(cursor, user_id)]
+    return jsonify({'divergencias': divergencias, 'ok': not divergencias})
+
+@app.cli.command('saldos-snapshot')
+@click.option('--user-id', type=int, default=None, help='Limita a um usuário.')
+def saldos_snapshot(user_id):
+    """Ancora as contas novas e grava os snapshots de saldo dos períodos já terminados (para rodar no cron)."""
+    db = get_db()
+    with db:
+        with db.cursor() as cursor:
+            criados = gravar_snapshots(cursor, user_id)
+    print(f'{criados} snapshot(s) de saldo gravado(s).')
+
+@app.cli.command('saldos-conciliar')
+@click.option('--user-id', type=int, default=None, help='Limita a um usuário.')
+def saldos_conciliar(user_id):
+    """Lista as contas cujo saldo difere do ledger (snapshot + transações); sai com código 1 se houver alguma."""
+    db = get_db()
+    with db:
+        with db.cursor() as cursor:
+            gravar_snapshots(cursor, user_id)
+            divergencias = conciliar_saldos(cursor, user_id)
+    for conta, user, nome, saldo, ledger, freebets, freebets_ledger in divergencias:
+        print(f'user={user} conta={conta} ({nome}): saldo {saldo} (ledger {ledger}), freebets {freebets} (ledger {freebets_ledger})')
+    print(f'{len(divergencias)} divergência(s) encontrada(s).')
+    if divergencias:
+        raise SystemExit(1)
+
+# --- Tarefas em Segundo Plano (backup, restore e importação de CSV) ---
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))  # threads executoras por processo; 0 = só via `flask jobs-worker`
+JOBS_POR_USUARIO = int(os.environ.get('JOBS_POR_USUARIO', 1))  # tarefas de um mesmo usuário executando ao mesmo tempo
+JOBS_CONCORRENCIA_TOTAL = int(os.environ.get('JOBS_CONCORRENCIA_TOTAL', 4))  # tarefas executando ao mesmo tempo, somando todos os processos
+JOBS_PENDENTES_MAX = int(os.environ.get('JOBS_PENDENTES_MAX', 5))  # tarefas pendentes ou em execução por usuário
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'gestor_jobs'))
+JOBS_RETENCAO_HORAS = float(os.environ.get('JOBS_RETENCAO_HORAS', 24))  # tarefas terminadas (e seus arquivos) são apagadas depois disso
+JOBS_TIMEOUT = float(os.environ.get('JOBS_TIMEOUT', 120))  # segundos sem heartbeat até a tarefa ser dada como interrompida
+JOBS_MAX_TENTATIVAS = 3  # execuções interrompidas voltam para a fila até esse limite
+JOBS_INTERVALO = 2.0  # segundos entre consultas à fila quando não há trabalho
+JOBS_HEARTBEAT = 10.0  # segundos entre heartbeats de uma tarefa em execução
+JOBS_MANUTENCAO = 60.0  # segundos entre as rodadas de limpeza de cada processo
+
+def _dir_job(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+def _pedido_assincrono():
+    return (request.form.get('async') or request.args.get('async')) in ('1', 'true')
+
+def enfileirar_job(user_id, tipo, parametros, entrada=None):
+    """Coloca a tarefa na fila e responde 202 com o id e a URL de status. `entrada` (arquivo enviado)
+    é gravada em JOBS_DIR, de onde o worker a lê."""
+    db = get_db()
+    with db:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM jobs WHERE user_id = %s AND status IN ('pendente', 'executando')", (user_id,))
+            if cursor.fetchone()[0] >= JOBS_PENDENTES_MAX:
+                return jsonify({'error': f'Você já tem {JOBS_PENDENTES_MAX} tarefas na fila; aguarde a conclusão delas'}), 429
+            job_id = uuid.uuid4().hex
+            if entrada is not None:
+                os.makedirs(_dir_job(job_id), exist_ok=True)
+                entrada.save(os.path.join(_dir_job(job_id), 'entrada'))
+            try:
+                cursor.execute("INSERT INTO jobs (id, user_id, tipo, parametros) VALUES (%s, %s, %s, %s)",
+                               (job_id, user_id, tipo, json.dumps(parametros)))
+            except Exception:
+                shutil.rmtree(_dir_job(job_id), ignore_errors=True)
+                raise
+    if JOBS_WORKERS > 0:
+        get_job_runner().acordar()
+    status_url = url_for('status_job', job_id=job_id)
+    return jsonify({'jobId': job_id, 'status': 'pendente', 'statusUrl': status_url}), 202, {'Location': status_url}
+
+def _job_backup(db, job, progresso):
+    formato = job['parametros'].get('format', 'json')
+    nome = f'backup_gestao.{formato}' + ('.gz' if job['parametros'].get('gzip') else '')
+    os.makedirs(_dir_job(job['id']), exist_ok=True)
+    chunks = gerar_backup(db, job['user_id'], formato, progresso)
+    with open(os.path.join(_dir_job(job['id']), nome), 'wb') as saida:
+        if job['parametros'].get('gzip'):
+            for data in _comprimir_gzip(chunks):
+                saida.write(data)
+        else:
+            for chunk in chunks:
+                saida.write(chunk.encode('utf-8'))
+        tamanho = saida.tell()
+    return {'message': 'Backup pronto para download', 'bytes': tamanho}, nome
+
+def _job_restore(db, job, progresso):
+    with open(os.path.join(_dir_job(job['id']), 'entrada'), 'rb') as entrada:
+        corpo, _ = processar_restore(db, job['user_id'], entrada, dry_run=job['parametros'].get('dryRun'), progresso=progresso)
+    return corpo, None
+
+def _job_import_csv(db, job, progresso):
+    with open(os.path.join(_dir_job(job['id']), 'entrada'), 'rb') as entrada:
+        return processar_import_csv(db, job['user_id'], entrada, progresso=progresso), None
+
+# Cada tipo recebe (conexão, job, progresso) e devolve (corpo da resposta, arquivo para download ou None);
+# um corpo com 'error' encerra a tarefa como erro, como a resposta 4xx da rota síncrona.
+JOB_TIPOS = {'backup': _job_backup, 'restore': _job_restore, 'import-csv': _job_import_csv}
+
+class _ExecucaoJob:
+    """Grava heartbeat e progresso de uma tarefa em execução a partir de uma thread auxiliar, com
+    conexões próprias: a conexão da tarefa fica presa na transação do restore até o fim."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.atual = self._gravado = None  # último progresso informado / último gravado
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f'job-{job_id[:8]}', daemon=True)
+
+    def progresso(self, **dados):
+        self.atual = dados
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def _loop(self):
+        ultimo = time.monotonic()
+        while not self._parar.wait(1.0):
+            progresso = self.atual
+            if progresso is self._gravado and time.monotonic() - ultimo < JOBS_HEARTBEAT:
+                continue
+            try:
+                _atualizar_job(self.job_id, "heartbeat_em = LOCALTIMESTAMP, progresso = COALESCE(%s, progresso)",
+                               (json.dumps(progresso) if progresso is not None else None,))
+                self._gravado, ultimo = progresso, time.monotonic()
+            except Exception:
+                app.logger.warning('Falha ao gravar o heartbeat do job %s', self.job_id, exc_info=True)
+
+def _atualizar_job(job_id, atribuicoes, params):
+    pool = get_pool()
+    db = pool.getconn()
+    try:
+        with db:
+            with db.cursor() as cursor:
+                cursor.execute(f"UPDATE jobs SET {atribuicoes} WHERE id = %s", params + (job_id,))
+    finally:
+        pool.putconn(db)
+
+class JobRunner:
+    """Threads que consomem a fila de jobs do banco. Cada processo (worker do gunicorn ou
+    `flask jobs-worker`) tem o seu; os limites de concorrência valem para todos juntos porque
+    a reserva de uma tarefa é serializada por um advisory lock."""
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.nome = f'{socket.gethostname()}:{os.getpid()}'
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._iniciado = False
+        self._manutencao_em = 0.0
+        self._snapshots_em = 0.0
+
+    def iniciar(self):
+        if self._iniciado:
+            return
+        with self._lock:
+            if self._iniciado:
+                return
+            self._iniciado = True
+        for i in range(self.threads):
+            threading.Thread(target=self._loop, name=f'jobs-{i}', daemon=True).start()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self._manutencao()
+                job = self._reivindicar()
+            except Exception:
+                app.logger.exception('Falha ao consultar a fila de jobs')
+                job = None
+            if job is None:
+                self._acordar.wait(JOBS_INTERVALO)
+                self._acordar.clear()
+                continue
+            self._executar(job)
+
+    def _reivindicar(self):
+        """Marca como em execução a tarefa pendente mais antiga que caiba nos limites de concorrência."""
+        pool = get_pool()
+        db = pool.getconn()
+        try:
+            with db:
+                with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                    if not e_sqlite(cursor):  # no SQLite o próprio UPDATE (BEGIN IMMEDIATE) já serializa
+                        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('jobs_reivindicar'))")
+                    cursor.execute("""
+                        UPDATE jobs SET status = 'executando', worker = %s, tentativas = tentativas + 1,
+                                        iniciado_em = LOCALTIMESTAMP, heartbeat_em = LOCALTIMESTAMP
+                        WHERE id = (
+                            SELECT j.id FROM jobs j
+                            WHERE j.status = 'pendente'
+                              AND (SELECT COUNT(*) FROM jobs e WHERE e.status = 'executando') < %s
+                              AND (SELECT COUNT(*) FROM jobs e WHERE e.status = 'executando' AND e.user_id = j.user_id) < %s
+                            ORDER BY j.criado_em LIMIT 1
+                        )
+                        RETURNING *
+                    """, (self.nome, JOBS_CONCORRENCIA_TOTAL, JOBS_POR_USUARIO))
+                    job = cursor.fetchone()
+            return dict(job) if job else None
+        finally:
+            pool.putconn(db)
+
+    def _executar(self, job):
+        pool = get_pool()
+        corpo, arquivo = None, None
+        with _ExecucaoJob(job['id']) as execucao:
+            db = pool.getconn()
+            try:
+                corpo, arquivo = JOB_TIPOS[job['tipo']](db, job, execucao.progresso)
+            except Exception as e:
+                app.logger.exception('Job %s (%s) falhou', job['id'], job['tipo'])
+                corpo = {'error': f'Erro ao processar a tarefa: {str(e)}'}
+            finally:
+                pool.putconn(db)
+        status = 'erro' if 'error' in corpo else 'concluido'
+        _atualizar_job(job['id'], "status = %s, resultado = %s, erro = %s, arquivo_saida = %s, progresso = COALESCE(%s, progresso), "
+                                  "concluido_em = LOCALTIMESTAMP",
+                       (status, json.dumps(corpo, default=str), corpo.get('error'), arquivo,
+                        json.dumps(execucao.atual) if execucao.atual is not None else None))
+        try:
+            os.remove(os.path.join(_dir_job(job['id']), 'entrada'))
+        except FileNotFoundError:
+            pass
+
+    def _manutencao(self):
+        """Devolve à fila as tarefas de processos que pararam (sem heartbeat) e apaga as terminadas há mais de JOBS_RETENCAO_HORAS.
+        A cada SALDOS_SNAPSHOT_MANUTENCAO, ancora as contas novas e fecha os períodos de saldo terminados."""
+        with self._lock:
+            if time.monotonic() - self._manutencao_em < JOBS_MANUTENCAO:
+                return
+            self._manutencao_em = time.monotonic()
+            snapshots = time.monotonic() - self._snapshots_em >= SALDOS_SNAPSHOT_MANUTENCAO
+            if snapshots:
+                self._snapshots_em = time.monotonic()
+        pool = get_pool()
+        db = pool.getconn()
+        try:
+            with db:
+                with db.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE jobs SET status = CASE WHEN tentativas < %(max)s THEN 'pendente' ELSE 'erro' END,
+                                        erro = CASE WHEN tentativas < %(max)s THEN NULL ELSE 'A tarefa foi interrompida e excedeu o número de tentativas' END,
+                                        concluido_em = CASE WHEN tentativas < %(max)s THEN NULL ELSE LOCALTIMESTAMP END,
+                                        worker = NULL
+                        WHERE status = 'executando' AND heartbeat_em < LOCALTIMESTAMP - make_interval(secs => %(timeout)s)
+                        RETURNING id, status
+                    """, {'max': JOBS_MAX_TENTATIVAS, 'timeout': JOBS_TIMEOUT})
+                    interrompidos = cursor.fetchall()
+                    cursor.execute("""
+                        DELETE FROM jobs WHERE status IN ('concluido', 'erro', 'cancelado')
+                          AND concluido_em < LOCALTIMESTAMP - make_interval(secs => %s)
+                        RETURNING id
+                    """, (JOBS_RETENCAO_HORAS * 3600,))
+                    expirados = [row[0] for row in cursor.fetchall()]
+            if snapshots:
+                try:
+                    with db:
+                        with db.cursor() as cursor:
+                            criados = gravar_snapshots(cursor)
+                    if criados:
+                        app.logger.info('%s snapshot(s) de saldo gravado(s)', criados)
+                except Exception:
+                    app.logger.warning('Falha ao gravar os snapshots de saldo', exc_info=True)
+        finally:
+            pool.putconn(db)
+        for job_id, status in interrompidos:
+            app.logger.warning('Job %s interrompido; %s', job_id, 'de volta à fila' if status == 'pendente' else 'marcado como erro')
+        for job_id in expirados:
+            shutil.rmtree(_dir_job(job_id), ignore_errors=True)
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner():
+    global _job_runner
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                _job_runner = JobRunner(JOBS_WORKERS)
+    return _job_runner
+
+if JOBS_WORKERS > 0:
+    @app.before_request
+    def _iniciar_jobs():
+        # Na primeira requisição de cada processo, depois do fork do gunicorn
+        get_job_runner().iniciar()
+
+@app.cli.command('jobs-worker')
+@click.option('--threads', type=int, default=max(JOBS_WORKERS, 1), show_default=True, help='Tarefas executadas ao mesmo tempo por este processo.')
+def jobs_worker(threads):
+    """Executa a fila de jobs em primeiro plano, para rodar as tarefas fora dos workers web (JOBS_WORKERS=0)."""
+    runner = JobRunner(threads)
+    runner.iniciar()
+    print(f'Worker {runner.nome} consumindo a fila com {threads} thread(s). Ctrl+C para sair.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.parar()
+
+def _job_json(cursor, job):
+    dados = {'id': job['id'], 'tipo': job['tipo'], 'status': job['status'], 'progresso': job['progresso'],
+             'resultado': job['resultado'], 'erro': job['erro'], 'tentativas': job['tentativas'],
+             'criadoEm': job['criado_em'], 'iniciadoEm': job['iniciado_em'], 'concluidoEm': job['concluido_em']}
+    if job['status'] == 'pendente':
+        cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pendente' AND criado_em < %s", (job['criado_em'],))
+        dados['posicaoFila'] = cursor.fetchone()[0] + 1
+    if job['status'] == 'concluido' and job['arquivo_saida']:
+        dados['downloadUrl'] = url_for('download_job', job_id=job['id'])
+    return dados
+
+def _carregar_job(cursor, user_id, job_id):
+    cursor.execute("SELECT * FROM jobs WHERE id = %s AND user_id = %s", (job_id, user_id))
+    return cursor.fetchone()
+
+@app.route('/api/jobs', methods=['GET'])
+@login_required
+def listar_jobs():
+    user_id = get_current_user_id()
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            cursor.execute("SELECT * FROM jobs WHERE user_id = %s ORDER BY criado_em DESC LIMIT 20", (user_id,))
+            return jsonify([_job_json(cursor, job) for job in cursor.fetchall()])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def status_job(job_id):
+    user_id = get_current_user_id()
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            job = _carregar_job(cursor, user_id, job_id)
+            if job is None:
+                return jsonify({'error': 'Tarefa não encontrada'}), 404
+            return jsonify(_job_json(cursor, job))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+@login_required
+def cancelar_job(job_id):
+    user_id = get_current_user_id()
+    db = get_db()
+    with db:
+        with db.cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET status = 'cancelado', concluido_em = LOCALTIMESTAMP
+                WHERE id = %s AND user_id = %s AND status = 'pendente' RETURNING id
+            """, (job_id, user_id))
+            if cursor.fetchone() is None:
+                return jsonify({'error': 'Só tarefas ainda na fila podem ser canceladas'}), 409
+    shutil.rmtree(_dir_job(job_id), ignore_errors=True)
+    return jsonify({'message': 'Tarefa cancelada'})
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_job(job_id):
+    user_id = get_current_user_id()
+    db = get_db()
+    with db:
+        with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            job = _carregar_job(cursor, user_id, job_id)
+    if job is None:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    if job['status'] != 'concluido' or not job['arquivo_saida']:
+        return jsonify({'error': 'Arquivo ainda não disponível'}), 409
+    caminho = os.path.join(_dir_job(job_id), job['arquivo_saida'])
+    if not os.path.exists(caminho):
+        return jsonify({'error': 'Arquivo expirado'}), 410
+    nome = job['arquivo_saida']
+    mimetype = 'application/gzip' if nome.endswith('.gz') else 'application/x-ndjson' if nome.endswith('.ndjson') else 'application/json'
+    return send_file(caminho, mimetype=mimetype, as_attachment=True, download_name=nome)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
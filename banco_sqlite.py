@@ -0,0 +1,322 @@
+"""Backend SQLite: conexão e cursor com a parte da interface do psycopg2 que o app.py usa.
+
+Com DATABASE_URL=sqlite:///caminho/arquivo.db as mesmas rotas rodam sobre um arquivo local, para
+instalações de um único operador e para testes. O SQL do app é escrito para o PostgreSQL e traduzido
+aqui: placeholders (%s, %(nome)s), `= ANY(lista)` e `IN tupla` (via json_each), casts `::tipo`,
+FOR UPDATE, LOCALTIMESTAMP e `LOCALTIMESTAMP - make_interval(secs => n)`. O que não tem tradução
+direta fica no app.py, em consultas escritas para os dois dialetos.
+
+Transações: cada conexão fica em autocommit até o primeiro comando que escreve (ou SELECT ... FOR UPDATE),
+que abre um BEGIN IMMEDIATE. Leituras não bloqueiam nem são bloqueadas (WAL); escritas são serializadas
+pelo próprio SQLite e esperam até `timeout` segundos pela vez.
+"""
+import json
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import psycopg2.extensions
+
+PREFIXO_URL = 'sqlite:///'
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # com WAL, uma queda de energia pode perder só as últimas transações, sem corromper o arquivo
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA cache_size=-65536',  # 64 MB de cache de páginas por conexão
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+)
+MAX_VARIAVEIS = 32766  # SQLITE_MAX_VARIABLE_NUMBER padrão desde o 3.32
+
+def e_url_sqlite(url):
+    return bool(url) and url.startswith('sqlite:')
+
+def caminho_da_url(url):
+    """sqlite:///dados/gestao.db -> dados/gestao.db; sqlite:////var/lib/gestao.db -> /var/lib/gestao.db."""
+    if not url.startswith(PREFIXO_URL) or len(url) == len(PREFIXO_URL):
+        raise ValueError(f'URL do SQLite inválida (use sqlite:///caminho/arquivo.db): {url}')
+    return url[len(PREFIXO_URL):]
+
+# --- Tipos: o que sai do banco tem o mesmo tipo Python que o psycopg2 devolveria (exceto NUMERIC, que vem como float) ---
+def _texto_datetime(valor):
+    return valor.isoformat(' ')
+
+def _converter_timestamp(valor):
+    texto = valor.decode()
+    if texto == '-infinity':
+        return datetime.min
+    if texto == 'infinity':
+        return datetime.max
+    return datetime.fromisoformat(texto)
+
+def _converter_date(valor):
+    texto = valor.decode()
+    if texto == '-infinity':
+        return date.min
+    if texto == 'infinity':
+        return date.max
+    return date.fromisoformat(texto[:10])
+
+sqlite3.register_adapter(datetime, _texto_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter('TIMESTAMP', _converter_timestamp)
+sqlite3.register_converter('DATE', _converter_date)
+sqlite3.register_converter('JSON', json.loads)
+sqlite3.register_converter('BOOLEAN', lambda valor: valor not in (b'0', b''))
+
+# --- Funções do PostgreSQL usadas pelo app ---
+def _date_trunc(campo, valor):
+    """date_trunc para day | week | month. Devolve só a data (AAAA-MM-DD): compara como meia-noite com
+    os timestamps e é igual ao que fica gravado nas colunas DATE."""
+    if valor is None or valor in ('-infinity', 'infinity'):
+        return valor
+    instante = datetime.fromisoformat(valor)
+    if campo == 'week':
+        return date.fromordinal(instante.toordinal() - instante.weekday()).isoformat()
+    if campo == 'month':
+        return instante.date().replace(day=1).isoformat()
+    if campo == 'day':
+        return instante.date().isoformat()
+    raise ValueError(f'date_trunc: campo não suportado no SQLite: {campo}')
+
+def _somar_segundos(valor, segundos):
+    return _texto_datetime(datetime.fromisoformat(valor) + timedelta(seconds=segundos))
+
+def _greatest(*valores):
+    # Como no PostgreSQL, NULLs são ignorados (o max/min nativos do SQLite devolvem NULL)
+    valores = [v for v in valores if v is not None]
+    return max(valores) if valores else None
+
+def _least(*valores):
+    valores = [v for v in valores if v is not None]
+    return min(valores) if valores else None
+
+class _BoolOr:
+    def __init__(self):
+        self.valor = None
+
+    def step(self, valor):
+        if valor is not None:
+            self.valor = bool(self.valor) or bool(valor)
+
+    def finalize(self):
+        return self.valor
+
+# --- Tradução do SQL ---
+_RE_CAST = re.compile(r'::(?:int|integer|bigint|numeric|boolean|date|timestamp|text|jsonb?)\b')
+_RE_ANY = re.compile(r'=\s*ANY\((%s|%\(\w+\)s)\)', re.IGNORECASE)
+_RE_IN_PARAM = re.compile(r'\bIN\s+(%s|%\(\w+\)s)')
+_RE_FOR_UPDATE = re.compile(r'\s+FOR UPDATE(?: OF \w+)?')
+_RE_INTERVALO = re.compile(r'LOCALTIMESTAMP\s*-\s*make_interval\(secs => (%\(\w+\)s|[^)]+)\)')
+_RE_UPDATE_ALIAS = re.compile(r'^(\s*UPDATE\s+\w+)\s+(?!SET\b)(\w+)\s+SET\b', re.IGNORECASE)
+_RE_PARAM = re.compile(r'%\((\w+)\)s|%s|%%')
+_RE_LEITURA = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+_RE_ESCRITA = re.compile(r'\b(?:INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+@lru_cache(maxsize=512)
+def traduzir(sql, com_parametros=True):
+    """SQL do PostgreSQL -> (SQL do SQLite, se o comando escreve). Sem parâmetros, % é literal, como no psycopg2."""
+    escrita = bool(_RE_FOR_UPDATE.search(sql)) or not _RE_LEITURA.match(sql) or (
+        sql.lstrip()[:4].upper() == 'WITH' and bool(_RE_ESCRITA.search(sql)))
+    sql = _RE_CAST.sub('', sql)
+    sql = _RE_FOR_UPDATE.sub('', sql)
+    sql = _RE_ANY.sub(r'IN (SELECT value FROM json_each(\1))', sql)
+    sql = _RE_IN_PARAM.sub(r'IN (SELECT value FROM json_each(\1))', sql)
+    sql = _RE_INTERVALO.sub(r'somar_segundos(agora(), -(\1))', sql)
+    sql = sql.replace('LOCALTIMESTAMP', 'agora()')
+    sql = _RE_UPDATE_ALIAS.sub(r'\1 AS \2 SET', sql)
+    if com_parametros:
+        sql = _RE_PARAM.sub(lambda m: f':{m.group(1)}' if m.group(1) else '?' if m.group(0) == '%s' else '%', sql)
+    return sql, escrita
+
+def _adaptar(valor):
+    # Listas e tuplas (ANY, IN) viram um array JSON, lido com json_each
+    return json.dumps(valor) if isinstance(valor, (list, tuple)) else valor
+
+def _adaptar_parametros(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {chave: _adaptar(valor) for chave, valor in params.items()}
+    return [_adaptar(valor) for valor in params]
+
+_RE_VALUES = re.compile(r'(?<!%)%s')
+_RE_VALUES_ALIAS = re.compile(r'\(VALUES\s*$', re.IGNORECASE)
+_RE_ALIAS_COLUNAS = re.compile(r'^\)\s*(\w+)\s*\(([^)]*)\)')
+_MARCA_VALUES = '__valores__'
+
+@lru_cache(maxsize=128)
+def _preparar_execute_values(sql, template):
+    """Monta o comando de execute_values: `(VALUES %s) v(a, b)`, que o SQLite não aceita, vira
+    `(SELECT column1 AS a, column2 AS b FROM (VALUES ...)) v`."""
+    antes, depois = _RE_VALUES.split(sql, maxsplit=1)
+    alias = _RE_ALIAS_COLUNAS.match(depois)
+    if _RE_VALUES_ALIAS.search(antes) and alias:
+        colunas = [c.strip() for c in alias.group(2).split(',')]
+        antes = _RE_VALUES_ALIAS.sub('(SELECT ' + ', '.join(f'column{i} AS {c}' for i, c in enumerate(colunas, 1)) + ' FROM (VALUES ', antes)
+        depois = f')) {alias.group(1)}' + depois[alias.end():]
+    traduzido, escrita = traduzir(antes + _MARCA_VALUES + depois)
+    linha = traduzir(template)[0] if template else None
+    return traduzido, escrita, linha
+
+class _Info:
+    def __init__(self, conexao):
+        self._conexao = conexao
+
+    @property
+    def transaction_status(self):
+        if self._conexao.closed:
+            return psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+        if self._conexao._conn.in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+class Conexao:
+    """Conexão SQLite com a interface de conexão do psycopg2 usada pelo app e pelo pool."""
+
+    def __init__(self, caminho, timeout=30.0, ao_executar=None):
+        self._conn = sqlite3.connect(caminho, timeout=timeout, isolation_level=None, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            self._conn.execute(pragma)
+        self._agora = None  # LOCALTIMESTAMP: fixo durante a transação, como no PostgreSQL
+        self._conn.create_function('agora', 0, self._instante)
+        self._conn.create_function('date_trunc', 2, _date_trunc, deterministic=True)
+        self._conn.create_function('somar_segundos', 2, _somar_segundos, deterministic=True)
+        self._conn.create_function('greatest', -1, _greatest, deterministic=True)
+        self._conn.create_function('least', -1, _least, deterministic=True)
+        self._conn.create_aggregate('bool_or', 1, _BoolOr)
+        self.ao_executar = ao_executar  # (sql, segundos), para instrumentação
+        self.autocommit = False
+        self.closed = 0
+        self.info = _Info(self)
+
+    def _instante(self):
+        return _texto_datetime(self._agora if self._agora is not None and self._conn.in_transaction else datetime.now())
+
+    def _iniciar(self, escrita):
+        if escrita and not self.autocommit and not self._conn.in_transaction:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._agora = datetime.now()
+
+    def cursor(self, name=None, cursor_factory=None):
+        # Cursores nomeados e DictCursor não se aplicam: o sqlite3 já lê sob demanda e sqlite3.Row
+        # aceita acesso por posição e por nome
+        return Cursor(self)
+
+    def executar_script(self, sql):
+        """Vários comandos de uma vez (schema), fora da tradução."""
+        self._conn.executescript(sql)
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def close(self):
+        if not self.closed:
+            self._conn.close()
+            self.closed = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+class Cursor:
+    itersize = 2000
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self._cursor = conexao._conn.cursor()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _medir(self, sql, inicio):
+        if self.conexao.ao_executar is not None:
+            self.conexao.ao_executar(sql, time.perf_counter() - inicio)
+
+    def execute(self, sql, params=None):
+        traduzido, escrita = traduzir(sql, params is not None)
+        self.conexao._iniciar(escrita)
+        inicio = time.perf_counter()
+        try:
+            self._cursor.execute(traduzido, _adaptar_parametros(params))
+        finally:
+            self._medir(sql, inicio)
+
+    def executemany(self, sql, params_list):
+        traduzido, escrita = traduzir(sql)
+        self.conexao._iniciar(escrita)
+        inicio = time.perf_counter()
+        try:
+            self._cursor.executemany(traduzido, (_adaptar_parametros(params) for params in params_list))
+        finally:
+            self._medir(sql, inicio)
+
+    def execute_values(self, sql, argslist, template=None, page_size=100, fetch=False):
+        """Equivalente a psycopg2.extras.execute_values: um comando multi-linha por página."""
+        traduzido, escrita, linha = _preparar_execute_values(sql, template)
+        argslist = list(argslist)
+        if not argslist:
+            return [] if fetch else None
+        colunas = len(argslist[0])
+        linha = linha or '(' + ', '.join('?' * colunas) + ')'
+        page_size = max(1, min(page_size, MAX_VARIAVEIS // colunas))
+        self.conexao._iniciar(escrita)
+        resultado = []
+        for i in range(0, len(argslist), page_size):
+            pagina = argslist[i:i + page_size]
+            inicio = time.perf_counter()
+            try:
+                self._cursor.execute(traduzido.replace(_MARCA_VALUES, ', '.join([linha] * len(pagina))),
+                                     [_adaptar(valor) for args in pagina for valor in args])
+                if fetch:
+                    resultado.extend(self._cursor.fetchall())
+            finally:
+                self._medir(sql, inicio)
+        return resultado if fetch else None
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.itersize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def conectar(url, timeout=30.0, ao_executar=None):
+    return Conexao(caminho_da_url(url), timeout=timeout, ao_executar=ao_executar)
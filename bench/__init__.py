@@ -0,0 +1 @@
+"""Benchmarks dos endpoints: gerador de dados sintéticos (dados.py) e executor/comparador (benchmark.py)."""
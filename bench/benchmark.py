@@ -0,0 +1,471 @@
+"""Benchmark dos endpoints da API contra um PostgreSQL (ou arquivo SQLite) descartável.
+
+    python -m bench.benchmark run --transacoes 1000000 --concorrencia 4
+    python -m bench.benchmark run --backend sqlite --transacoes 1000000
+    python -m bench.benchmark compare base.json novo.json --limite 0.15
+
+Sem --dsn, `run` cria um banco temporário (em --admin-dsn ou em um cluster próprio com
+initdb/pg_ctl; com --backend sqlite, um arquivo em um diretório temporário), popula com
+bench/dados.py, mede cada endpoint e apaga tudo no final.
+"""
+import contextlib
+import http.cookiejar
+import io
+import json
+import os
+import platform
+import queue
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+import psycopg2
+import psycopg2.extensions
+
+import banco_sqlite
+from bench import dados
+
+# Ordem de execução: os endpoints que alteram dados vêm depois dos de leitura
+ENDPOINTS = ('dados-iniciais', 'relatorio', 'transacoes', 'backup', 'import-csv', 'resolver', 'reverter', 'restore')
+REQUISICOES_PADRAO = {'backup': 10, 'restore': 5, 'import-csv': 20}
+# Restaurações do mesmo usuário são serializadas pelo lock em usuarios: concorrência só mediria a fila
+CONCORRENCIA_MAXIMA = {'restore': 1}
+
+# --- Contagem de consultas SQL por requisição ---
+_contagem = threading.local()
+_cursores_contadores = {}
+
+def _cursor_contador(base):
+    """Subclasse de `base` que conta execute/executemany/copy_expert na thread corrente."""
+    if base not in _cursores_contadores:
+        class CursorContador(base):
+            def execute(self, query, vars=None):
+                _contagem.consultas = getattr(_contagem, 'consultas', 0) + 1
+                return super().execute(query, vars)
+
+            def executemany(self, query, vars_list):
+                _contagem.consultas = getattr(_contagem, 'consultas', 0) + 1
+                return super().executemany(query, vars_list)
+
+            def copy_expert(self, sql, file, size=8192):
+                _contagem.consultas = getattr(_contagem, 'consultas', 0) + 1
+                return super().copy_expert(sql, file, size)
+        _cursores_contadores[base] = CursorContador
+    return _cursores_contadores[base]
+
+class ConexaoContadora(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = _cursor_contador(kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+def _contar_consulta(sql, segundos):
+    """Hook ao_executar das conexões SQLite, equivalente a ConexaoContadora."""
+    _contagem.consultas = getattr(_contagem, 'consultas', 0) + 1
+
+def conectar(dsn):
+    return banco_sqlite.conectar(dsn) if banco_sqlite.e_url_sqlite(dsn) else psycopg2.connect(dsn)
+
+# --- SQLite descartável ---
+@contextlib.contextmanager
+def sqlite_temporario(manter=False):
+    """Devolve a URL de um arquivo SQLite novo em um diretório temporário."""
+    diretorio = tempfile.mkdtemp(prefix='bench_sqlite_')
+    try:
+        yield banco_sqlite.PREFIXO_URL + os.path.join(diretorio, 'bench.db')
+    finally:
+        if manter:
+            click.echo(f'Banco mantido em {diretorio}')
+        else:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- PostgreSQL descartável ---
+@contextlib.contextmanager
+def postgres_temporario(admin_dsn=None, manter=False):
+    """Devolve o DSN de um banco vazio. Com admin_dsn, cria um banco bench_<hex> nesse servidor;
+    sem ele, sobe um cluster temporário com initdb/pg_ctl (procurados em $PG_BIN e no PATH)."""
+    if admin_dsn:
+        nome = f'bench_{uuid.uuid4().hex[:12]}'
+        admin = psycopg2.connect(admin_dsn)
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE {nome}')
+        try:
+            yield psycopg2.extensions.make_dsn(admin_dsn, dbname=nome)
+        finally:
+            if manter:
+                click.echo(f'Banco mantido: {nome}')
+            else:
+                with admin.cursor() as cursor:
+                    cursor.execute(f'DROP DATABASE IF EXISTS {nome} WITH (FORCE)')
+            admin.close()
+        return
+
+    caminho = os.pathsep.join(p for p in (os.environ.get('PG_BIN'), os.environ.get('PATH')) if p)
+    initdb, pg_ctl = shutil.which('initdb', path=caminho), shutil.which('pg_ctl', path=caminho)
+    if not initdb or not pg_ctl:
+        raise click.ClickException('initdb/pg_ctl não encontrados: informe --admin-dsn ou defina PG_BIN')
+    diretorio = tempfile.mkdtemp(prefix='bench_pg_')
+    pgdata = os.path.join(diretorio, 'data')
+    try:
+        subprocess.run([initdb, '-D', pgdata, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'], check=True, capture_output=True, text=True)
+        subprocess.run([pg_ctl, '-D', pgdata, '-l', os.path.join(diretorio, 'postgres.log'), '-w',
+                        '-o', f"-c listen_addresses='' -k {diretorio}", 'start'], check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(diretorio, ignore_errors=True)
+        raise click.ClickException(f'Falha ao iniciar o PostgreSQL temporário: {(e.stderr or e.stdout).strip()}')
+    try:
+        admin_dsn = f'host={diretorio} user=postgres dbname=postgres'
+        admin = psycopg2.connect(admin_dsn)
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute('CREATE DATABASE bench')
+        admin.close()
+        yield psycopg2.extensions.make_dsn(admin_dsn, dbname='bench')
+    finally:
+        if manter:
+            click.echo(f'Cluster mantido em {pgdata} (pg_ctl -D {pgdata} stop)')
+        else:
+            subprocess.run([pg_ctl, '-D', pgdata, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+# --- Clientes: test client do Flask ou servidor HTTP local ---
+class ClienteFlask:
+    def __init__(self, appmod):
+        self.cliente = appmod.app.test_client()
+
+    def login(self, email, senha):
+        self.cliente.post('/login', data={'email': email, 'password': senha})
+
+    def requisitar(self, metodo, caminho, json_body=None, arquivo=None):
+        kwargs = {'json': json_body} if json_body is not None else {}
+        if arquivo:
+            campo, nome, conteudo = arquivo
+            kwargs = {'data': {campo: (io.BytesIO(conteudo), nome)}, 'content_type': 'multipart/form-data'}
+        resposta = self.cliente.open(caminho, method=metodo, **kwargs)
+        # Consome o corpo em pedaços, como um cliente real de um endpoint em streaming
+        tamanho = sum(len(pedaco) for pedaco in resposta.iter_encoded())
+        resposta.close()
+        return resposta.status_code, tamanho
+
+    def baixar(self, caminho):
+        return self.cliente.get(caminho).get_data()
+
+class ClienteHttp:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def login(self, email, senha):
+        corpo = urllib.parse.urlencode({'email': email, 'password': senha}).encode()
+        self.opener.open(self.url + '/login', corpo).read()
+
+    def requisitar(self, metodo, caminho, json_body=None, arquivo=None):
+        headers, corpo = {}, None
+        if json_body is not None:
+            headers['Content-Type'], corpo = 'application/json', json.dumps(json_body).encode()
+        elif arquivo:
+            campo, nome, conteudo = arquivo
+            fronteira = uuid.uuid4().hex
+            headers['Content-Type'] = f'multipart/form-data; boundary={fronteira}'
+            corpo = (f'--{fronteira}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nome}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n').encode() + conteudo + f'\r\n--{fronteira}--\r\n'.encode()
+        req = urllib.request.Request(self.url + caminho, data=corpo, headers=headers, method=metodo)
+        try:
+            with self.opener.open(req) as resposta:
+                return resposta.status, sum(len(pedaco) for pedaco in iter(lambda: resposta.read(65536), b''))
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+    def baixar(self, caminho):
+        with self.opener.open(self.url + caminho) as resposta:
+            return resposta.read()
+
+# --- Cenários ---
+class Cenarios:
+    """Monta a requisição de cada endpoint. Os endpoints que consomem estado (resolver, reverter)
+    recebem ids escolhidos antes da medição, um por requisição."""
+
+    def __init__(self, conn, user_id, cliente, contas, necessarios):
+        self.pilhas = {}
+        agora = datetime.now()
+        self.relatorio = f'/api/relatorio?year={agora.year}&month={agora.month}'
+        with conn, conn.cursor() as cursor:
+            if 'resolver' in necessarios:
+                cursor.execute("SELECT id FROM operacoes WHERE user_id = %s AND status = 'ativa' ORDER BY data_criacao LIMIT %s", (user_id, necessarios['resolver']))
+                self.pilhas['resolver'] = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT operacao_id, MIN(resultado) FROM apostas WHERE user_id = %s AND operacao_id = ANY(%s) GROUP BY operacao_id", (user_id, self.pilhas['resolver']))
+                self.vencedores = dict(cursor.fetchall())
+            if 'reverter' in necessarios:
+                cursor.execute("SELECT id FROM transacoes WHERE user_id = %s AND operacao_id IS NULL ORDER BY id DESC LIMIT %s", (user_id, necessarios['reverter']))
+                self.pilhas['reverter'] = [row[0] for row in cursor.fetchall()]
+        for endpoint, ids in self.pilhas.items():
+            if len(ids) < necessarios[endpoint]:
+                click.echo(f'Aviso: só {len(ids)} registros disponíveis para {endpoint}', err=True)
+        self.lock = threading.Lock()
+        linhas = ['nome,casa_de_aposta,saldo,meta']
+        linhas += [f'Conta {i:03d},bet365,{i * 10},100' for i in range(1, contas + 1)]
+        linhas += [f'Importada {i:04d},betano,{i},50' for i in range(1, 201)]
+        self.csv = ('\n'.join(linhas) + '\n').encode()
+        self.backup = cliente.baixar('/api/backup') if 'restore' in necessarios else None
+
+    def _proximo(self, endpoint):
+        with self.lock:
+            pilha = self.pilhas[endpoint]
+            return pilha.pop() if pilha else None
+
+    def requisicao(self, endpoint):
+        """Devolve (método, caminho, json, arquivo) ou None quando os dados do cenário acabaram."""
+        if endpoint == 'dados-iniciais':
+            return 'GET', '/api/dados-iniciais', None, None
+        if endpoint == 'relatorio':
+            return 'GET', self.relatorio, None, None
+        if endpoint == 'transacoes':
+            return 'GET', '/api/transacoes?limit=100', None, None
+        if endpoint == 'backup':
+            return 'GET', '/api/backup', None, None
+        if endpoint == 'import-csv':
+            return 'POST', '/api/import-csv', None, ('csvFile', 'contas.csv', self.csv)
+        if endpoint == 'restore':
+            return 'POST', '/api/restore', None, ('backupFile', 'backup.json', self.backup)
+        if endpoint == 'resolver':
+            operation_id = self._proximo('resolver')
+            return operation_id and ('POST', '/api/operacoes/resolver', {'operationId': operation_id, 'winningMarket': self.vencedores.get(operation_id)}, None)
+        if endpoint == 'reverter':
+            transacao_id = self._proximo('reverter')
+            return transacao_id and ('DELETE', f'/api/transacoes/{transacao_id}', None, None)
+        raise click.BadParameter(f'Endpoint desconhecido: {endpoint}')
+
+# --- Medição ---
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+def medir_endpoint(endpoint, cenarios, clientes, requisicoes, concorrencia, aquecimento, em_processo):
+    """Mede um endpoint. `clientes` é uma fila de clientes já logados (o login com pbkdf2 fica
+    fora da medição). Consultas SQL e pico de memória só existem com o app no mesmo processo."""
+    def executar():
+        req = cenarios.requisicao(endpoint)
+        if req is None:
+            return None
+        metodo, caminho, json_body, arquivo = req
+        cliente = clientes.get()
+        _contagem.consultas = 0
+        inicio = time.perf_counter()
+        try:
+            status, tamanho = cliente.requisitar(metodo, caminho, json_body, arquivo)
+        except Exception as e:
+            click.echo(f'{endpoint}: {e}', err=True)
+            status, tamanho = 599, 0
+        finally:
+            clientes.put(cliente)
+        return time.perf_counter() - inicio, status, tamanho, _contagem.consultas
+
+    for _ in range(aquecimento):
+        executar()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        inicio = time.perf_counter()
+        resultados = [r for r in pool.map(lambda _: executar(), range(requisicoes)) if r is not None]
+        duracao = time.perf_counter() - inicio
+    memoria = None
+    if em_processo:
+        # Passada extra fora da medição de latência: tracemalloc deixa o Python bem mais lento
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        if executar() is not None:
+            memoria = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencias = sorted(r[0] * 1000 for r in resultados)
+    consultas = [r[3] for r in resultados]
+    return {
+        'requisicoes': len(resultados),
+        'erros': sum(1 for r in resultados if r[1] >= 400),
+        'segundos': round(duracao, 4),
+        'throughput': round(len(resultados) / duracao, 2) if resultados and duracao else None,
+        'latencia_ms': {
+            'p50': _arred(_percentil(latencias, 50)), 'p95': _arred(_percentil(latencias, 95)), 'p99': _arred(_percentil(latencias, 99)),
+            'media': _arred(sum(latencias) / len(latencias)) if latencias else None, 'max': _arred(latencias[-1]) if latencias else None,
+        },
+        'consultas_sql': {'media': round(sum(consultas) / len(consultas), 2), 'max': max(consultas)} if em_processo and consultas else None,
+        'bytes_resposta_media': round(sum(r[2] for r in resultados) / len(resultados)) if resultados else None,
+        'memoria_pico_kb': round(memoria / 1024) if memoria is not None else None,
+    }
+
+def _arred(valor):
+    return round(valor, 3) if valor is not None else None
+
+def _versao_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=dados.RAIZ, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# --- CLI ---
+@click.group()
+def cli():
+    """Benchmarks dos endpoints da API."""
+
+def _opcoes_dados(f):
+    for opcao in reversed([
+        click.option('--usuarios', default=3, show_default=True, help='Usuários sintéticos.'),
+        click.option('--contas', default=20, show_default=True, help='Contas por usuário.'),
+        click.option('--transacoes', default=100_000, show_default=True, help='Total aproximado de linhas em transacoes.'),
+        click.option('--operacoes-ativas', default=200, show_default=True, help='Operações em aberto por usuário.'),
+        click.option('--meses', default=24, show_default=True, help='Meses de histórico.'),
+        click.option('--semente', default=42, show_default=True, help='Semente do gerador.'),
+    ]):
+        f = opcao(f)
+    return f
+
+@cli.command()
+@click.option('--dsn', envvar='DATABASE_URL', required=True, help='Banco de destino (será recriado com schema.sql; sqlite:///arquivo.db usa schema_sqlite.sql).')
+@_opcoes_dados
+def seed(dsn, usuarios, contas, transacoes, operacoes_ativas, meses, semente):
+    """Recria o schema em DSN e gera dados sintéticos."""
+    conn = conectar(dsn)
+    dados.criar_schema(conn)
+    click.echo(json.dumps(dados.popular(conn, usuarios, contas, transacoes, operacoes_ativas, meses, semente, log=click.echo)))
+    conn.close()
+
+@cli.command()
+@click.option('--dsn', help='Usa um banco já populado (com `seed`) em vez de um temporário.')
+@click.option('--backend', type=click.Choice(['postgres', 'sqlite']), default='postgres', show_default=True,
+              help='Banco temporário criado sem --dsn (com --dsn, vale o da URL).')
+@click.option('--admin-dsn', help='Servidor onde criar o banco temporário; sem ele, sobe um cluster com initdb.')
+@click.option('--url', help='Mede um servidor já rodando (contra o mesmo --dsn) em vez do test client.')
+@click.option('--endpoints', default=','.join(ENDPOINTS), show_default=True, help='Lista separada por vírgula.')
+@click.option('--requisicoes', type=int, help='Requisições medidas por endpoint (padrão: 50; menos para backup/restore/import).')
+@click.option('--concorrencia', default=4, show_default=True)
+@click.option('--aquecimento', default=2, show_default=True, help='Requisições não medidas antes de cada endpoint.')
+@click.option('--saida', type=click.Path(dir_okay=False), help='Arquivo JSON de resultados (padrão: bench/resultados/<data>.json).')
+@click.option('--manter', is_flag=True, help='Não apaga o banco/cluster temporário no final.')
+@_opcoes_dados
+def run(dsn, backend, admin_dsn, url, endpoints, requisicoes, concorrencia, aquecimento, saida, manter, **opcoes_dados):
+    """Popula um banco descartável e mede os endpoints."""
+    endpoints = [e.strip() for e in endpoints.split(',') if e.strip()]
+    if url and not dsn:
+        raise click.UsageError('--url exige o --dsn do banco usado pelo servidor')
+    if dsn:
+        backend = 'sqlite' if banco_sqlite.e_url_sqlite(dsn) else 'postgres'
+        temporario = contextlib.nullcontext(dsn)
+    else:
+        temporario = sqlite_temporario(manter) if backend == 'sqlite' else postgres_temporario(admin_dsn, manter)
+    with temporario as dsn_bench:
+        conn = conectar(dsn_bench)
+        if not dsn:
+            dados.criar_schema(conn)
+            dados.popular(conn, log=click.echo, **opcoes_dados)
+        totais = dados.contar(conn)
+
+        os.environ['DATABASE_URL'] = dsn_bench
+        import app as appmod
+        appmod.DATABASE_URL = dsn_bench
+        if url:
+            novo_cliente = lambda: ClienteHttp(url)
+        else:
+            contador = {'ao_executar': _contar_consulta} if backend == 'sqlite' else {'connection_factory': ConexaoContadora}
+            appmod._pool = appmod.ConnectionPool(dsn_bench, minconn=1, maxconn=max(concorrencia + 1, appmod.DB_POOL_MAX),
+                                                 timeout=appmod.DB_POOL_TIMEOUT, check_idle=appmod.DB_POOL_CHECK_IDLE, **contador)
+            novo_cliente = lambda: ClienteFlask(appmod)
+
+        def cliente_logado():
+            cliente = novo_cliente()
+            cliente.login(dados.email_usuario(1), dados.SENHA)
+            return cliente
+
+        clientes = queue.Queue()
+        for _ in range(concorrencia):
+            clientes.put(cliente_logado())
+        por_endpoint = {e: requisicoes or REQUISICOES_PADRAO.get(e, 50) for e in endpoints}
+        cenarios = Cenarios(conn, 1, clientes.queue[0], opcoes_dados['contas'], {e: n + aquecimento + 1 for e, n in por_endpoint.items()})
+        conn.close()
+
+        resultados = {}
+        for endpoint in endpoints:
+            paralelo = min(concorrencia, CONCORRENCIA_MAXIMA.get(endpoint, concorrencia))
+            click.echo(f'Medindo {endpoint} ({por_endpoint[endpoint]} requisições, concorrência {paralelo})...')
+            resultados[endpoint] = medir_endpoint(endpoint, cenarios, clientes, por_endpoint[endpoint], paralelo, aquecimento, em_processo=not url)
+            resultados[endpoint]['concorrencia'] = paralelo
+        with conectar(dsn_bench) as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT sqlite_version()' if backend == 'sqlite' else 'SHOW server_version')
+            versao_banco = cursor.fetchone()[0]
+        conn.close()
+        if not url:
+            appmod._pool.closeall()
+
+    relatorio = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': _versao_git(),
+        'ambiente': {'python': platform.python_version(), 'backend': backend, backend: versao_banco, 'plataforma': platform.platform(),
+                     'modo': 'http' if url else 'test-client', 'concorrencia': concorrencia},
+        'dados': dict(opcoes_dados, **{'linhas': totais}),
+        'memoria_processo_pico_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'endpoints': resultados,
+    }
+    saida = saida or os.path.join(dados.RAIZ, 'bench', 'resultados', f'{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    _imprimir(resultados)
+    click.echo(f'Resultados salvos em {saida}')
+
+def _imprimir(resultados):
+    click.echo(f"{'endpoint':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'SQL':>8}{'mem KB':>10}{'erros':>7}")
+    for endpoint, r in resultados.items():
+        lat, sql = r['latencia_ms'], r['consultas_sql'] or {}
+        click.echo(f"{endpoint:<16}{_fmt(r['throughput']):>10}{_fmt(lat['p50']):>10}{_fmt(lat['p95']):>10}{_fmt(lat['p99']):>10}"
+                   f"{_fmt(sql.get('media')):>8}{_fmt(r['memoria_pico_kb']):>10}{r['erros']:>7}")
+
+def _fmt(valor):
+    return '-' if valor is None else f'{valor:.1f}' if isinstance(valor, float) else str(valor)
+
+@cli.command()
+@click.argument('base', type=click.File(encoding='utf-8'))
+@click.argument('novo', type=click.File(encoding='utf-8'))
+@click.option('--limite', default=0.15, show_default=True, help='Piora relativa tolerada em p95 e throughput.')
+def compare(base, novo, limite):
+    """Compara dois resultados; sai com código 1 se algum endpoint piorou além do limite."""
+    base, novo = json.load(base), json.load(novo)
+    if base.get('dados', {}).get('linhas') != novo.get('dados', {}).get('linhas'):
+        click.echo('Aviso: os conjuntos de dados são diferentes; a comparação é só indicativa.', err=True)
+    click.echo(f"{'endpoint':<16}{'p50 ms':>28}{'p95 ms':>28}{'req/s':>22}{'SQL':>12}  situação")
+    regressoes = 0
+    for endpoint, r_novo in novo['endpoints'].items():
+        r_base = base['endpoints'].get(endpoint)
+        if not r_base:
+            click.echo(f'{endpoint:<16}  (novo)')
+            continue
+        p95_base, p95_novo = r_base['latencia_ms']['p95'], r_novo['latencia_ms']['p95']
+        thr_base, thr_novo = r_base['throughput'], r_novo['throughput']
+        piorou = ((p95_base and p95_novo and p95_novo > p95_base * (1 + limite))
+                  or (thr_base and thr_novo and thr_novo < thr_base * (1 - limite))
+                  or r_novo['erros'] > r_base['erros'])
+        regressoes += bool(piorou)
+        sql_base, sql_novo = (r_base.get('consultas_sql') or {}).get('media'), (r_novo.get('consultas_sql') or {}).get('media')
+        click.echo(f"{endpoint:<16}{_variacao(r_base['latencia_ms']['p50'], r_novo['latencia_ms']['p50']):>28}{_variacao(p95_base, p95_novo):>28}"
+                   f"{_variacao(thr_base, thr_novo):>22}{_fmt(sql_base) + '→' + _fmt(sql_novo):>12}  {'REGRESSÃO' if piorou else 'ok'}")
+    if regressoes:
+        click.echo(f'{regressoes} endpoint(s) com regressão acima de {limite:.0%}')
+        sys.exit(1)
+
+def _variacao(antes, depois):
+    if not antes or depois is None:
+        return f'{_fmt(antes)}→{_fmt(depois)}'
+    return f'{antes:.1f}→{depois:.1f} ({(depois - antes) / antes:+.0%})'
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,171 @@
+"""Gerador de dados sintéticos para os benchmarks.
+
+Cria usuários, contas, operações de aposta (com apostas e ganhos) e lançamentos avulsos
+espalhados pelos últimos meses, carregados com COPY a partir de arquivos temporários para
+aguentar milhões de linhas em transacoes (no SQLite, com INSERTs preparados na mesma transação).
+O resumo mensal é reconstruído no final.
+"""
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import banco_sqlite
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SENHA = 'benchmark'
+CASAS = ('bet365', 'betano', 'sportingbet', 'betesporte', 'pessoal')
+CATEGORIAS = ('surebet', 'esportiva', 'extracao_freebet', 'processo_freebet')
+# (tipo, sinal) dos lançamentos avulsos
+AVULSOS = (('deposit', 1), ('withdrawal', -1), ('expense', -1), ('payment', -1), ('bonus', 1), ('other_credit', 1), ('other_debit', -1))
+FRACAO_APOSTAS = 0.6  # fração aproximada das linhas de transacoes que pertencem a operações
+
+def email_usuario(n):
+    return f'bench{n}@example.com'
+
+def e_sqlite(conn):
+    return isinstance(conn, banco_sqlite.Conexao)
+
+def criar_schema(conn):
+    with open(os.path.join(RAIZ, 'schema_sqlite.sql' if e_sqlite(conn) else 'schema.sql'), encoding='utf-8') as f:
+        sql = f.read()
+    if e_sqlite(conn):
+        conn.executar_script(sql)
+        return
+    with conn, conn.cursor() as cursor:
+        cursor.execute(sql)
+
+class _Copiador:
+    """Acumula as linhas de uma tabela em um arquivo temporário para um único COPY. No SQLite as
+    linhas vão em JSON (CSV perderia os tipos: NULL, booleanos) e são inseridas com executemany."""
+
+    def __init__(self, tabela, colunas, sqlite=False):
+        self.tabela, self.colunas, self.sqlite = tabela, colunas, sqlite
+        self.arquivo = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.arquivo)
+        self.linhas = 0
+
+    def escrever(self, linha):
+        if self.sqlite:
+            self.arquivo.write(json.dumps(linha) + '\n')
+        else:
+            self.writer.writerow(linha)
+        self.linhas += 1
+
+    def copiar(self, cursor):
+        self.arquivo.seek(0)
+        if self.sqlite:
+            cursor.executemany(f"INSERT INTO {self.tabela} ({', '.join(self.colunas)}) VALUES ({', '.join(['%s'] * len(self.colunas))})",
+                               (json.loads(linha) for linha in self.arquivo))
+        else:
+            cursor.copy_expert(f"COPY {self.tabela} ({', '.join(self.colunas)}) FROM STDIN WITH (FORMAT csv)", self.arquivo)
+        self.arquivo.close()
+
+def popular(conn, usuarios=3, contas=20, transacoes=1_000_000, operacoes_ativas=200, meses=24, semente=42, log=print):
+    """Popula um banco recém-criado com criar_schema. `transacoes` é o total aproximado de linhas,
+    dividido igualmente entre os usuários. Retorna a contagem final de cada tabela."""
+    import app as appmod  # reconstruir_resumo; importado aqui para não exigir DATABASE_URL no import do módulo
+
+    inicio = time.monotonic()
+    rnd = random.Random(semente)
+    senha_hash = generate_password_hash(SENHA, method='pbkdf2:sha256')
+    fim_periodo = datetime.now().replace(microsecond=0)
+    inicio_periodo = fim_periodo - timedelta(days=30 * meses)
+
+    sqlite = e_sqlite(conn)
+    copias = {
+        'usuarios': _Copiador('usuarios', ('id', 'email', 'senha_hash', 'versao'), sqlite),
+        'contas': _Copiador('contas', ('id', 'user_id', 'nome', 'casa_de_aposta', 'saldo', 'saldo_freebets', 'meta', 'dia_pagamento', 'valor_pagamento'), sqlite),
+        'operacoes': _Copiador('operacoes', ('id', 'user_id', 'categoria', 'status', 'data_criacao'), sqlite),
+        'transacoes': _Copiador('transacoes', ('id', 'conta_id', 'user_id', 'tipo', 'valor', 'descricao', 'detalhes', 'data_criacao', 'operacao_id'), sqlite),
+        'apostas': _Copiador('apostas', ('transacao_id', 'user_id', 'operacao_id', 'conta_id', 'resultado', 'odd', 'stake', 'is_freebet', 'status'), sqlite),
+    }
+    conta_id = transacao_id = 0
+    por_usuario = max(transacoes // max(usuarios, 1), 1)
+    for user_id in range(1, usuarios + 1):
+        copias['usuarios'].escrever((user_id, email_usuario(user_id), senha_hash, 1))
+        ids_contas = list(range(conta_id + 1, conta_id + contas + 1))
+        conta_id += contas
+        saldos = dict.fromkeys(ids_contas, 0.0)
+
+        # Cada operação gera em média ~3,5 linhas (2-3 apostas + ganho); o resto são avulsos
+        n_operacoes = max(int(por_usuario * FRACAO_APOSTAS / 3.5), operacoes_ativas)
+        n_avulsos = max(por_usuario - int(n_operacoes * 3.5), 0)
+        eventos = ['op'] * n_operacoes + ['av'] * n_avulsos
+        rnd.shuffle(eventos)
+        passo = (fim_periodo - inicio_periodo) / max(len(eventos), 1)
+        ops_restantes = n_operacoes
+        for i, evento in enumerate(eventos):
+            data = (inicio_periodo + passo * i).isoformat(sep=' ')
+            if evento == 'av':
+                tipo, sinal = rnd.choice(AVULSOS)
+                conta = rnd.choice(ids_contas)
+                valor = round(rnd.uniform(5, 500), 2) * sinal
+                saldos[conta] += valor
+                transacao_id += 1
+                copias['transacoes'].escrever((transacao_id, conta, user_id, tipo, valor, f'{tipo} sintético', None, data, None))
+                continue
+            ops_restantes -= 1
+            ativa = ops_restantes < operacoes_ativas  # as mais recentes ficam em aberto
+            operation_id = f'op_{uuid.UUID(int=rnd.getrandbits(128)).hex}'
+            categoria = rnd.choice(CATEGORIAS)
+            copias['operacoes'].escrever((operation_id, user_id, categoria, 'ativa' if ativa else 'resolvida', data))
+            pernas = [('Casa', round(rnd.uniform(1.5, 3.5), 2)), ('Fora', round(rnd.uniform(1.5, 3.5), 2))]
+            if rnd.random() < 0.5:
+                pernas.append(('Empate', round(rnd.uniform(2.5, 4.5), 2)))
+            vencedora = None if ativa else rnd.randrange(len(pernas))
+            for indice, (resultado, odd) in enumerate(pernas):
+                conta, stake = rnd.choice(ids_contas), round(rnd.uniform(10, 200), 2)
+                status = 'ativa' if ativa else 'ganha' if indice == vencedora else 'perdida'
+                detalhes = json.dumps({'operationId': operation_id, 'result': resultado, 'category': categoria, 'odd': odd, 'stake': stake, 'isFreebet': False, 'status': status})
+                saldos[conta] -= stake
+                transacao_id += 1
+                copias['transacoes'].escrever((transacao_id, conta, user_id, 'bet_placed', -stake, f'Jogo {i} - {resultado}', detalhes, data, operation_id))
+                copias['apostas'].escrever((transacao_id, user_id, operation_id, conta, resultado, odd, stake, False, status))
+                if status == 'ganha':
+                    retorno = round(stake * odd, 2)
+                    saldos[conta] += retorno
+                    transacao_id += 1
+                    copias['transacoes'].escrever((transacao_id, conta, user_id, 'bet_won', retorno, f'Ganho: Jogo {i} - {resultado}', detalhes, data, operation_id))
+        for indice, conta in enumerate(ids_contas):
+            casa = CASAS[indice % len(CASAS)]
+            pagamento = (rnd.randint(1, 28), round(rnd.uniform(50, 300), 2)) if casa == 'pessoal' else (None, None)
+            copias['contas'].escrever((conta, user_id, f'Conta {indice + 1:03d}', casa, round(saldos[conta], 2), 0, 100, *pagamento))
+        log(f'Usuário {user_id}: {n_operacoes} operações, {n_avulsos} lançamentos avulsos')
+
+    with conn, conn.cursor() as cursor:
+        if not sqlite:
+            # Uma partição por mês do período gerado, em vez de tudo cair em transacoes_padrao
+            cursor.execute("""SELECT criar_particao_transacoes(mes::date)
+                              FROM generate_series(date_trunc('month', %s::timestamp), date_trunc('month', %s::timestamp), INTERVAL '1 month') mes""",
+                           (inicio_periodo, fim_periodo))
+        for tabela in ('usuarios', 'contas', 'operacoes', 'transacoes', 'apostas'):
+            log(f'COPY {tabela}: {copias[tabela].linhas} linhas')
+            copias[tabela].copiar(cursor)
+        if not sqlite:  # no SQLite, AUTOINCREMENT já acompanha o maior id inserido
+            for tabela in ('usuarios', 'contas', 'transacoes'):
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), COALESCE((SELECT MAX(id) FROM {tabela}), 1))")
+        log('Reconstruindo resumo_mensal')
+        appmod.reconstruir_resumo(cursor)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    finally:
+        conn.autocommit = False
+    log(f'Dados gerados em {time.monotonic() - inicio:.1f}s')
+    return contar(conn)
+
+def contar(conn):
+    with conn, conn.cursor() as cursor:
+        totais = {}
+        for tabela in ('usuarios', 'contas', 'operacoes', 'transacoes', 'apostas', 'resumo_mensal'):
+            cursor.execute(f'SELECT COUNT(*) FROM {tabela}')
+            totais[tabela] = cursor.fetchone()[0]
+    return totais
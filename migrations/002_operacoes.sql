@@ -0,0 +1,50 @@
+-- Operações e apostas como dados de primeira classe, indexados.
+-- Antes viviam apenas em transacoes.detalhes (JSON) e eram encontradas por varredura.
+
+CREATE TABLE operacoes (
+    id TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    categoria TEXT,
+    status TEXT NOT NULL DEFAULT 'ativa',
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX idx_operacoes_ativas ON operacoes (user_id) WHERE status = 'ativa';
+
+ALTER TABLE transacoes ADD COLUMN operacao_id TEXT;
+
+CREATE TABLE apostas (
+    transacao_id INTEGER PRIMARY KEY REFERENCES transacoes(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    operacao_id TEXT NOT NULL,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    resultado TEXT,
+    odd NUMERIC NOT NULL,
+    stake NUMERIC NOT NULL,
+    is_freebet BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'ativa',
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+);
+
+-- Migra as operações existentes a partir de detalhes (ids antigos op_<timestamp> são únicos por usuário)
+INSERT INTO operacoes (id, user_id, categoria, status, data_criacao)
+SELECT detalhes->>'operationId', user_id, MAX(detalhes->>'category'),
+       CASE WHEN BOOL_OR(tipo = 'bet_placed' AND detalhes->>'status' = 'ativa') THEN 'ativa' ELSE 'resolvida' END,
+       MIN(data_criacao)
+FROM transacoes
+WHERE detalhes->>'operationId' IS NOT NULL
+GROUP BY detalhes->>'operationId', user_id;
+
+UPDATE transacoes SET operacao_id = detalhes->>'operationId' WHERE detalhes->>'operationId' IS NOT NULL;
+
+INSERT INTO apostas (transacao_id, user_id, operacao_id, conta_id, resultado, odd, stake, is_freebet, status)
+SELECT id, user_id, operacao_id, conta_id, detalhes->>'result',
+       COALESCE((detalhes->>'odd')::numeric, 0), COALESCE((detalhes->>'stake')::numeric, 0),
+       COALESCE((detalhes->>'isFreebet')::boolean, FALSE), COALESCE(detalhes->>'status', 'ativa')
+FROM transacoes
+WHERE tipo = 'bet_placed' AND operacao_id IS NOT NULL;
+
+ALTER TABLE transacoes ADD FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE;
+CREATE INDEX idx_transacoes_operacao ON transacoes (user_id, operacao_id) WHERE operacao_id IS NOT NULL;
+CREATE INDEX idx_apostas_operacao ON apostas (user_id, operacao_id);
+CREATE INDEX idx_apostas_ativas ON apostas (user_id) WHERE status = 'ativa';
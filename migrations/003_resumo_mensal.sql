@@ -0,0 +1,22 @@
+-- Agregados mensais por (usuário, conta, mês, tipo) para o resumo do painel e o /api/relatorio.
+-- Podem ser conferidos/recalculados com `flask resumo-rebuild`.
+
+CREATE TABLE resumo_mensal (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    mes DATE NOT NULL,
+    tipo TEXT NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    creditos NUMERIC NOT NULL DEFAULT 0,
+    debitos NUMERIC NOT NULL DEFAULT 0,
+    apostado NUMERIC NOT NULL DEFAULT 0,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, mes, conta_id, tipo)
+);
+
+INSERT INTO resumo_mensal (user_id, conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade)
+SELECT t.user_id, t.conta_id, date_trunc('month', t.data_criacao)::date, t.tipo,
+       SUM(t.valor), SUM(GREATEST(t.valor, 0)), SUM(LEAST(t.valor, 0)), COALESCE(SUM(a.stake), 0), COUNT(*)
+FROM transacoes t LEFT JOIN apostas a ON a.transacao_id = t.id
+WHERE t.data_criacao IS NOT NULL
+GROUP BY 1, 2, 3, 4;
@@ -0,0 +1,8 @@
+-- Nome de conta único por usuário: é a chave do upsert do /api/import-csv.
+-- Contas duplicadas já existentes (exceto a mais antiga) ganham o sufixo " #<id>".
+
+UPDATE contas c SET nome = c.nome || ' #' || c.id
+FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, nome ORDER BY id) AS n FROM contas) d
+WHERE d.id = c.id AND d.n > 1;
+
+ALTER TABLE contas ADD CONSTRAINT contas_user_nome_key UNIQUE (user_id, nome);
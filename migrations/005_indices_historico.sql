@@ -0,0 +1,6 @@
+-- Índices compostos para a paginação por cursor (data_criacao, id) do /api/transacoes:
+-- a página N custa o mesmo que a primeira, com ou sem filtro de conta/tipo.
+
+CREATE INDEX idx_transacoes_usuario_data ON transacoes (user_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_conta_data ON transacoes (conta_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_usuario_tipo_data ON transacoes (user_id, tipo, data_criacao DESC, id DESC);
@@ -0,0 +1,20 @@
+-- Versão de dados por usuário para o ETag e a sincronização incremental (?since=) do /api/dados-iniciais.
+-- Linhas existentes ficam com versao 0: clientes sem versão sempre recebem a carga completa.
+
+ALTER TABLE usuarios ADD COLUMN versao BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE usuarios ADD COLUMN versao_reset BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE contas ADD COLUMN versao BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE operacoes ADD COLUMN versao BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE transacoes ADD COLUMN versao BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_contas_versao ON contas (user_id, versao);
+CREATE INDEX idx_operacoes_versao ON operacoes (user_id, versao);
+CREATE INDEX idx_transacoes_versao ON transacoes (user_id, versao);
+
+CREATE TABLE exclusoes (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    entidade TEXT NOT NULL,
+    entidade_id TEXT NOT NULL,
+    versao BIGINT NOT NULL
+);
+CREATE INDEX idx_exclusoes_versao ON exclusoes (user_id, versao);
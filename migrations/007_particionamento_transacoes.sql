@@ -0,0 +1,92 @@
+-- Particiona transacoes por mês de data_criacao (RANGE), com uma partição padrão para o que cair
+-- fora dos meses já criados. A chave primária passa a ser (id, data_criacao) e data_criacao vira NOT NULL;
+-- linhas antigas sem data ficam com o instante da migração.
+-- apostas deixa de ter FK para transacoes (FKs para tabelas particionadas exigem a chave de partição);
+-- a limpeza continua garantida pela FK de apostas para operacoes, que apaga em cascata.
+
+UPDATE transacoes SET data_criacao = LOCALTIMESTAMP WHERE data_criacao IS NULL;
+
+ALTER TABLE apostas DROP CONSTRAINT apostas_transacao_id_fkey;
+
+ALTER TABLE transacoes RENAME TO transacoes_antiga;
+ALTER TABLE transacoes_antiga RENAME CONSTRAINT transacoes_pkey TO transacoes_antiga_pkey;
+DROP INDEX idx_transacoes_operacao, idx_transacoes_usuario_data, idx_transacoes_conta_data, idx_transacoes_usuario_tipo_data, idx_transacoes_versao;
+
+CREATE TABLE transacoes (
+    id INTEGER NOT NULL DEFAULT nextval('transacoes_id_seq'),
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,
+    valor NUMERIC NOT NULL,
+    descricao TEXT,
+    detalhes JSON,
+    data_criacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    operacao_id TEXT,
+    versao BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, data_criacao),
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+) PARTITION BY RANGE (data_criacao);
+-- A sequence passa para a tabela nova antes de a antiga ser removida
+ALTER SEQUENCE transacoes_id_seq OWNED BY transacoes.id;
+CREATE TABLE transacoes_padrao PARTITION OF transacoes DEFAULT;
+
+CREATE INDEX idx_transacoes_operacao ON transacoes (user_id, operacao_id) WHERE operacao_id IS NOT NULL;
+CREATE INDEX idx_transacoes_usuario_data ON transacoes (user_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_conta_data ON transacoes (conta_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_usuario_tipo_data ON transacoes (user_id, tipo, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_versao ON transacoes (user_id, versao);
+
+-- Cria a partição do mês de `mes`, se ainda não existir. Linhas do mês que tenham caído na partição
+-- padrão são movidas para ela antes do ATTACH (senão o PostgreSQL recusa a nova partição).
+CREATE OR REPLACE FUNCTION criar_particao_transacoes(mes DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fim DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nome TEXT := 'transacoes_' || to_char(mes, 'YYYY_MM');
+BEGIN
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE transacoes INCLUDING DEFAULTS)', nome);
+    EXECUTE format('WITH movidas AS (DELETE FROM transacoes_padrao WHERE data_criacao >= %L AND data_criacao < %L RETURNING *)
+                    INSERT INTO %I SELECT * FROM movidas', inicio, fim, nome);
+    EXECUTE format('ALTER TABLE transacoes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Garante as partições do mês corrente e dos `meses_a_frente` seguintes; devolve quantas criou.
+CREATE OR REPLACE FUNCTION criar_particoes_transacoes(meses_a_frente INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    criadas INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('criar_particoes_transacoes'));
+    FOR i IN 0..meses_a_frente LOOP
+        IF criar_particao_transacoes((date_trunc('month', LOCALTIMESTAMP) + make_interval(months => i))::date) THEN
+            criadas := criadas + 1;
+        END IF;
+    END LOOP;
+    RETURN criadas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partições arquivadas (`flask transacoes-arquivar`): os meses anteriores a `fim` não são mais
+-- recalculados no resumo_mensal, que guarda os totais desses meses.
+CREATE TABLE transacoes_arquivadas (
+    nome TEXT PRIMARY KEY,
+    inicio DATE NOT NULL,
+    fim DATE NOT NULL,
+    linhas BIGINT NOT NULL,
+    destino TEXT NOT NULL,  -- tabela no schema arquivo ou arquivo .csv.gz exportado
+    arquivada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+SELECT criar_particao_transacoes(mes::date)
+FROM generate_series(date_trunc('month', (SELECT MIN(data_criacao) FROM transacoes_antiga)), date_trunc('month', LOCALTIMESTAMP), INTERVAL '1 month') mes;
+SELECT criar_particoes_transacoes(3);
+
+INSERT INTO transacoes (id, conta_id, user_id, tipo, valor, descricao, detalhes, data_criacao, operacao_id, versao)
+SELECT id, conta_id, user_id, tipo, valor, descricao, detalhes, data_criacao, operacao_id, versao FROM transacoes_antiga;
+
+DROP TABLE transacoes_antiga;
+ANALYZE transacoes;
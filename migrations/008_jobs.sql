@@ -0,0 +1,23 @@
+-- Fila de tarefas em segundo plano (backup, restore, importação de CSV), consumida pelos
+-- workers da própria aplicação. Os arquivos de entrada e saída ficam em JOBS_DIR.
+
+CREATE TABLE jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,                        -- backup | restore | import-csv
+    status TEXT NOT NULL DEFAULT 'pendente',   -- pendente | executando | concluido | erro | cancelado
+    parametros JSON NOT NULL DEFAULT '{}',
+    progresso JSON,
+    resultado JSON,
+    erro TEXT,
+    arquivo_saida TEXT,                        -- nome do arquivo para download (exportações)
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    iniciado_em TIMESTAMP,
+    heartbeat_em TIMESTAMP,
+    concluido_em TIMESTAMP
+);
+CREATE INDEX idx_jobs_fila ON jobs (criado_em) WHERE status = 'pendente';
+CREATE INDEX idx_jobs_executando ON jobs (user_id) WHERE status = 'executando';
+CREATE INDEX idx_jobs_usuario ON jobs (user_id, criado_em DESC);
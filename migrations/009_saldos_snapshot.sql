@@ -0,0 +1,14 @@
+-- Saldo de cada conta em instantes fixos (início de cada dia/semana/mês, conforme SALDOS_SNAPSHOT_INTERVALO):
+-- o saldo em `em` inclui as transações com data_criacao < em. O snapshot de abertura (em = -infinity) é o saldo
+-- atual menos tudo o que o ledger tinha quando a conta foi ancorada; os seguintes são o anterior mais o delta do período.
+-- Os snapshots são criados sob demanda (API de saldos) ou por `flask saldos-snapshot`.
+
+CREATE TABLE saldos_snapshot (
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    em TIMESTAMP NOT NULL,
+    saldo NUMERIC NOT NULL,
+    saldo_freebets NUMERIC NOT NULL,
+    PRIMARY KEY (conta_id, em)
+);
+CREATE INDEX idx_saldos_snapshot_usuario ON saldos_snapshot (user_id, em);
@@ -0,0 +1,27 @@
+-- criar_particao_transacoes passa a recusar meses já arquivados. Antes, um restore ou o garantir_particoes
+-- que chegasse a um desses meses criava em silêncio uma partição viva nova para ele.
+
+-- Cria a partição do mês de `mes`, se ainda não existir. Linhas do mês que tenham caído na partição
+-- padrão são movidas para ela antes do ATTACH (senão o PostgreSQL recusa a nova partição).
+-- Meses até o limite do arquivo (transacoes_arquivadas) são recusados: a partição deles já foi movida para
+-- o schema arquivo (que to_regclass, pelo search_path, não enxerga) ou exportada.
+CREATE OR REPLACE FUNCTION criar_particao_transacoes(mes DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fim DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nome TEXT := 'transacoes_' || to_char(mes, 'YYYY_MM');
+    fim_arquivo DATE := (SELECT MAX(a.fim) FROM transacoes_arquivadas a);
+BEGIN
+    IF inicio < fim_arquivo OR to_regclass(format('arquivo.%I', nome)) IS NOT NULL THEN
+        RAISE EXCEPTION 'Mês % já arquivado (transacoes_arquivadas vai até %)', to_char(inicio, 'YYYY-MM'), fim_arquivo;
+    END IF;
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE transacoes INCLUDING DEFAULTS)', nome);
+    EXECUTE format('WITH movidas AS (DELETE FROM transacoes_padrao WHERE data_criacao >= %L AND data_criacao < %L RETURNING *)
+                    INSERT INTO %I SELECT * FROM movidas', inicio, fim, nome);
+    EXECUTE format('ALTER TABLE transacoes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1 @@
+-- Sem partições no SQLite: nada a fazer (a migração 010 só redefine criar_particao_transacoes no PostgreSQL).
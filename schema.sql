@@ -1,14 +1,31 @@
 -- Apaga as tabelas se elas já existirem para garantir um início limpo
+DROP TABLE IF EXISTS saldos_snapshot;
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS transacoes_arquivadas;
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS resumo_mensal;
+DROP TABLE IF EXISTS exclusoes;
+DROP TABLE IF EXISTS apostas;
 DROP TABLE IF EXISTS transacoes;
+DROP TABLE IF EXISTS operacoes;
 DROP TABLE IF EXISTS contas;
 DROP TABLE IF EXISTS usuarios;
 
+-- Migrações de migrations/ já contempladas por este schema (ver `flask db-migrate`)
+CREATE TABLE schema_migrations (
+    versao TEXT PRIMARY KEY,
+    aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO schema_migrations (versao) VALUES ('002_operacoes'), ('003_resumo_mensal'), ('004_contas_nome_unico'), ('005_indices_historico'), ('006_versionamento'), ('007_particionamento_transacoes'), ('008_jobs'), ('009_saldos_snapshot'), ('010_particao_arquivada');
+
 -- Tabela para armazenar os usuários do sistema
 CREATE TABLE usuarios (
     id SERIAL PRIMARY KEY,
     email TEXT UNIQUE NOT NULL,
     senha_hash TEXT NOT NULL,
-    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    versao BIGINT NOT NULL DEFAULT 0,       -- incrementada a cada escrita nos dados do usuário
+    versao_reset BIGINT NOT NULL DEFAULT 0  -- versão da última substituição completa (restore)
 );
 
 -- Tabela para as contas (de apostas ou pessoais)
@@ -26,17 +43,172 @@ CREATE TABLE contas (
     observacoes TEXT,
     ultimo_periodo_pago TEXT,
     ativa BOOLEAN DEFAULT TRUE,
-    data_ultimo_codigo DATE
+    data_ultimo_codigo DATE,
+    versao BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT contas_user_nome_key UNIQUE (user_id, nome)
 );
+CREATE INDEX idx_contas_versao ON contas (user_id, versao);
 
--- Tabela para o histórico de transações
+-- Operações de aposta (agrupam as apostas de todas as pernas)
+CREATE TABLE operacoes (
+    id TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    categoria TEXT,
+    status TEXT NOT NULL DEFAULT 'ativa',  -- ativa | resolvida
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    versao BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX idx_operacoes_versao ON operacoes (user_id, versao);
+CREATE INDEX idx_operacoes_ativas ON operacoes (user_id) WHERE status = 'ativa';
+
+-- Tabela para o histórico de transações, particionada por mês de data_criacao.
+-- Partições mensais transacoes_AAAA_MM são criadas por criar_particoes_transacoes() (chamada pela
+-- aplicação uma vez por dia e por `flask transacoes-particoes`); o que cair fora delas vai para transacoes_padrao.
 CREATE TABLE transacoes (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
     user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
     tipo TEXT NOT NULL,
     valor NUMERIC NOT NULL,
     descricao TEXT,
     detalhes JSON,
-    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    data_criacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    operacao_id TEXT,
+    versao BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, data_criacao),
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+) PARTITION BY RANGE (data_criacao);
+CREATE TABLE transacoes_padrao PARTITION OF transacoes DEFAULT;
+CREATE INDEX idx_transacoes_operacao ON transacoes (user_id, operacao_id) WHERE operacao_id IS NOT NULL;
+-- Paginação por cursor (data_criacao, id) do histórico, com e sem filtros de conta e tipo
+CREATE INDEX idx_transacoes_usuario_data ON transacoes (user_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_conta_data ON transacoes (conta_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_usuario_tipo_data ON transacoes (user_id, tipo, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_versao ON transacoes (user_id, versao);
+
+-- Cria a partição do mês de `mes`, se ainda não existir. Linhas do mês que tenham caído na partição
+-- padrão são movidas para ela antes do ATTACH (senão o PostgreSQL recusa a nova partição).
+-- Meses até o limite do arquivo (transacoes_arquivadas) são recusados: a partição deles já foi movida para
+-- o schema arquivo (que to_regclass, pelo search_path, não enxerga) ou exportada.
+CREATE OR REPLACE FUNCTION criar_particao_transacoes(mes DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fim DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nome TEXT := 'transacoes_' || to_char(mes, 'YYYY_MM');
+    fim_arquivo DATE := (SELECT MAX(a.fim) FROM transacoes_arquivadas a);
+BEGIN
+    IF inicio < fim_arquivo OR to_regclass(format('arquivo.%I', nome)) IS NOT NULL THEN
+        RAISE EXCEPTION 'Mês % já arquivado (transacoes_arquivadas vai até %)', to_char(inicio, 'YYYY-MM'), fim_arquivo;
+    END IF;
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE transacoes INCLUDING DEFAULTS)', nome);
+    EXECUTE format('WITH movidas AS (DELETE FROM transacoes_padrao WHERE data_criacao >= %L AND data_criacao < %L RETURNING *)
+                    INSERT INTO %I SELECT * FROM movidas', inicio, fim, nome);
+    EXECUTE format('ALTER TABLE transacoes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Garante as partições do mês corrente e dos `meses_a_frente` seguintes; devolve quantas criou.
+CREATE OR REPLACE FUNCTION criar_particoes_transacoes(meses_a_frente INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    criadas INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('criar_particoes_transacoes'));
+    FOR i IN 0..meses_a_frente LOOP
+        IF criar_particao_transacoes((date_trunc('month', LOCALTIMESTAMP) + make_interval(months => i))::date) THEN
+            criadas := criadas + 1;
+        END IF;
+    END LOOP;
+    RETURN criadas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partições arquivadas (`flask transacoes-arquivar`): os meses anteriores a `fim` não são mais
+-- recalculados no resumo_mensal, que guarda os totais desses meses.
+CREATE TABLE transacoes_arquivadas (
+    nome TEXT PRIMARY KEY,
+    inicio DATE NOT NULL,
+    fim DATE NOT NULL,
+    linhas BIGINT NOT NULL,
+    destino TEXT NOT NULL,  -- tabela no schema arquivo ou arquivo .csv.gz exportado
+    arquivada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+SELECT criar_particoes_transacoes(3);
+
+-- Apostas (uma por transação bet_placed), indexadas por operação e status
+CREATE TABLE apostas (
+    transacao_id INTEGER PRIMARY KEY,  -- sem FK: transacoes é particionada; a limpeza vem da FK de operacoes
+    user_id INTEGER NOT NULL,
+    operacao_id TEXT NOT NULL,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    resultado TEXT,
+    odd NUMERIC NOT NULL,
+    stake NUMERIC NOT NULL,
+    is_freebet BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'ativa',  -- ativa | ganha | perdida
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX idx_apostas_operacao ON apostas (user_id, operacao_id);
+CREATE INDEX idx_apostas_ativas ON apostas (user_id) WHERE status = 'ativa';
+
+-- Agregados mensais por conta e tipo, mantidos na mesma transação de cada escrita em transacoes
+CREATE TABLE resumo_mensal (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    mes DATE NOT NULL,
+    tipo TEXT NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,     -- soma de valor
+    creditos NUMERIC NOT NULL DEFAULT 0,  -- soma dos valores positivos
+    debitos NUMERIC NOT NULL DEFAULT 0,   -- soma dos valores negativos
+    apostado NUMERIC NOT NULL DEFAULT 0,  -- soma das stakes (bet_placed)
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, mes, conta_id, tipo)
+);
+
+-- Registros apagados (transações e operações), para a sincronização incremental do painel
+CREATE TABLE exclusoes (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    entidade TEXT NOT NULL,  -- transacao | operacao
+    entidade_id TEXT NOT NULL,
+    versao BIGINT NOT NULL
+);
+CREATE INDEX idx_exclusoes_versao ON exclusoes (user_id, versao);
+
+-- Fila de tarefas em segundo plano (backup, restore, importação de CSV)
+CREATE TABLE jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,                        -- backup | restore | import-csv
+    status TEXT NOT NULL DEFAULT 'pendente',   -- pendente | executando | concluido | erro | cancelado
+    parametros JSON NOT NULL DEFAULT '{}',
+    progresso JSON,
+    resultado JSON,
+    erro TEXT,
+    arquivo_saida TEXT,                        -- nome do arquivo para download (exportações)
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    iniciado_em TIMESTAMP,
+    heartbeat_em TIMESTAMP,
+    concluido_em TIMESTAMP
+);
+CREATE INDEX idx_jobs_fila ON jobs (criado_em) WHERE status = 'pendente';
+CREATE INDEX idx_jobs_executando ON jobs (user_id) WHERE status = 'executando';
+CREATE INDEX idx_jobs_usuario ON jobs (user_id, criado_em DESC);
+
+-- Saldo de cada conta no início de cada período (SALDOS_SNAPSHOT_INTERVALO), para consultar o saldo em
+-- qualquer data a partir do snapshot mais próximo. em = -infinity é o snapshot de abertura da conta.
+CREATE TABLE saldos_snapshot (
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    em TIMESTAMP NOT NULL,  -- inclui as transações com data_criacao < em
+    saldo NUMERIC NOT NULL,
+    saldo_freebets NUMERIC NOT NULL,
+    PRIMARY KEY (conta_id, em)
 );
+CREATE INDEX idx_saldos_snapshot_usuario ON saldos_snapshot (user_id, em);
@@ -0,0 +1,152 @@
+-- Schema do backend SQLite (DATABASE_URL=sqlite:///arquivo.db), equivalente ao schema.sql do PostgreSQL.
+-- Criado por `flask --app app db-migrate` em um arquivo vazio. Diferenças:
+--   * ids com INTEGER PRIMARY KEY AUTOINCREMENT (ids apagados não são reaproveitados, como nas sequences);
+--   * transacoes não é particionada (transacoes-particoes e transacoes-arquivar são só do PostgreSQL);
+--   * JSON fica em texto, consultado com as funções JSON1, e há um índice de expressão em detalhes->>'operationId';
+--   * timestamps usam agora(), registrada pela aplicação em cada conexão: hora local fixa durante a transação,
+--     como LOCALTIMESTAMP (o CURRENT_TIMESTAMP do SQLite é UTC). Por isso o arquivo só aceita escritas pela aplicação.
+
+CREATE TABLE schema_migrations (
+    versao TEXT PRIMARY KEY,
+    aplicada_em TIMESTAMP DEFAULT (agora())
+);
+INSERT INTO schema_migrations (versao) VALUES ('002_operacoes'), ('003_resumo_mensal'), ('004_contas_nome_unico'), ('005_indices_historico'), ('006_versionamento'), ('007_particionamento_transacoes'), ('008_jobs'), ('009_saldos_snapshot'), ('010_particao_arquivada');
+
+CREATE TABLE usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    senha_hash TEXT NOT NULL,
+    data_criacao TIMESTAMP DEFAULT (agora()),
+    versao BIGINT NOT NULL DEFAULT 0,
+    versao_reset BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE contas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    nome TEXT NOT NULL,
+    casa_de_aposta TEXT,
+    saldo NUMERIC DEFAULT 0.00,
+    saldo_freebets NUMERIC DEFAULT 0.00,
+    meta NUMERIC DEFAULT 100.00,
+    volume_clube NUMERIC DEFAULT 0.00,
+    dia_pagamento INTEGER,
+    valor_pagamento NUMERIC,
+    observacoes TEXT,
+    ultimo_periodo_pago TEXT,
+    ativa BOOLEAN DEFAULT TRUE,
+    data_ultimo_codigo DATE,
+    versao BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT contas_user_nome_key UNIQUE (user_id, nome)
+);
+CREATE INDEX idx_contas_versao ON contas (user_id, versao);
+
+CREATE TABLE operacoes (
+    id TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    categoria TEXT,
+    status TEXT NOT NULL DEFAULT 'ativa',  -- ativa | resolvida
+    data_criacao TIMESTAMP DEFAULT (agora()),
+    versao BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX idx_operacoes_versao ON operacoes (user_id, versao);
+CREATE INDEX idx_operacoes_ativas ON operacoes (user_id) WHERE status = 'ativa';
+
+CREATE TABLE transacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,
+    valor NUMERIC NOT NULL,
+    descricao TEXT,
+    detalhes JSON,
+    data_criacao TIMESTAMP NOT NULL DEFAULT (agora()),
+    operacao_id TEXT,
+    versao BIGINT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX idx_transacoes_operacao ON transacoes (user_id, operacao_id) WHERE operacao_id IS NOT NULL;
+CREATE INDEX idx_transacoes_usuario_data ON transacoes (user_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_conta_data ON transacoes (conta_id, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_usuario_tipo_data ON transacoes (user_id, tipo, data_criacao DESC, id DESC);
+CREATE INDEX idx_transacoes_versao ON transacoes (user_id, versao);
+-- Reconstrução de operacoes/apostas a partir de detalhes no restore (sincronizar_operacoes)
+CREATE INDEX idx_transacoes_detalhes_operacao ON transacoes (user_id, detalhes->>'operationId') WHERE detalhes->>'operationId' IS NOT NULL;
+
+-- Sempre vazia no SQLite; existe para as consultas que excluem os meses arquivados
+CREATE TABLE transacoes_arquivadas (
+    nome TEXT PRIMARY KEY,
+    inicio DATE NOT NULL,
+    fim DATE NOT NULL,
+    linhas BIGINT NOT NULL,
+    destino TEXT NOT NULL,
+    arquivada_em TIMESTAMP DEFAULT (agora())
+);
+
+CREATE TABLE apostas (
+    transacao_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    operacao_id TEXT NOT NULL,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    resultado TEXT,
+    odd NUMERIC NOT NULL,
+    stake NUMERIC NOT NULL,
+    is_freebet BOOLEAN NOT NULL DEFAULT FALSE,
+    status TEXT NOT NULL DEFAULT 'ativa',  -- ativa | ganha | perdida
+    FOREIGN KEY (user_id, operacao_id) REFERENCES operacoes(user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX idx_apostas_operacao ON apostas (user_id, operacao_id);
+CREATE INDEX idx_apostas_ativas ON apostas (user_id) WHERE status = 'ativa';
+
+CREATE TABLE resumo_mensal (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    mes DATE NOT NULL,
+    tipo TEXT NOT NULL,
+    total NUMERIC NOT NULL DEFAULT 0,
+    creditos NUMERIC NOT NULL DEFAULT 0,
+    debitos NUMERIC NOT NULL DEFAULT 0,
+    apostado NUMERIC NOT NULL DEFAULT 0,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, mes, conta_id, tipo)
+);
+
+CREATE TABLE exclusoes (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    entidade TEXT NOT NULL,  -- transacao | operacao
+    entidade_id TEXT NOT NULL,
+    versao BIGINT NOT NULL
+);
+CREATE INDEX idx_exclusoes_versao ON exclusoes (user_id, versao);
+
+CREATE TABLE jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,                        -- backup | restore | import-csv
+    status TEXT NOT NULL DEFAULT 'pendente',   -- pendente | executando | concluido | erro | cancelado
+    parametros JSON NOT NULL DEFAULT '{}',
+    progresso JSON,
+    resultado JSON,
+    erro TEXT,
+    arquivo_saida TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT (agora()),
+    iniciado_em TIMESTAMP,
+    heartbeat_em TIMESTAMP,
+    concluido_em TIMESTAMP
+);
+CREATE INDEX idx_jobs_fila ON jobs (criado_em) WHERE status = 'pendente';
+CREATE INDEX idx_jobs_executando ON jobs (user_id) WHERE status = 'executando';
+CREATE INDEX idx_jobs_usuario ON jobs (user_id, criado_em DESC);
+
+CREATE TABLE saldos_snapshot (
+    conta_id INTEGER NOT NULL REFERENCES contas(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    em TIMESTAMP NOT NULL,  -- inclui as transações com data_criacao < em; '-infinity' é o snapshot de abertura
+    saldo NUMERIC NOT NULL,
+    saldo_freebets NUMERIC NOT NULL,
+    PRIMARY KEY (conta_id, em)
+);
+CREATE INDEX idx_saldos_snapshot_usuario ON saldos_snapshot (user_id, em);
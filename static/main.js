@@ -3,6 +3,9 @@ document.addEventListener('DOMContentLoaded', () => {
     let allAccounts = [];
     let activeOperations = [];
     let transactionHistory = [];
+    let historyCursor = null;
+    let loadingHistory = false;
+    let dataVersion = null;
 
     // --- SELETORES DE ELEMENTOS DO DOM ---
     const modals = { account: setupModal(document.getElementById('account-modal')), transaction: setupModal(document.getElementById('transaction-modal')), expense: setupModal(document.getElementById('expense-modal')), transfer: setupModal(document.getElementById('transfer-modal')), report: setupModal(document.getElementById('report-modal')), }; const addAccountBtn = document.getElementById('add-account-btn'); const addTransactionBtn = document.getElementById('add-transaction-btn'); const addExpenseBtn = document.getElementById('add-expense-btn'); const transferBtn = document.getElementById('transfer-btn'); const reportBtn = document.getElementById('report-btn'); const backupBtn = document.getElementById('backup-btn'); const accountForm = document.getElementById('account-form'); const transactionForm = document.getElementById('transaction-form'); const expenseForm = document.getElementById('expense-form'); const transferForm = document.getElementById('transfer-form'); const operationForm = document.getElementById('operation-form'); const operationCategorySelect = document.getElementById('operation-category'); const legsContainer = document.getElementById('legs-container'); const addLegBtn = document.getElementById('add-leg-btn'); const activeOperationsContainer = document.getElementById('active-operations-container'); const mainTabsContainer = document.getElementById('main-tabs-container'); const mainContainer = document.querySelector('.max-w-screen-xl');
@@ -14,6 +17,29 @@ document.addEventListener('DOMContentLoaded', () => {
     const importCsvBtn = document.getElementById('import-csv-btn');
     const downloadTemplateBtn = document.getElementById('download-template-btn');
 
+    // Acompanha uma tarefa em segundo plano (/api/jobs/<id>) até terminar; devolve o job concluído
+    async function aguardarJob(jobId, onProgress) {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.error);
+            if (job.status === 'concluido') return job;
+            if (job.status === 'erro' || job.status === 'cancelado') throw new Error(job.erro || 'A tarefa não foi concluída');
+            if (onProgress) onProgress(job);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
+    // Envia o formulário como tarefa (async=1) e espera o resultado
+    async function executarJob(endpoint, formData) {
+        formData.append('async', '1');
+        const response = await fetch(endpoint, { method: 'POST', body: formData });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error);
+        const job = await aguardarJob(result.jobId);
+        return job.resultado;
+    }
+
     // Habilita/desabilita botão de restaurar
     restoreFileInput.addEventListener('change', () => {
         restoreBtn.disabled = !restoreFileInput.files.length;
@@ -41,13 +67,10 @@ document.addEventListener('DOMContentLoaded', () => {
             restoreBtn.innerHTML = '<div class="spinner mx-auto"></div>';
             restoreBtn.disabled = true;
 
-            const response = await fetch('/api/restore', { method: 'POST', body: formData });
-            const result = await response.json();
-
-            if (!response.ok) throw new Error(result.error);
+            const result = await executarJob('/api/restore', formData);
 
             showToast(result.message, 'success');
-            initializeApp();
+            syncData();
         } catch (error) {
             showToast(error.message, 'error');
         } finally {
@@ -71,13 +94,10 @@ document.addEventListener('DOMContentLoaded', () => {
             importCsvBtn.innerHTML = '<div class="spinner mx-auto"></div>';
             importCsvBtn.disabled = true;
             
-            const response = await fetch('/api/import-csv', { method: 'POST', body: formData });
-            const result = await response.json();
+            const result = await executarJob('/api/import-csv', formData);
 
-            if (!response.ok) throw new Error(result.error);
-            
             showToast(result.message, 'success');
-            initializeApp();
+            syncData();
         } catch (error) {
             showToast(error.message, 'error');
         } finally {
@@ -173,7 +193,7 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    function renderActiveOperations() { if (activeOperations.length === 0) { activeOperationsContainer.innerHTML = `<p class="text-gray-500 bg-white shadow-md rounded-lg p-6">Nenhuma operação ativa no momento.</p>`; return; } const opsById = activeOperations.reduce((acc, bet) => { const details = JSON.parse(bet.detalhes); const opId = details.operationId; if (!acc[opId]) { acc[opId] = { gameName: bet.descricao.split(' - ')[0], bets: [] }; } acc[opId].bets.push({ ...bet, detalhes: details }); return acc; }, {}); activeOperationsContainer.innerHTML = Object.entries(opsById).map(([opId, op]) => { const marketsHtml = op.bets.map(bet => ` <div class="border-t py-3"> <label class="flex items-center space-x-3 cursor-pointer"> <input type="radio" name="winner_${opId}" value="${bet.detalhes.result}" class="market-winner-radio h-5 w-5 rounded-full border-gray-300 text-indigo-600"> <span class="font-semibold text-gray-800">${bet.detalhes.result} (@${parseFloat(bet.detalhes.odd).toFixed(5)})</span> </label> <p class="pl-8 text-sm text-gray-600">${bet.nome_conta} - ${formatCurrency(bet.detalhes.stake)}</p> </div>`).join(''); const lostHtml = ` <div class="border-t py-3"> <label class="flex items-center space-x-3 cursor-pointer"> <input type="checkbox" class="lost-operation-checkbox h-5 w-5 rounded border-gray-300 text-red-600"> <span class="font-semibold text-red-700">Nenhum Vencedor (Operação Perdida)</span> </label> </div>`; return `<div class="bg-white shadow-md rounded-lg operation-card" data-op-id="${opId}"> <div class="operation-header flex justify-between items-center p-4 cursor-pointer toggle-details-btn"> <div><h3 class="text-lg font-bold text-gray-900">${op.gameName}</h3><p class="text-xs text-gray-500 capitalize font-semibold">${op.bets[0].detalhes.category}</p></div> <span class="toggle-icon text-gray-500 font-bold text-xl">▼</span> </div> <div class="operation-body border-t px-4"><div class="py-4">${marketsHtml}${lostHtml}<div class="mt-4 border-t pt-4 text-right"><button class="resolve-operation-btn bg-green-600 text-white font-bold py-2 px-6 rounded-md hover:bg-green-700">Resolver Operação</button></div></div></div> </div>`; }).join(''); }
+    function renderActiveOperations() { if (activeOperations.length === 0) { activeOperationsContainer.innerHTML = `<p class="text-gray-500 bg-white shadow-md rounded-lg p-6">Nenhuma operação ativa no momento.</p>`; return; } const opsById = activeOperations.reduce((acc, bet) => { const opId = bet.operacao_id; if (!acc[opId]) { acc[opId] = { gameName: bet.descricao.split(' - ')[0], bets: [] }; } acc[opId].bets.push(bet); return acc; }, {}); activeOperationsContainer.innerHTML = Object.entries(opsById).map(([opId, op]) => { const marketsHtml = op.bets.map(bet => ` <div class="border-t py-3"> <label class="flex items-center space-x-3 cursor-pointer"> <input type="radio" name="winner_${opId}" value="${bet.resultado}" class="market-winner-radio h-5 w-5 rounded-full border-gray-300 text-indigo-600"> <span class="font-semibold text-gray-800">${bet.resultado} (@${parseFloat(bet.odd).toFixed(5)})</span> </label> <p class="pl-8 text-sm text-gray-600">${bet.nome_conta} - ${formatCurrency(bet.stake)}</p> </div>`).join(''); const lostHtml = ` <div class="border-t py-3"> <label class="flex items-center space-x-3 cursor-pointer"> <input type="checkbox" class="lost-operation-checkbox h-5 w-5 rounded border-gray-300 text-red-600"> <span class="font-semibold text-red-700">Nenhum Vencedor (Operação Perdida)</span> </label> </div>`; return `<div class="bg-white shadow-md rounded-lg operation-card" data-op-id="${opId}"> <div class="operation-header flex justify-between items-center p-4 cursor-pointer toggle-details-btn"> <div><h3 class="text-lg font-bold text-gray-900">${op.gameName}</h3><p class="text-xs text-gray-500 capitalize font-semibold">${op.bets[0].categoria}</p></div> <span class="toggle-icon text-gray-500 font-bold text-xl">▼</span> </div> <div class="operation-body border-t px-4"><div class="py-4">${marketsHtml}${lostHtml}<div class="mt-4 border-t pt-4 text-right"><button class="resolve-operation-btn bg-green-600 text-white font-bold py-2 px-6 rounded-md hover:bg-green-700">Resolver Operação</button></div></div></div> </div>`; }).join(''); }
     function renderTransactionHistory() { const tbody = document.getElementById('transactions-history-body'); tbody.innerHTML = transactionHistory.length === 0 ? `<tr><td colspan="6" class="text-center p-4">Nenhum histórico encontrado.</td></tr>` : transactionHistory.map(trans => ` <tr class="border-t" data-transaction-id="${trans.id}"> <td class="px-6 py-4">${new Date(trans.data_criacao).toLocaleDateString('pt-BR')}</td> <td class="px-6 py-4">${trans.nome_conta}</td> <td class="px-6 py-4">${trans.descricao}</td> <td class="px-6 py-4 text-xs uppercase font-semibold">${trans.tipo.replace(/_/g, ' ')}</td> <td class="px-6 py-4 font-bold ${trans.valor >= 0 ? 'text-green-600' : 'text-red-600'}">${formatCurrency(trans.valor)}</td> <td class="px-6 py-4 text-center"> <button title="Excluir/Reverter Transação" class="delete-transaction-btn text-red-500 hover:text-red-700">🗑️</button> </td> </tr>`).join(''); }
     function updateFinancialSummary(summary) { const { monthly_credits, monthly_debits, monthly_net } = summary; const personalBalance = allAccounts.filter(a => a.casa_de_aposta === 'pessoal').reduce((sum, acc) => sum + acc.saldo, 0); const bettingHousesBalance = allAccounts.filter(a => a.casa_de_aposta !== 'pessoal').reduce((sum, acc) => sum + acc.saldo, 0); const totalFreebets = allAccounts.reduce((sum, acc) => sum + acc.saldo_freebets, 0); document.getElementById('personal-balance').textContent = formatCurrency(personalBalance); document.getElementById('betting-houses-balance').textContent = formatCurrency(bettingHousesBalance); document.getElementById('total-freebets-balance').textContent = formatCurrency(totalFreebets); document.getElementById('total-balance').textContent = formatCurrency(personalBalance + bettingHousesBalance); document.getElementById('monthly-credits').textContent = formatCurrency(monthly_credits); document.getElementById('monthly-debits').textContent = formatCurrency(Math.abs(monthly_debits)); const netElement = document.getElementById('monthly-net'); netElement.textContent = formatCurrency(monthly_net); netElement.classList.remove('text-green-600', 'text-red-600', 'text-gray-800'); if (monthly_net > 0) netElement.classList.add('text-green-600'); else if (monthly_net < 0) netElement.classList.add('text-red-600'); else netElement.classList.add('text-gray-800'); }
     function renderReport(data) { const { summary, accountAnalysis } = data; const finalBalance = summary.netProfit + summary.totalExpenses + summary.totalPayments; const reportContent = document.getElementById('report-content'); const summaryHtml = ` <div class="mb-8"> <h4 class="text-lg font-bold text-gray-800 mb-3">Resumo Geral do Mês</h4> <div class="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-4 gap-4 text-center"> <div class="bg-white shadow rounded-lg p-4"> <h5 class="text-sm font-semibold text-gray-500">LUCRO LÍQUIDO (APOSTAS)</h5> <p class="text-2xl font-bold ${summary.netProfit >= 0 ? 'text-green-600' : 'text-red-600'}">${formatCurrency(summary.netProfit)}</p> </div> <div class="bg-white shadow rounded-lg p-4"> <h5 class="text-sm font-semibold text-gray-500">TOTAL EM PAGAMENTOS</h5> <p class="text-2xl font-bold text-red-600">${formatCurrency(Math.abs(summary.totalPayments))}</p> </div> <div class="bg-white shadow rounded-lg p-4"> <h5 class="text-sm font-semibold text-gray-500">TOTAL EM GASTOS</h5> <p class="text-2xl font-bold text-rose-600">${formatCurrency(Math.abs(summary.totalExpenses))}</p> </div> <div class="bg-white shadow rounded-lg p-4"> <h5 class="text-sm font-semibold text-gray-500">BALANÇO FINAL</h5> <p class="text-2xl font-bold ${finalBalance >= 0 ? 'text-green-600' : 'text-red-600'}">${formatCurrency(finalBalance)}</p> </div> </div> </div>`; const accountTableHtml = accountAnalysis.length > 0 ? ` <div class="mb-8"> <h4 class="text-lg font-bold text-gray-800 mb-3">Análise por Conta</h4> <div class="bg-white shadow rounded-lg overflow-hidden"> <table class="w-full text-sm"> <thead class="text-xs text-gray-700 uppercase bg-gray-100"> <tr> <th class="px-6 py-3 text-left">CONTA</th> <th class="px-6 py-3 text-center">Nº DE APOSTAS</th> <th class="px-6 py-3 text-right">TOTAL APOSTADO</th> <th class="px-6 py-3 text-right">LUCRO / PREJUÍZO</th> </tr> </thead> <tbody> ${accountAnalysis.sort((a, b) => b.profit - a.profit).map(acc => ` <tr> <td class="px-6 py-4 text-left font-medium">${acc.name}</td> <td class="px-6 py-4 text-center">${acc.betCount}</td> <td class="px-6 py-4 text-right">${formatCurrency(acc.wagered)}</td> <td class="px-6 py-4 text-right font-bold ${acc.profit >= 0 ? 'text-green-600' : 'text-red-600'}"> ${formatCurrency(acc.profit)} </td> </tr> `).join('')} </tbody> </table> </div> </div>` : ''; reportContent.innerHTML = summaryHtml + accountTableHtml; }
@@ -183,12 +203,12 @@ document.addEventListener('DOMContentLoaded', () => {
     addTransactionBtn.addEventListener('click', () => { transactionForm.reset(); document.getElementById('transaction-account').innerHTML = getAccountOptionsHtml(); modals.transaction.open(); });
     addExpenseBtn.addEventListener('click', () => { expenseForm.reset(); document.getElementById('expense-account').innerHTML = allAccounts.filter(a => a.casa_de_aposta === 'pessoal').map(acc => `<option value="${acc.id}">${acc.nome}</option>`).join(''); modals.expense.open(); });
     transferBtn.addEventListener('click', () => { transferForm.reset(); const opts = getAccountOptionsHtml(); document.getElementById('transfer-from').innerHTML = opts; document.getElementById('transfer-to').innerHTML = opts; modals.transfer.open(); });
-    backupBtn.addEventListener('click', () => { window.location.href = '/api/backup'; });
+    backupBtn.addEventListener('click', async () => { try { backupBtn.disabled = true; showToast('Gerando backup...', 'success'); const response = await fetch('/api/backup?async=1'); const result = await response.json(); if (!response.ok) throw new Error(result.error); const job = await aguardarJob(result.jobId); window.location.href = job.downloadUrl; } catch (error) { showToast(error.message, 'error'); } finally { backupBtn.disabled = false; } });
     reportBtn.addEventListener('click', () => { const monthSelect = document.getElementById('report-month'); const yearSelect = document.getElementById('report-year'); const now = new Date(); if (yearSelect.options.length === 0) { for (let y = now.getFullYear(); y >= 2023; y--) yearSelect.add(new Option(y, y)); const months = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]; months.forEach((m, i) => monthSelect.add(new Option(m, i + 1))); } yearSelect.value = now.getFullYear(); monthSelect.value = now.getMonth() + 1; const generate = async () => { document.getElementById('report-content').innerHTML = '<div class="spinner mx-auto"></div>'; try { const data = await apiRequest(`/api/relatorio?year=${yearSelect.value}&month=${monthSelect.value}`); renderReport(data); } catch (error) { showToast(`Erro ao gerar relatório: ${error.message}`, 'error'); } }; monthSelect.onchange = generate; yearSelect.onchange = generate; generate(); modals.report.open(); });
-    accountForm.addEventListener('submit', async (e) => { e.preventDefault(); try { const id = e.target.elements['account-id'].value; const data = { nome: e.target.elements['account-name'].value, casaDeAposta: e.target.elements['account-provider'].value, saldo: parseFloat(e.target.elements['account-balance'].value || 0), saldoFreebets: parseFloat(e.target.elements['account-freebet-balance'].value || 0), diaPagamento: parseInt(e.target.elements['account-payment-day'].value) || null, valorPagamento: parseFloat(e.target.elements['account-payment-value'].value) || null, meta: parseFloat(e.target.elements['account-goal'].value || 100), volumeClube: parseFloat(e.target.elements['account-club-volume'].value || 0), observacoes: e.target.elements['account-obs'].value, dataUltimoCodigo: e.target.elements['account-last-code-date'].value || null, ultimoPeriodoPago: id ? allAccounts.find(a => a.id == id)?.ultimo_periodo_pago : null }; if (id) { await apiRequest(`/api/contas/${id}`, 'PUT', data); showToast('Conta atualizada!'); } else { await apiRequest('/api/contas', 'POST', data); showToast('Conta criada!'); } modals.account.close(); initializeApp(); } catch (error) { showToast(`Erro ao salvar conta: ${error.message}`, 'error'); } });
-    transactionForm.addEventListener('submit', async (e) => { e.preventDefault(); try { await apiRequest('/api/transacoes/generico', 'POST', { accountId: e.target.elements['transaction-account'].value, type: e.target.elements['transaction-type'].value, amount: e.target.elements['transaction-amount'].value, description: e.target.elements['transaction-description'].value }); showToast('Lançamento registrado!'); modals.transaction.close(); initializeApp(); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
-    expenseForm.addEventListener('submit', async (e) => { e.preventDefault(); try { await apiRequest('/api/transacoes/generico', 'POST', { accountId: e.target.elements['expense-account'].value, type: 'expense', amount: e.target.elements['expense-amount'].value, description: e.target.elements['expense-description'].value }); showToast('Gasto registrado!'); modals.expense.close(); initializeApp(); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
-    transferForm.addEventListener('submit', async (e) => { e.preventDefault(); const fromId = e.target.elements['transfer-from'].value, toId = e.target.elements['transfer-to'].value; if(fromId === toId) return showToast('As contas não podem ser iguais.', 'error'); const toName = allAccounts.find(a => a.id == toId)?.nome || 'Outra Conta'; try { await apiRequest('/api/transferencia', 'POST', { fromId, toId, amount: e.target.elements['transfer-amount'].value, description: e.target.elements['transfer-description'].value || toName }); showToast('Transferência realizada!'); modals.transfer.close(); initializeApp(); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
+    accountForm.addEventListener('submit', async (e) => { e.preventDefault(); try { const id = e.target.elements['account-id'].value; const data = { nome: e.target.elements['account-name'].value, casaDeAposta: e.target.elements['account-provider'].value, saldo: parseFloat(e.target.elements['account-balance'].value || 0), saldoFreebets: parseFloat(e.target.elements['account-freebet-balance'].value || 0), diaPagamento: parseInt(e.target.elements['account-payment-day'].value) || null, valorPagamento: parseFloat(e.target.elements['account-payment-value'].value) || null, meta: parseFloat(e.target.elements['account-goal'].value || 100), volumeClube: parseFloat(e.target.elements['account-club-volume'].value || 0), observacoes: e.target.elements['account-obs'].value, dataUltimoCodigo: e.target.elements['account-last-code-date'].value || null, ultimoPeriodoPago: id ? allAccounts.find(a => a.id == id)?.ultimo_periodo_pago : null }; if (id) { await apiRequest(`/api/contas/${id}`, 'PUT', data); showToast('Conta atualizada!'); } else { await apiRequest('/api/contas', 'POST', data); showToast('Conta criada!'); } modals.account.close(); syncData(); } catch (error) { showToast(`Erro ao salvar conta: ${error.message}`, 'error'); } });
+    transactionForm.addEventListener('submit', async (e) => { e.preventDefault(); try { const result = await apiRequest('/api/transacoes/generico', 'POST', { accountId: e.target.elements['transaction-account'].value, type: e.target.elements['transaction-type'].value, amount: e.target.elements['transaction-amount'].value, description: e.target.elements['transaction-description'].value }); showToast('Lançamento registrado!'); modals.transaction.close(); applyMutationResult(result); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
+    expenseForm.addEventListener('submit', async (e) => { e.preventDefault(); try { const result = await apiRequest('/api/transacoes/generico', 'POST', { accountId: e.target.elements['expense-account'].value, type: 'expense', amount: e.target.elements['expense-amount'].value, description: e.target.elements['expense-description'].value }); showToast('Gasto registrado!'); modals.expense.close(); applyMutationResult(result); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
+    transferForm.addEventListener('submit', async (e) => { e.preventDefault(); const fromId = e.target.elements['transfer-from'].value, toId = e.target.elements['transfer-to'].value; if(fromId === toId) return showToast('As contas não podem ser iguais.', 'error'); const toName = allAccounts.find(a => a.id == toId)?.nome || 'Outra Conta'; try { const result = await apiRequest('/api/transferencia', 'POST', { fromId, toId, amount: e.target.elements['transfer-amount'].value, description: e.target.elements['transfer-description'].value || toName }); showToast('Transferência realizada!'); modals.transfer.close(); applyMutationResult(result); } catch(error) { showToast(`Erro: ${error.message}`, 'error'); } });
     
     operationForm.addEventListener('submit', async (e) => {
         e.preventDefault();
@@ -206,18 +226,18 @@ document.addEventListener('DOMContentLoaded', () => {
                     }))
                 }))
             };
-            await apiRequest('/api/operacoes', 'POST', operationData);
+            const result = await apiRequest('/api/operacoes', 'POST', operationData);
             showToast('Operação registrada!');
             operationForm.reset();
             legsContainer.innerHTML = '';
             addLegRow();
-            initializeApp();
+            applyMutationResult(result);
         } catch (error) {
             showToast(`Erro: ${error.message}`, 'error');
         }
     });
 
-    mainContainer.addEventListener('click', async (e) => { const target = e.target; if (target.classList.contains('pay-btn')) { const accountId = target.dataset.accountId; const accountName = target.dataset.accountName; if (confirm(`Confirmar o pagamento para a conta "${accountName}" para o período atual?`)) { try { await apiRequest(`/api/contas/${accountId}/pagar`, 'POST'); showToast('Pagamento registrado com sucesso!'); initializeApp(); } catch (err) { showToast(`Erro ao registrar pagamento: ${err.message}`, 'error'); } } } const accountRow = target.closest('tr[data-account-id]'); const transactionRow = target.closest('tr[data-transaction-id]'); if (accountRow) { const accountId = accountRow.dataset.accountId; const account = allAccounts.find(a => a.id == accountId); if (target.classList.contains('edit-btn')) { document.getElementById('modal-title').textContent = 'Editar Conta'; document.getElementById('account-id').value = account.id; document.getElementById('account-name').value = account.nome; document.getElementById('account-provider').value = account.casa_de_aposta; document.getElementById('account-balance').value = account.saldo; document.getElementById('account-freebet-balance').value = account.saldo_freebets; document.getElementById('account-payment-day').value = account.dia_pagamento; document.getElementById('account-payment-value').value = account.valor_pagamento; document.getElementById('account-goal').value = account.meta; document.getElementById('account-club-volume').value = account.volume_clube; document.getElementById('account-obs').value = account.observacoes; document.getElementById('account-last-code-date').value = account.data_ultimo_codigo; modals.account.open(); } if (target.classList.contains('delete-btn')) { if (confirm(`Desativar a conta "${account.nome}"?`)) { try { await apiRequest(`/api/contas/${accountId}`, 'DELETE'); showToast('Conta desativada!'); initializeApp(); } catch (err) { showToast(`Erro: ${err.message}`, 'error'); } } } } if (transactionRow && target.classList.contains('delete-transaction-btn')) { if (confirm('Excluir e reverter esta transação? A ação não pode ser desfeita.')) { try { await apiRequest(`/api/transacoes/${transactionRow.dataset.transactionId}`, 'DELETE'); showToast('Transação revertida!'); initializeApp(); } catch (err) { showToast(`Erro ao reverter: ${err.message}`, 'error'); } } } if (target.closest('.toggle-details-btn')) { target.closest('.operation-card').classList.toggle('is-expanded'); } if (target.classList.contains('resolve-operation-btn')) { const card = target.closest('.operation-card'); const operationId = card.dataset.opId; const winnerRadio = card.querySelector('.market-winner-radio:checked'); const isLost = card.querySelector('.lost-operation-checkbox:checked'); if (winnerRadio && isLost) { return showToast('Não é possível marcar um vencedor E a operação como perdida.', 'error'); } if (!winnerRadio && !isLost) { return showToast('Selecione um resultado vencedor OU marque a operação como perdida.', 'error'); } const winningMarket = isLost ? null : winnerRadio.value; try { await apiRequest('/api/operacoes/resolver', 'POST', { operationId, winningMarket }); showToast('Operação resolvida com sucesso!'); initializeApp(); } catch (err) { showToast(`Erro ao resolver: ${err.message}`, 'error'); } } });
+    mainContainer.addEventListener('click', async (e) => { const target = e.target; if (target.classList.contains('pay-btn')) { const accountId = target.dataset.accountId; const accountName = target.dataset.accountName; if (confirm(`Confirmar o pagamento para a conta "${accountName}" para o período atual?`)) { try { const result = await apiRequest(`/api/contas/${accountId}/pagar`, 'POST'); showToast('Pagamento registrado com sucesso!'); applyMutationResult(result); } catch (err) { showToast(`Erro ao registrar pagamento: ${err.message}`, 'error'); } } } const accountRow = target.closest('tr[data-account-id]'); const transactionRow = target.closest('tr[data-transaction-id]'); if (accountRow) { const accountId = accountRow.dataset.accountId; const account = allAccounts.find(a => a.id == accountId); if (target.classList.contains('edit-btn')) { document.getElementById('modal-title').textContent = 'Editar Conta'; document.getElementById('account-id').value = account.id; document.getElementById('account-name').value = account.nome; document.getElementById('account-provider').value = account.casa_de_aposta; document.getElementById('account-balance').value = account.saldo; document.getElementById('account-freebet-balance').value = account.saldo_freebets; document.getElementById('account-payment-day').value = account.dia_pagamento; document.getElementById('account-payment-value').value = account.valor_pagamento; document.getElementById('account-goal').value = account.meta; document.getElementById('account-club-volume').value = account.volume_clube; document.getElementById('account-obs').value = account.observacoes; document.getElementById('account-last-code-date').value = account.data_ultimo_codigo; modals.account.open(); } if (target.classList.contains('delete-btn')) { if (confirm(`Desativar a conta "${account.nome}"?`)) { try { const result = await apiRequest(`/api/contas/${accountId}`, 'DELETE'); showToast('Conta desativada!'); applyMutationResult(result); } catch (err) { showToast(`Erro: ${err.message}`, 'error'); } } } } if (transactionRow && target.classList.contains('delete-transaction-btn')) { if (confirm('Excluir e reverter esta transação? A ação não pode ser desfeita.')) { try { const result = await apiRequest(`/api/transacoes/${transactionRow.dataset.transactionId}`, 'DELETE'); showToast('Transação revertida!'); applyMutationResult(result); } catch (err) { showToast(`Erro ao reverter: ${err.message}`, 'error'); } } } if (target.closest('.toggle-details-btn')) { target.closest('.operation-card').classList.toggle('is-expanded'); } if (target.classList.contains('resolve-operation-btn')) { const card = target.closest('.operation-card'); const operationId = card.dataset.opId; const winnerRadio = card.querySelector('.market-winner-radio:checked'); const isLost = card.querySelector('.lost-operation-checkbox:checked'); if (winnerRadio && isLost) { return showToast('Não é possível marcar um vencedor E a operação como perdida.', 'error'); } if (!winnerRadio && !isLost) { return showToast('Selecione um resultado vencedor OU marque a operação como perdida.', 'error'); } const winningMarket = isLost ? null : winnerRadio.value; try { const result = await apiRequest('/api/operacoes/resolver', 'POST', { operationId, winningMarket }); showToast('Operação resolvida com sucesso!'); applyMutationResult(result); } catch (err) { showToast(`Erro ao resolver: ${err.message}`, 'error'); } } });
 
     function updateLegSummary(legContainer) {
         if (!legContainer) return;
@@ -329,7 +349,57 @@ document.addEventListener('DOMContentLoaded', () => {
     mainTabsContainer.addEventListener('click', (e) => { if (e.target.classList.contains('tab-btn')) { const tabId = e.target.dataset.tab; document.querySelectorAll('.tab-btn').forEach(btn => btn.classList.remove('active')); document.querySelectorAll('.tab-content').forEach(content => content.classList.remove('active')); e.target.classList.add('active'); document.getElementById(`tab-content-${tabId}`).classList.add('active'); } });
     operationCategorySelect.addEventListener('change', () => { const isCasino = operationCategorySelect.value === 'cassino'; document.getElementById('multi-bet-container').classList.toggle('hidden', isCasino); document.getElementById('cassino-container').classList.toggle('hidden', !isCasino); document.querySelectorAll('#multi-bet-container [required]').forEach(el => el.required = !isCasino); document.querySelectorAll('#cassino-container [required]').forEach(el => el.required = isCasino); });
 
-    async function initializeApp() { try { const data = await apiRequest('/api/dados-iniciais'); allAccounts = data.contas; activeOperations = data.operacoesAtivas; transactionHistory = data.historico; renderTables(); renderActiveOperations(); renderTransactionHistory(); updateFinancialSummary(data.resumoFinanceiro); if (legsContainer.children.length === 0) { addLegRow(); } else { legsContainer.querySelectorAll('.bet-account').forEach(select => { const sel = select.value; select.innerHTML = getAccountOptionsHtml(); select.value = sel; }); legsContainer.querySelectorAll('.leg-container').forEach(leg => updateLegSummary(leg)); } operationCategorySelect.dispatchEvent(new Event('change')); } catch (error) { showToast(`Erro fatal ao carregar: ${error.message}`, 'error'); } }
+    // Rolagem infinita do histórico: busca a próxima página quando o fim da tabela aparece na tela
+    async function loadMoreHistory() {
+        if (!historyCursor || loadingHistory) return;
+        loadingHistory = true;
+        try {
+            const data = await apiRequest(`/api/transacoes?cursor=${encodeURIComponent(historyCursor)}`);
+            transactionHistory = transactionHistory.concat(data.transacoes);
+            historyCursor = data.proximoCursor;
+            renderTransactionHistory();
+        } catch (error) {
+            showToast(`Erro ao carregar histórico: ${error.message}`, 'error');
+        } finally {
+            loadingHistory = false;
+        }
+    }
+
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadMoreHistory();
+    }, { rootMargin: '200px' }).observe(document.getElementById('transactions-history-sentinel'));
+
+    function renderAll(summary) { renderTables(); renderActiveOperations(); renderTransactionHistory(); updateFinancialSummary(summary); if (legsContainer.children.length === 0) { addLegRow(); } else { legsContainer.querySelectorAll('.bet-account').forEach(select => { const sel = select.value; select.innerHTML = getAccountOptionsHtml(); select.value = sel; }); legsContainer.querySelectorAll('.leg-container').forEach(leg => updateLegSummary(leg)); } operationCategorySelect.dispatchEvent(new Event('change')); }
+
+    function applyFullData(data) { allAccounts = data.contas; activeOperations = data.operacoesAtivas; transactionHistory = data.historico; historyCursor = data.historicoCursor; dataVersion = data.versao; renderAll(data.resumoFinanceiro); }
+
+    // Aplica localmente as entidades alteradas/removidas desde a versão conhecida
+    function applyDelta(delta) {
+        if (delta.completo) return applyFullData(delta);
+        const changedAccounts = new Set(delta.contas.map(a => a.id).concat(delta.contasRemovidas));
+        allAccounts = allAccounts.filter(a => !changedAccounts.has(a.id)).concat(delta.contas).sort((a, b) => a.nome.localeCompare(b.nome));
+        const changedOperations = new Set(delta.operacoesRemovidas.concat(delta.operacoesAtivas.map(bet => bet.operacao_id)));
+        activeOperations = activeOperations.filter(bet => !changedOperations.has(bet.operacao_id)).concat(delta.operacoesAtivas);
+        const changedTransactions = new Set(delta.historico.map(t => t.id).concat(delta.historicoRemovido));
+        const oldestLoaded = historyCursor && transactionHistory.length ? transactionHistory[transactionHistory.length - 1] : null;
+        // Linhas mais antigas que a última página carregada chegam depois, pela rolagem
+        const newRows = delta.historico.filter(t => !oldestLoaded || new Date(t.data_criacao) >= new Date(oldestLoaded.data_criacao));
+        transactionHistory = transactionHistory.filter(t => !changedTransactions.has(t.id)).concat(newRows).sort((a, b) => (new Date(b.data_criacao) - new Date(a.data_criacao)) || (b.id - a.id));
+        dataVersion = delta.versao;
+        renderAll(delta.resumoFinanceiro);
+    }
+
+    async function syncData() {
+        if (dataVersion === null) return initializeApp();
+        try { applyDelta(await apiRequest(`/api/dados-iniciais?since=${dataVersion}`)); } catch (error) { showToast(`Erro ao atualizar: ${error.message}`, 'error'); }
+    }
+
+    // Rotas de escrita devolvem a nova versão e o que mudou; se outra aba escreveu no meio, busca o delta completo
+    function applyMutationResult(result) {
+        if (result && result.alteracoes && dataVersion !== null && result.versao === dataVersion + 1) { applyDelta(result.alteracoes); } else { syncData(); }
+    }
+
+    async function initializeApp() { try { applyFullData(await apiRequest('/api/dados-iniciais')); } catch (error) { showToast(`Erro fatal ao carregar: ${error.message}`, 'error'); } }
     
     initializeApp();
 });
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""Fixtures dos testes: um banco vazio com o schema do app, em cada backend.
+
+O SQLite roda sempre, em um arquivo temporário. O PostgreSQL só com TEST_DATABASE_URL apontando para
+um banco descartável: o schema public dele é apagado e recriado a cada teste. Tanto os testes de
+cursor (`db`) quanto os das rotas HTTP (`cliente`) rodam nos dois.
+"""
+import os
+
+os.environ.setdefault('JOBS_WORKERS', '0')  # antes do import do app: sem threads executoras de fundo nos testes
+
+import psycopg2
+import psycopg2.extras
+import pytest
+
+import banco_sqlite
+from bench.dados import criar_schema
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+def _conectar(backend, tmp_path):
+    """Conexão a um banco vazio com o schema do app: (conexão, DATABASE_URL)."""
+    if backend == 'sqlite':
+        url = f'{banco_sqlite.PREFIXO_URL}{tmp_path / "testes.db"}'
+        conn = banco_sqlite.conectar(url)
+    else:
+        if not TEST_DATABASE_URL:
+            pytest.skip('TEST_DATABASE_URL não definida')
+        url = TEST_DATABASE_URL
+        conn = psycopg2.connect(url)
+        with conn, conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA IF EXISTS arquivo CASCADE; DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+    criar_schema(conn)
+    return conn, url
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def cliente(request, tmp_path, monkeypatch):
+    """Cliente de teste logado, com o app usando um pool próprio sobre um banco vazio de cada backend."""
+    import app as appmod
+    conn, url = _conectar(request.param, tmp_path)
+    conn.close()
+    monkeypatch.setattr(appmod, 'DATABASE_URL', url)
+    monkeypatch.setattr(appmod, '_pool', None)
+    monkeypatch.setattr(appmod, '_particoes_verificadas_em', None)  # o schema foi recriado
+    monkeypatch.setattr(appmod, '_user_cache', None)
+    monkeypatch.setattr(appmod, 'USER_CACHE_BACKEND', 'off')
+    appmod.app.config['TESTING'] = True
+    cliente = appmod.app.test_client()
+    cliente.post('/register', data={'email': 'teste@example.com', 'password': '12345678'})
+    assert cliente.post('/login', data={'email': 'teste@example.com', 'password': '12345678'}).status_code == 302
+    yield cliente
+    if appmod._pool is not None:
+        appmod._pool.closeall()
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def db(request, tmp_path):
+    conn, _ = _conectar(request.param, tmp_path)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def cursor(db):
+    """Cursor em uma transação aberta, desfeita no fim do teste."""
+    with db.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        yield cursor
+    db.rollback()
+
+@pytest.fixture
+def usuario(cursor):
+    """Usuário com as contas A (saldo 1000) e B (saldo 500): (user_id, [id de A, id de B])."""
+    cursor.execute("INSERT INTO usuarios (email, senha_hash) VALUES ('teste@example.com', 'x') RETURNING id")
+    user_id = cursor.fetchone()[0]
+    contas = []
+    for nome, saldo in (('A', 1000), ('B', 500)):
+        cursor.execute("INSERT INTO contas (user_id, nome, casa_de_aposta, saldo) VALUES (%s, %s, 'bet365', %s) RETURNING id",
+                       (user_id, nome, saldo))
+        contas.append(cursor.fetchone()[0])
+    return user_id, contas
@@ -0,0 +1,33 @@
+"""/api/backup em streaming: a conexão do gerador é dele até o fim da resposta."""
+import gzip
+import json
+
+import app as appmod
+
+def _em_uso():
+    return appmod.get_pool().stats()['in_use']
+
+def test_backups_concorrentes_usam_conexoes_proprias(cliente):
+    # O corpo em streaming continua lendo depois do fim da view (e do teardown do contexto):
+    # a conexão não pode ter voltado ao pool nesse meio tempo
+    primeiro = cliente.get('/api/backup', buffered=False)
+    partes = iter(primeiro.response)
+    inicio = next(partes)
+    assert _em_uso() == 1
+    segundo = cliente.get('/api/backup').data
+    assert _em_uso() == 1
+    corpo = inicio + b''.join(partes)
+    primeiro.close()
+    assert _em_uso() == 0
+    primeiro, segundo = json.loads(corpo), json.loads(segundo)
+    del primeiro['backupDate'], segundo['backupDate']
+    assert primeiro == segundo
+
+def test_download_gzip_interrompido_devolve_a_conexao(cliente):
+    resposta = cliente.get('/api/backup?gzip=1', buffered=False)
+    assert _em_uso() == 1
+    resposta.close()  # cliente desconectou antes do primeiro byte
+    assert _em_uso() == 0
+    completo = cliente.get('/api/backup?gzip=1&format=ndjson')
+    assert json.loads(gzip.decompress(completo.data).splitlines()[0])['backupDate']
+    assert _em_uso() == 0
@@ -0,0 +1,165 @@
+"""Tradução do SQL do app para o SQLite (banco_sqlite.traduzir / execute_values) e os comandos reais do
+app.py executados nos dois backends: um erro de tradução não falha, grava dado errado."""
+import json
+from decimal import Decimal
+
+import pytest
+
+import app as appmod
+import banco_sqlite
+
+# --- Tradução ---
+def test_traduzir_placeholders_e_literal_percentual():
+    assert banco_sqlite.traduzir("SELECT %s, %(nome)s, 'a%%'") == ("SELECT ?, :nome, 'a%'", False)
+    # Sem parâmetros, % é literal, como no psycopg2
+    assert banco_sqlite.traduzir("SELECT 'a%%'", False) == ("SELECT 'a%%'", False)
+
+def test_traduzir_casts():
+    sql, _ = banco_sqlite.traduzir("SELECT %s::int, %s::numeric, %s::timestamp, x::date, detalhes::jsonb, y::boolean")
+    assert sql == "SELECT ?, ?, ?, x, detalhes, y"
+
+def test_traduzir_any_e_in():
+    sql, _ = banco_sqlite.traduzir("SELECT 1 FROM t WHERE id = ANY(%s) AND tipo IN %(tipos)s AND c = any(%(ids)s)")
+    assert sql == ("SELECT 1 FROM t WHERE id IN (SELECT value FROM json_each(?)) AND tipo IN (SELECT value FROM json_each(:tipos))"
+                   " AND c IN (SELECT value FROM json_each(:ids))")
+
+def test_traduzir_for_update_abre_transacao_de_escrita():
+    assert banco_sqlite.traduzir("SELECT id FROM contas WHERE id = %s ORDER BY id FOR UPDATE") == \
+        ("SELECT id FROM contas WHERE id = ? ORDER BY id", True)
+    assert banco_sqlite.traduzir("SELECT a.* FROM apostas a FOR UPDATE OF a") == ("SELECT a.* FROM apostas a", True)
+
+def test_traduzir_detecta_escrita():
+    assert banco_sqlite.traduzir("SELECT 1")[1] is False
+    assert banco_sqlite.traduzir("WITH x AS (SELECT 1) SELECT * FROM x")[1] is False
+    assert banco_sqlite.traduzir("WITH x AS (DELETE FROM t RETURNING id) SELECT * FROM x")[1] is True
+    assert banco_sqlite.traduzir("  insert into t values (%s)")[1] is True
+
+def test_traduzir_update_com_alias():
+    sql, escrita = banco_sqlite.traduzir("UPDATE contas c SET saldo = c.saldo + %s WHERE c.id = %s")
+    assert sql == "UPDATE contas AS c SET saldo = c.saldo + ? WHERE c.id = ?" and escrita
+    assert banco_sqlite.traduzir("UPDATE contas SET saldo = 0")[0] == "UPDATE contas SET saldo = 0"
+
+def test_traduzir_localtimestamp_e_intervalo():
+    sql, _ = banco_sqlite.traduzir("SELECT LOCALTIMESTAMP - make_interval(secs => %(margem)s), LOCALTIMESTAMP")
+    assert sql == "SELECT somar_segundos(agora(), -(:margem)), agora()"
+
+def test_preparar_execute_values_com_alias():
+    sql, escrita, linha = banco_sqlite._preparar_execute_values(
+        "UPDATE contas c SET saldo = c.saldo - v.dinheiro FROM (VALUES %s) v(id, dinheiro) WHERE c.id = v.id",
+        '(%s::int, %s::numeric)')
+    assert sql == ("UPDATE contas AS c SET saldo = c.saldo - v.dinheiro FROM (SELECT column1 AS id, column2 AS dinheiro"
+                   f" FROM (VALUES {banco_sqlite._MARCA_VALUES})) v WHERE c.id = v.id")
+    assert escrita and linha == '(?, ?)'
+
+def test_preparar_execute_values_sem_alias():
+    sql, _, linha = banco_sqlite._preparar_execute_values("INSERT INTO t (a, b) VALUES %s RETURNING id", None)
+    assert sql == f"INSERT INTO t (a, b) VALUES {banco_sqlite._MARCA_VALUES} RETURNING id" and linha is None
+
+# --- Comandos do app nos dois backends ---
+def _saldos(cursor, user_id):
+    cursor.execute("SELECT nome, saldo, saldo_freebets FROM contas WHERE user_id = %s ORDER BY nome", (user_id,))
+    return {row['nome']: (float(row['saldo']), float(row['saldo_freebets'])) for row in cursor.fetchall()}
+
+def test_execute_values_com_alias_e_paginas(cursor, usuario):
+    user_id, (a, b) = usuario
+    # page_size=1: o mesmo comando traduzido é repetido por página
+    appmod.execute_values(cursor, "UPDATE contas c SET saldo = c.saldo + v.valor FROM (VALUES %s) v(id, valor) WHERE c.id = v.id",
+                          [(a, 10.5), (b, -20)], template='(%s::int, %s::numeric)', page_size=1)
+    assert _saldos(cursor, user_id) == {'A': (1010.5, 0), 'B': (480, 0)}
+
+def test_execute_values_fetch(cursor, usuario):
+    user_id, (a, _) = usuario
+    linhas = [(a, user_id, 'deposit', valor, f'd{valor}') for valor in (1, 2, 3)]
+    ids = appmod.execute_values(cursor, "INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao) VALUES %s RETURNING id",
+                                linhas, page_size=2, fetch=True)
+    assert len({row[0] for row in ids}) == 3
+
+def test_registrar_e_resolver_operacoes(cursor, usuario):
+    user_id, (a, b) = usuario
+    operacoes = [('surebet', 'X x Y', [(a, 'X', 2.0, 100.0, False), (b, 'Y', 2.1, 95.0, False)]),
+                 ('esportiva', 'Z x W', [(a, 'Z', 3.0, 10.0, False)])]
+    versao = appmod.nova_versao(cursor, user_id)
+    op1, op2 = appmod.registrar_operacoes(cursor, user_id, operacoes, versao)
+    assert _saldos(cursor, user_id) == {'A': (890, 0), 'B': (405, 0)}
+
+    versao = appmod.nova_versao(cursor, user_id)
+    resultados = appmod.resolver_operacoes(cursor, user_id, [(op1, 'X'), (op2, None)], versao)
+    assert [(r['operationId'], r['status'], r['retorno']) for r in resultados] == [(op1, 'ganha', 200.0), (op2, 'perdida', 0.0)]
+    assert _saldos(cursor, user_id) == {'A': (1090, 0), 'B': (405, 0)}
+
+    # UPDATE ... FROM (VALUES) v(...) em apostas e o json_set / jsonb || em detalhes
+    cursor.execute("""SELECT a.resultado, a.status, t.detalhes FROM apostas a JOIN transacoes t ON t.id = a.transacao_id
+                      WHERE a.user_id = %s ORDER BY a.transacao_id""", (user_id,))
+    linhas = [(row['resultado'], row['status'], row['detalhes']) for row in cursor.fetchall()]
+    assert [(resultado, status) for resultado, status, _ in linhas] == [('X', 'ganha'), ('Y', 'perdida'), ('Z', 'perdida')]
+    for resultado, status, detalhes in linhas:
+        detalhes = json.loads(detalhes) if isinstance(detalhes, str) else detalhes
+        assert (detalhes['result'], detalhes['status']) == (resultado, status)
+    cursor.execute("SELECT id, status, versao FROM operacoes WHERE user_id = %s ORDER BY categoria", (user_id,))
+    assert [(row['id'], row['status'], row['versao']) for row in cursor.fetchall()] == [(op2, 'resolvida', versao), (op1, 'resolvida', versao)]
+
+def test_registrar_operacoes_aposta_aponta_para_a_propria_transacao(cursor, usuario):
+    user_id, (a, b) = usuario
+    operacoes = [('surebet', 'X x Y', [(b, 'Y', 2.1, 95.0, False), (a, 'X', 2.0, 100.0, False)]),
+                 ('esportiva', 'Z x W', [(a, 'Z', 3.0, 10.0, True)]),
+                 ('surebet', 'K x L', [(a, 'K', 1.5, 7.0, False), (b, 'L', 3.5, 3.0, False)])]
+    versao = appmod.nova_versao(cursor, user_id)
+    appmod.registrar_operacoes(cursor, user_id, operacoes, versao)
+    cursor.execute("""SELECT a.transacao_id, a.conta_id, a.resultado, a.stake, a.operacao_id, t.conta_id AS t_conta, t.descricao, t.operacao_id AS t_operacao, t.versao
+                      FROM apostas a JOIN transacoes t ON t.id = a.transacao_id WHERE a.user_id = %s ORDER BY a.transacao_id""", (user_id,))
+    linhas = cursor.fetchall()
+    assert [(row['conta_id'], row['resultado'], float(row['stake'])) for row in linhas] == \
+        [(conta, resultado, stake) for _, _, apostas in operacoes for conta, resultado, _, stake, _ in apostas]
+    for row in linhas:
+        assert (row['t_conta'], row['t_operacao'], row['versao']) == (row['conta_id'], row['operacao_id'], versao)
+        assert row['descricao'].endswith(f" - {row['resultado']}")
+    # Os ids reservados não colidem com os da próxima inserção comum
+    cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao) VALUES (%s, %s, 'deposit', 1, 'd') RETURNING id", (a, user_id))
+    assert cursor.fetchone()[0] > max(row['transacao_id'] for row in linhas)
+
+def test_resolver_freebet_vencedora_sem_retorno(cursor, usuario):
+    user_id, (a, b) = usuario
+    versao = appmod.nova_versao(cursor, user_id)
+    op, = appmod.registrar_operacoes(cursor, user_id, [('freebet', 'X x Y', [(a, 'X', 1.0, 50.0, True), (b, 'Y', 3.0, 10.0, False)])], versao)
+    versao = appmod.nova_versao(cursor, user_id)
+    # Freebet a odd 1.0 devolve só a stake, que não é do apostador: ganha, com retorno zero
+    resultados = appmod.resolver_operacoes(cursor, user_id, [(op, 'X')], versao)
+    assert [(r['status'], r['retorno']) for r in resultados] == [('ganha', 0.0)]
+    cursor.execute("SELECT nome, versao FROM contas WHERE user_id = %s ORDER BY nome", (user_id,))
+    assert [(row['nome'], row['versao']) for row in cursor.fetchall()] == [('A', versao), ('B', versao - 1)]
+
+def test_carregar_alteracoes_filtra_por_lista(cursor, usuario):
+    user_id, (a, b) = usuario
+    versao = appmod.nova_versao(cursor, user_id)
+    op1, op2 = appmod.registrar_operacoes(cursor, user_id, [('surebet', 'X x Y', [(a, 'X', 2.0, 10.0, False)]),
+                                                            ('surebet', 'Z x W', [(b, 'Z', 2.0, 10.0, False)])], versao)
+    versao = appmod.nova_versao(cursor, user_id)
+    appmod.resolver_operacoes(cursor, user_id, [(op2, 'Z')], versao)
+    alteracoes = appmod.carregar_alteracoes(cursor, user_id, 0, versao)
+    # Só a operação ainda ativa entra em operacoesAtivas (a.operacao_id = ANY(%s))
+    assert [op['operacao_id'] for op in alteracoes['operacoesAtivas']] == [op1]
+    assert alteracoes['operacoesRemovidas'] == [op2]
+    assert {conta['id'] for conta in alteracoes['contas']} == {a, b}
+
+def test_resumo_incremental_igual_ao_reconstruido(cursor, usuario):
+    user_id, (a, b) = usuario
+    versao = appmod.nova_versao(cursor, user_id)
+    op, = appmod.registrar_operacoes(cursor, user_id, [('surebet', 'X x Y', [(a, 'X', 2.0, 100.0, False), (b, 'Y', 2.1, 95.0, True)])], versao)
+    appmod.resolver_operacoes(cursor, user_id, [(op, 'Y')], appmod.nova_versao(cursor, user_id))
+
+    def resumo():
+        cursor.execute("SELECT conta_id, mes, tipo, total, creditos, debitos, apostado, quantidade FROM resumo_mensal WHERE user_id = %s ORDER BY conta_id, tipo", (user_id,))
+        return [tuple(float(v) if isinstance(v, (int, Decimal)) else v for v in row) for row in cursor.fetchall()]
+    incremental = resumo()
+    appmod.reconstruir_resumo(cursor, user_id)
+    assert resumo() == incremental
+    assert [(conta, tipo, total) for conta, _, tipo, total, *_ in incremental] == [(a, 'bet_placed', -100), (b, 'bet_placed', 0), (b, 'bet_won', 104.5)]
+
+def test_localtimestamp_fixo_na_transacao(db, cursor, usuario):
+    if not appmod.e_sqlite(db):
+        pytest.skip('comportamento nativo do PostgreSQL')
+    # usuario já escreveu: a transação está aberta
+    cursor.execute("SELECT LOCALTIMESTAMP")
+    primeiro = cursor.fetchone()[0]
+    cursor.execute("SELECT LOCALTIMESTAMP")
+    assert cursor.fetchone()[0] == primeiro
@@ -0,0 +1,65 @@
+"""flask db-migrate no SQLite: arquivo novo, layout antigo (gestao_apostas.db) e arquivo estranho."""
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import app as appmod
+import banco_sqlite
+
+LEGADO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gestao_apostas.db')
+
+@pytest.fixture
+def migrar(tmp_path, monkeypatch):
+    """Roda o db-migrate sobre tmp_path/app.db; devolve o resultado do CliRunner."""
+    caminho = tmp_path / 'app.db'
+    monkeypatch.setattr(appmod, 'DATABASE_URL', f'{banco_sqlite.PREFIXO_URL}{caminho}')
+    monkeypatch.setattr(appmod, '_pool', None)
+
+    def migrar():
+        return appmod.app.test_cli_runner().invoke(appmod.db_migrate)
+    migrar.caminho = caminho
+    yield migrar
+    if appmod._pool is not None:
+        appmod._pool.closeall()
+
+def test_arquivo_novo(migrar):
+    resultado = migrar()
+    assert resultado.exit_code == 0 and 'Schema SQLite criado' in resultado.output
+    assert migrar().exit_code == 0
+
+def test_migracao_pendente_usa_versao_sqlite(migrar):
+    assert migrar().exit_code == 0
+    with sqlite3.connect(migrar.caminho) as conn:
+        conn.execute("DELETE FROM schema_migrations WHERE versao = '010_particao_arquivada'")
+    resultado = migrar()
+    assert resultado.exit_code == 0 and 'Migração aplicada: 010_particao_arquivada' in resultado.output
+
+def test_layout_antigo(migrar):
+    shutil.copy(LEGADO, migrar.caminho)
+    with sqlite3.connect(migrar.caminho) as conn:
+        conn.execute("INSERT INTO contas (id, user_id, nome, saldo) VALUES (5, 1, 'Caixa Pessoal', 10)")  # nome repetido
+        conn.execute("""INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, detalhes, data_criacao)
+                        VALUES (1, 1, 'bet_placed', -20, 'X x Y - X', ?, '2025-09-20 10:00:00')""",
+                     (json.dumps({'operationId': 'op_1', 'result': 'X', 'odd': 2.0, 'stake': 20, 'isFreebet': False, 'status': 'ativa'}),))
+    resultado = migrar()
+    assert resultado.exit_code == 0, resultado.output
+    assert '2 usuário(s) migrado(s)' in resultado.output
+    with sqlite3.connect(migrar.caminho) as conn:
+        tabelas = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'schema_migrations' in tabelas and not any(t.startswith('legado_') for t in tabelas)
+        assert conn.execute("SELECT email FROM usuarios ORDER BY id").fetchall() == [('usuario@exemplo.com',), ('fredericobmartins@gmail.com',)]
+        assert conn.execute("SELECT id, nome FROM contas WHERE user_id = 1 ORDER BY id").fetchall() == \
+            [(1, 'Principal Bet365'), (2, 'Secundária Betano'), (3, 'Caixa Pessoal'), (5, 'Caixa Pessoal #5')]
+        assert conn.execute("SELECT transacao_id, operacao_id, stake FROM apostas").fetchall() == [(1, 'op_1', 20)]
+        assert conn.execute("SELECT conta_id, tipo, total FROM resumo_mensal").fetchall() == [(1, 'bet_placed', -20)]
+    # Já migrado: nada a fazer
+    assert migrar().exit_code == 0
+
+def test_arquivo_de_outro_app(migrar):
+    with sqlite3.connect(migrar.caminho) as conn:
+        conn.execute("CREATE TABLE clientes (id INTEGER PRIMARY KEY)")
+    resultado = migrar()
+    assert resultado.exit_code != 0 and 'não é um banco deste app' in resultado.output
@@ -0,0 +1,56 @@
+"""Snapshots de saldo (gravar_snapshots / saldos_em) nos dois backends."""
+from datetime import datetime, timedelta
+
+import app as appmod
+
+def _snapshots(cursor, user_id):
+    cursor.execute("SELECT conta_id, em FROM saldos_snapshot WHERE user_id = %s ORDER BY conta_id, em", (user_id,))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+def test_usuario_com_contas_e_sem_transacoes(cursor, usuario):
+    user_id, (a, b) = usuario
+    # Só os snapshots de abertura: nenhum período a fechar, sem varrer desde '-infinity'
+    assert appmod.gravar_snapshots(cursor, user_id) == 2
+    assert _snapshots(cursor, user_id) == [(a, datetime.min), (b, datetime.min)]
+    assert appmod.gravar_snapshots(cursor, user_id) == 0
+    saldos = appmod.saldos_em(cursor, user_id, datetime.now())
+    assert [(conta['id'], float(conta['saldo']), conta['snapshot_em']) for conta in saldos] == [(a, 1000, None), (b, 500, None)]
+
+def test_snapshots_periodicos_desde_a_primeira_transacao(cursor, usuario, monkeypatch):
+    monkeypatch.setattr(appmod, 'SALDOS_SNAPSHOT_INTERVALO', 'month')
+    user_id, (a, b) = usuario
+    meses = [datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)]  # do corrente para trás
+    for _ in range(3):
+        meses.append((meses[-1] - timedelta(days=1)).replace(day=1))
+    for mes in meses[3:1:-1]:
+        cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, data_criacao) VALUES (%s, %s, 'deposit', 100, 'd', %s)",
+                       (a, user_id, mes + timedelta(days=14)))
+    cursor.execute("UPDATE contas SET saldo = saldo + 200 WHERE id = %s", (a,))
+    # Abertura das duas contas mais um snapshot por início de mês, do mês seguinte à primeira transação até o corrente
+    assert appmod.gravar_snapshots(cursor, user_id) == 2 + 2 * 3
+    periodicos = [em for conta, em in _snapshots(cursor, user_id) if conta == a and em != datetime.min]
+    assert periodicos == meses[2::-1]
+    saldos = {conta['id']: float(conta['saldo']) for conta in appmod.saldos_em(cursor, user_id, meses[2])}
+    assert saldos == {a: 1100, b: 500}
+    assert appmod.gravar_snapshots(cursor, user_id) == 0
+
+def test_consultas_sem_ancora_iguais_as_ancoradas(cursor, usuario, monkeypatch):
+    monkeypatch.setattr(appmod, 'SALDOS_SNAPSHOT_INTERVALO', 'month')
+    user_id, (a, b) = usuario
+    hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for dias, conta, valor in ((70, a, 100), (40, b, -30), (10, a, 5)):
+        cursor.execute("INSERT INTO transacoes (conta_id, user_id, tipo, valor, descricao, data_criacao) VALUES (%s, %s, 'deposit', %s, 'd', %s)",
+                       (conta, user_id, valor, hoje - timedelta(days=dias)))
+        cursor.execute("UPDATE contas SET saldo = saldo + %s WHERE id = %s", (valor, conta))
+    instantes = [hoje - timedelta(days=dias) for dias in (90, 50, 20, 0)]
+
+    def consultar():
+        saldos = [[(c['id'], float(c['saldo']), float(c['saldo_freebets'])) for c in appmod.saldos_em(cursor, user_id, em)] for em in instantes]
+        curva = [(l['conta_id'], l['periodo'], float(l['saldo'])) for l in appmod.curva_saldos(cursor, user_id, instantes[0], hoje, 'week')]
+        return saldos, curva
+    # Sem snapshot algum: saldo atual menos o ledger a partir da data, sem gravar nada
+    sem_ancora = consultar()
+    assert _snapshots(cursor, user_id) == []
+    assert sem_ancora[0][0] == [(a, 1000, 0), (b, 500, 0)] and sem_ancora[0][-1] == [(a, 1105, 0), (b, 470, 0)]
+    appmod.gravar_snapshots(cursor, user_id)
+    assert consultar() == sem_ancora
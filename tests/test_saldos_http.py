@@ -0,0 +1,54 @@
+"""Rotas /api/saldos*, pelo cliente HTTP, nos dois backends."""
+import io
+from datetime import date
+
+import app as appmod
+
+def _importar(cliente, csv):
+    resposta = cliente.post('/api/import-csv', data={'csvFile': (io.BytesIO(csv.encode()), 'contas.csv')})
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+def _contas(cliente):
+    return {c['nome']: c for c in cliente.get('/api/saldos').get_json()['contas']}
+
+def _snapshots():
+    with appmod.app.app_context(), appmod.get_db().cursor() as cursor:
+        cursor.execute("SELECT conta_id, em, saldo FROM saldos_snapshot ORDER BY conta_id, em")
+        return [tuple(row) for row in cursor.fetchall()]
+
+def test_saldos_curva_e_conciliacao(cliente):
+    _importar(cliente, 'nome,casa_de_aposta,saldo\nA,bet365,100\nB,betano,50\n')
+    snapshots = _snapshots()
+    contas = _contas(cliente)
+    resposta = cliente.post('/api/transacoes/generico', json={'accountId': contas['A']['id'], 'type': 'deposit', 'amount': 25, 'description': 'd'})
+    assert resposta.status_code == 200
+    saldos = cliente.get('/api/saldos').get_json()
+    assert saldos['data'] == date.today().isoformat()
+    assert {c['nome']: float(c['saldo']) for c in saldos['contas']} == {'A': 125, 'B': 50} and float(saldos['total']) == 175
+    curva = cliente.get('/api/saldos/curva?intervalo=day&de=' + date.today().isoformat()).get_json()
+    assert [(p['periodo'], float(p['saldo'])) for p in curva['total']] == [(date.today().isoformat(), 175)]
+    assert cliente.get('/api/saldos/conciliacao').get_json() == {'divergencias': [], 'ok': True}
+    assert cliente.get('/api/saldos?data=xx').status_code == 400
+    # As consultas só leem: snapshots ficam para o saldos-snapshot, a manutenção dos jobs e as escritas
+    assert _snapshots() == snapshots
+
+def test_manutencao_dos_jobs_grava_snapshots(cliente):
+    _importar(cliente, 'nome,saldo\nA,100\n')
+    with appmod.app.app_context(), appmod.get_db() as db, db.cursor() as cursor:
+        cursor.execute("DELETE FROM saldos_snapshot")
+    appmod.JobRunner(0)._manutencao()
+    assert len(_snapshots()) == 1
+
+def test_importacao_reancora_as_contas(cliente):
+    _importar(cliente, 'nome,saldo\nA,100\nB,10\n')
+    contas = _contas(cliente)
+    cliente.post('/api/transacoes/generico', json={'accountId': contas['A']['id'], 'type': 'deposit', 'amount': 25, 'description': 'd'})
+    appmod.JobRunner(0)._manutencao()  # contas ancoradas antes da nova importação
+    assert len(_snapshots()) == 2 and cliente.get('/api/saldos/conciliacao').get_json()['ok']
+    # Saldo e freebets sobrescritos pelo CSV, fora do ledger
+    _importar(cliente, 'nome,saldo,saldo_freebets\nA,300,7\n')
+    assert cliente.get('/api/saldos/conciliacao').get_json() == {'divergencias': [], 'ok': True}
+    assert {nome: (float(c['saldo']), float(c['saldo_freebets'])) for nome, c in _contas(cliente).items()} == {'A': (300, 7), 'B': (10, 0)}
+    appmod.JobRunner(0)._manutencao()
+    assert cliente.get('/api/saldos/conciliacao').get_json()['ok']
@@ -0,0 +1,32 @@
+"""Cache do usuário logado no arquivo SQLite compartilhado (SqliteUserCache)."""
+import app as appmod
+
+def _acesso(cache, user_id):
+    return cache._conn().execute("SELECT acesso FROM usuarios_cache WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def test_hit_so_regrava_acesso_antigo(tmp_path, monkeypatch):
+    relogio = [1000.0]
+    monkeypatch.setattr(appmod.time, 'time', lambda: relogio[0])
+    cache = appmod.SqliteUserCache(str(tmp_path / 'cache.sqlite3'), 100, 10)
+    cache.set(1, 'a@example.com')
+    relogio[0] += 5  # dentro de TOQUE_FRACAO do TTL: hit sem escrita
+    assert cache.get(1) == 'a@example.com'
+    assert _acesso(cache, 1) == 1000.0
+    relogio[0] += 10
+    assert cache.get(1) == 'a@example.com'
+    assert _acesso(cache, 1) == 1015.0
+    relogio[0] += 100  # expirado
+    assert cache.get(1) is None
+    assert cache.stats()['hits'] == 2 and cache.stats()['errors'] == 0
+
+def test_descarte_lru_pelo_acesso(tmp_path, monkeypatch):
+    relogio = [1000.0]
+    monkeypatch.setattr(appmod.time, 'time', lambda: relogio[0])
+    cache = appmod.SqliteUserCache(str(tmp_path / 'cache.sqlite3'), 100, 2)
+    cache.set(1, 'a@example.com')
+    relogio[0] += 20
+    cache.set(2, 'b@example.com')
+    relogio[0] += 20
+    assert cache.get(1) == 'a@example.com'  # 1 passa a ser o mais recente
+    cache.set(3, 'c@example.com')
+    assert (cache.get(1), cache.get(2), cache.get(3)) == ('a@example.com', None, 'c@example.com')